@@ -0,0 +1,194 @@
+"""Approximate candidate retrieval over reduced tutor feature vectors
+
+Scoring a request exactly touches every tutor the postings of
+candidateIndex return, and with a few common addresses and subjects that
+is a large share of a big catalogue. With RECOMMENDATION_ANN=1 the index
+also keeps:
+
+- a vector per tutor whose inner product with a user's vector
+  approximates the tutor's combined score: address tokens weighted 0.30
+  and scaled by the square root of their count (a cosine standing in for
+  the Jaccard score), subject names weighted 0.20, then a truncated SVD
+  projection to RECOMMENDATION_ANN_DIMENSIONS dimensions, plus the tutor's
+  own rating, popularity, experience and availability score as one more
+  dimension that every user weighs 1
+- an inverted file (IVF): k-means centroids of those vectors and the
+  tutors closest to each centroid
+
+A request builds the user's vector, scans the tutors of the
+RECOMMENDATION_ANN_PROBES most promising lists (centroid address and
+subject match plus the best own score in the list) and keeps the
+RECOMMENDATION_ANN_CANDIDATES best tutors by approximate score. Only those
+are re-ranked with the exact combined score, so the top-k can miss tutors
+the exact path returns; benchmarks/annBenchmark.py reports recall@k
+against it for a range of settings, and RECOMMENDATION_ANN_RECALL_SAMPLE
+has that share of requests also ranked exactly to report recall on
+/metrics. In geo mode located pairs are scored on distance, which the
+address tokens only approximate.
+
+The TF-IDF similarity does not enter the combined score, so the TF-IDF
+rows are not what is reduced; the similarity column is still computed for
+the re-ranked tutors. Rebuilds that keep the address and subject
+vocabularies reuse the projection and centroids and only reassign tutors.
+"""
+import logging
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import TruncatedSVD
+
+from candidateIndex import combined_scores
+from pipelineMetrics import timed
+from recommendationEngine import normalize_location
+
+logger = logging.getLogger(__name__)
+
+ANN_RETRIEVAL = os.environ.get("RECOMMENDATION_ANN", "0") == "1"
+DIMENSIONS = int(os.environ.get("RECOMMENDATION_ANN_DIMENSIONS", 64))
+# Inverted lists; 0 picks about the square root of the catalogue size
+LISTS = int(os.environ.get("RECOMMENDATION_ANN_LISTS", 0))
+PROBES = int(os.environ.get("RECOMMENDATION_ANN_PROBES", 32))
+CANDIDATES = int(os.environ.get("RECOMMENDATION_ANN_CANDIDATES", 1000))
+# Share of approximate requests also ranked exactly to measure recall
+RECALL_SAMPLE = float(os.environ.get("RECOMMENDATION_ANN_RECALL_SAMPLE", 0))
+
+KMEANS_ITERATIONS = 10
+# Rows the centroids are trained on, per list
+TRAINING_ROWS_PER_LIST = 64
+# Rows assigned to lists at a time, bounding the distance matrix
+ASSIGN_CHUNK = 65536
+
+
+class ApproximateIndex:
+    """Reduced tutor vectors and their inverted lists for one index snapshot"""
+
+    def __init__(self, encoded, previous=None, dimensions=DIMENSIONS,
+                 lists=LISTS, seed=0):
+        """Build for the tutors; ``previous`` lends its projection and centroids
+
+        They are only reused when ``previous`` was built with the same
+        address and subject vocabularies.
+        """
+        self.location_vocab = encoded.location_vocab
+        self.subject_vocab = encoded.subject_vocab
+        if previous is not None and (
+                previous.location_vocab != self.location_vocab or
+                previous.subject_vocab != self.subject_vocab):
+            previous = None
+
+        sizes = np.sqrt(np.maximum(encoded.location_sizes, 1))
+        features = sp.hstack([
+            sp.diags(0.30 / sizes) @ encoded.location_matrix,
+            encoded.subject_matrix * 0.20]).tocsr()
+        # Each tutor's rating, popularity, experience and availability part
+        # of the combined score, missing scores last
+        static = combined_scores(encoded, np.arange(len(encoded)), 0.0, 0.0)
+        static = np.where(np.isnan(static), -1.0, static)
+
+        with timed("ann_build"):
+            if previous is not None:
+                self.components = previous.components
+                self.vectors = self.project(features, static)
+                self.centroids = previous.centroids
+            else:
+                # Fewer components than features, as TruncatedSVD requires
+                n_tutors, n_features = features.shape
+                svd = TruncatedSVD(
+                    max(1, min(dimensions, n_features - 1, n_tutors - 1)),
+                    random_state=seed)
+                svd.fit(features)
+                self.components = svd.components_.astype(np.float32)
+                self.vectors = self.project(features, static)
+                self.centroids = train_centroids(
+                    self.vectors, lists or int(np.sqrt(n_tutors)) or 1, seed)
+            self.order, self.offsets = self.assign(self.vectors)
+
+        # Best own score in each list; a list is as promising as its
+        # centroid's address and subject match plus its best tutor
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        self.list_static = np.full(len(self.centroids), -1.0, dtype=np.float32)
+        np.maximum.at(self.list_static, lists, self.vectors[self.order, -1])
+
+    def project(self, features, static):
+        """Reduced vectors of feature rows, with ``static`` appended"""
+        vectors = np.asarray(features @ self.components.T, dtype=np.float32)
+        return np.hstack([vectors, np.asarray(static, dtype=np.float32)[:, None]])
+
+    def assign(self, vectors):
+        """Tutor rows grouped by nearest centroid, and each group's offset"""
+        nearest = np.empty(len(vectors), dtype=np.int32)
+        squared = (self.centroids ** 2).sum(axis=1)
+        for start in range(0, len(vectors), ASSIGN_CHUNK):
+            block = vectors[start:start + ASSIGN_CHUNK]
+            nearest[start:start + len(block)] = np.argmin(
+                squared - 2 * block @ self.centroids.T, axis=1)
+        order = np.argsort(nearest, kind="stable")
+        offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(nearest, minlength=len(self.centroids)),
+                  out=offsets[1:])
+        return order, offsets
+
+    def query(self, user):
+        """Reduced vector of a user
+
+        Its inner product with a tutor's vector approximates the tutor's
+        combined score for the user.
+        """
+        location = np.zeros(len(self.location_vocab))
+        tokens = set(normalize_location(user.get("address", "")).split())
+        for token in tokens:
+            if token in self.location_vocab:
+                location[self.location_vocab[token]] = 1 / np.sqrt(len(tokens))
+
+        # Exact subject names count 1 and names containing the subject 0.5,
+        # as in subject_match_matrix; without preferred subjects every
+        # tutor gets the same neutral score
+        subjects = np.zeros(len(self.subject_vocab))
+        preferred = [s.lower() for s in user.get("preferredSubjects") or []]
+        for subject in preferred:
+            for name, column in self.subject_vocab.items():
+                if subject == name:
+                    subjects[column] += 1 / len(preferred)
+                elif subject in name:
+                    subjects[column] += 0.5 / len(preferred)
+
+        features = np.concatenate([location * 0.30, subjects * 0.20])
+        return np.append(self.components @ features, 1).astype(np.float32)
+
+    def search(self, user, probes=PROBES, candidates=CANDIDATES):
+        """Rows of the ``candidates`` most promising tutors for a user
+
+        Scans the tutors in the ``probes`` most promising lists and keeps
+        those with the best approximate scores.
+        """
+        query = self.query(user)
+        probes = min(probes, len(self.centroids))
+        promise = self.centroids[:, :-1] @ query[:-1] + self.list_static
+        nearest = np.argpartition(-promise, probes - 1)[:probes]
+        rows = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]]
+                               for i in nearest])
+        if len(rows) <= candidates:
+            return rows
+        scores = self.vectors[rows] @ query
+        return rows[np.argpartition(-scores, candidates - 1)[:candidates]]
+
+
+def train_centroids(vectors, lists, seed=0):
+    """Centroids of k-means on a sample of ``vectors``"""
+    rng = np.random.default_rng(seed)
+    lists = min(lists, len(vectors))
+    sample = vectors[rng.choice(len(vectors), min(len(vectors),
+                                                  lists * TRAINING_ROWS_PER_LIST),
+                                replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        nearest = np.argmin((centroids ** 2).sum(axis=1) - 2 * sample @ centroids.T,
+                            axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, sample)
+        counts = np.bincount(nearest, minlength=lists)
+        # Empty lists keep their centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
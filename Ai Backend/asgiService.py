@@ -0,0 +1,363 @@
+"""Async variant of /recommend for high-concurrency serving
+
+An ASGI app (no web framework needed) that reads and parses requests on
+the event loop and runs the CPU-bound scoring in a bounded process pool,
+so scoring is not serialized by the GIL. When every pool slot and queue
+slot is taken, new requests get the fallback ranking straight away (see
+fallbackRanking), or 503 and a Retry-After header before it is built,
+instead of piling up behind the others. With RECOMMENDATION_LATENCY_BUDGET_MS
+a request whose scores take longer gets the fallback ranking too; its
+scoring still holds a slot until it finishes.
+
+    python asgiService.py --workers 4 --max-queue 16 --port 5002
+
+Requires uvicorn. Each pool process loads its own copy of the tutor index
+from TUTOR_INDEX_PATH and runs a synthetic warm-up request (see fastStart);
+GET /ready answers 503 until every process has done so. Cursor pagination
+and the response cache of the Flask service are not available here, since
+scored frames stay inside the pool processes.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tutorIndex import TutorIndex
+from recommendationPipeline import (
+    recommend_from_payload,
+    recommend_from_index,
+    filter_recommendations,
+    parse_top_k,
+)
+from requestLogging import configure_logging, request_log
+from requestFormats import is_binary_format, decode_request, UnsupportedFormat
+from pipelineMetrics import (
+    metrics,
+    timed,
+    timing_header,
+    gauge_lines,
+    memory_gauge_lines,
+)
+from responseJson import dumps
+from fastStart import WARMUP, warm_up
+from fallbackRanking import FallbackRanking, FALLBACK_REFRESH, LATENCY_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Send per-stage timings in an X-Timing header on every response; clients
+# can also ask for it on a single request by sending an X-Timing header
+TIMING_HEADER = os.environ.get("RECOMMENDATION_TIMING_HEADER", "0") == "1"
+
+# Tutor index of a pool process, loaded by init_worker
+worker_index = TutorIndex(os.environ.get("RECOMMENDATION_TFIDF_PATH"),
+                          os.environ.get("RECOMMENDATION_FEATURE_STORE"))
+
+
+def init_worker(index_path):
+    """Load the tutor index in a freshly started pool process"""
+    # Stage timings travel back with each result and are recorded by the
+    # event loop process, which serves /metrics
+    metrics.enabled = False
+    if index_path:
+        worker_index.load_file(index_path)
+
+
+def warm_worker():
+    """Start a pool process and run the warm-up request in it"""
+    if WARMUP:
+        warm_up(worker_index)
+
+
+def build_fallback():
+    """Fallback ranking of a pool process's index, None while it is empty"""
+    snapshot = worker_index.snapshot()
+    return None if snapshot.tutors.empty else FallbackRanking(snapshot)
+
+
+def score_request(user, tutors_data, k, sampled=False):
+    """Run the recommendation pipeline for one request inside the pool
+
+    Returns the recommendations and the summary fields collected on the
+    way, which the event loop adds to its own request log.
+    """
+    with request_log("/recommend", sampled=sampled) as log:
+        if tutors_data is None:
+            recommendations, _, _ = recommend_from_index(user, worker_index, k)
+        else:
+            recommendations, _, _ = recommend_from_payload(user, tutors_data, k)
+        with timed("filter"):
+            recommendations = filter_recommendations(recommendations)
+    return recommendations, log.fields, log.timings
+
+
+class AsyncRecommendationApp:
+    """ASGI app serving POST /recommend through a bounded process pool"""
+
+    def __init__(self, workers=None, max_queue=None, retry_after=1,
+                 index_path=None):
+        self.workers = workers or os.cpu_count()
+        # Requests allowed to wait for a free process on top of the running ones
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.retry_after = retry_after
+        self.index_path = index_path
+        self.in_flight = 0
+        self.rejected = 0
+        self.executor = None
+        self.warming = []
+        # Built in the pool, whose processes hold the index
+        self.fallback = None
+        self.fallback_building = None
+        self.fallback_started = 0
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=init_worker,
+                initargs=(self.index_path,))
+            # Start and warm every process now so the first requests do not
+            # pay for it
+            self.warming = [self.executor.submit(warm_worker)
+                            for _ in range(self.workers)]
+            self.refresh_fallback()
+            logger.info("Started %d scoring processes, queue limit %d",
+                        self.workers, self.max_queue)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.warming = []
+            self.fallback_building = None
+            self.fallback_started = 0
+
+    def refresh_fallback(self):
+        """Rebuild the fallback ranking in the pool every FALLBACK_REFRESH seconds"""
+        if (self.executor is None or self.fallback_building is not None or
+                time.time() - self.fallback_started <= FALLBACK_REFRESH):
+            return
+        self.fallback_started = time.time()
+        self.fallback_building = self.executor.submit(build_fallback)
+        self.fallback_building.add_done_callback(self.fallback_built)
+
+    def fallback_built(self, future):
+        self.fallback_building = None
+        if not future.cancelled() and future.exception() is None:
+            self.fallback = future.result() or self.fallback
+        elif not future.cancelled():
+            logger.error("Building the fallback ranking failed: %s", future.exception())
+
+    @property
+    def ready(self):
+        return self.executor is not None and all(
+            future.done() for future in self.warming)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        start = time.perf_counter()
+        method, path = scope["method"], scope["path"].rstrip("/")
+        headers = []
+        if (method, path) == ("POST", "/recommend"):
+            request_headers = dict(scope["headers"])
+            content_type = request_headers.get(b"content-type", b"").decode()
+            status, body, headers = await self.recommend(
+                receive, content_type.split(";")[0].strip(),
+                b"x-timing" in request_headers)
+        elif (method, path) == ("GET", "/health"):
+            status, body = 200, self.health()
+        elif (method, path) == ("GET", "/ready"):
+            status, body = (200 if self.ready else 503), self.health()
+        elif (method, path) == ("GET", "/metrics"):
+            status, body = 200, None
+        else:
+            status, body, path = 404, {"error": "Not found"}, "unmatched"
+        metrics.observe_request(path, str(status), time.perf_counter() - start)
+
+        if body is None:
+            await send_text(send, status, self.render_metrics())
+        else:
+            await send_json(send, status, body, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def recommend(self, receive, content_type="application/json",
+                        timing=False):
+        """Shed load when saturated, otherwise score in the pool"""
+        overloaded = self.in_flight >= self.capacity
+        if overloaded and self.fallback is None:
+            self.rejected += 1
+            return (503, {"error": "Recommendation service is busy"},
+                    [(b"retry-after", str(self.retry_after).encode())])
+
+        self.in_flight += 1
+        # Scoring that overran the budget releases its slot when it finishes
+        release = True
+        try:
+            with request_log("/recommend", logger) as log:
+                log.set(inFlight=self.in_flight)
+                try:
+                    with timed("parse"):
+                        body = await read_body(receive)
+                        if is_binary_format(content_type):
+                            data = decode_request(content_type, body)
+                        else:
+                            data = json.loads(body)
+                    user = data["user"]
+                except UnsupportedFormat as e:
+                    log.set(error=str(e))
+                    return 415, {"error": str(e)}, []
+                except (ValueError, KeyError, TypeError):
+                    log.set(error="bad request")
+                    return 400, {"error": "Expected a JSON body with a user"}, []
+
+                self.start()
+                self.refresh_fallback()
+                loop = asyncio.get_running_loop()
+                k = parse_top_k(data.get("k"))
+                tutors_data = data.get("tutors")
+                log.set(userId=user.get("id"), k=k)
+                headers = []
+                if overloaded:
+                    recommendations = self.degraded(user, k, "overload", log, headers)
+                    return 200, recommendations, headers
+
+                scoring = loop.run_in_executor(
+                    self.executor, score_request, user, tutors_data, k, log.sampled)
+                try:
+                    if LATENCY_BUDGET > 0 and tutors_data is None:
+                        scored = await asyncio.wait_for(asyncio.shield(scoring),
+                                                        LATENCY_BUDGET)
+                    else:
+                        scored = await scoring
+                    recommendations, fields, timings = scored
+                    log.set(**fields)
+                    log.timings.update(timings)
+                    metrics.observe_timings(timings)
+                    metrics.count_scored("/recommend", fields.get("tutors", 0))
+                except asyncio.TimeoutError:
+                    release = False
+                    scoring.add_done_callback(self.late_scoring_done)
+                    recommendations = self.degraded(user, k, "budget", log, headers)
+                except Exception as e:
+                    logger.error("Error in async recommendation service: %s", e)
+                    log.set(error=str(e))
+                    metrics.count_error("/recommend")
+                    # Index requests get the fallback ranking, payload
+                    # requests an empty list, like the Flask service
+                    recommendations = self.degraded(
+                        user if tutors_data is None else None, k, "error", log,
+                        headers)
+
+                if timing or TIMING_HEADER:
+                    headers.append((b"x-timing", timing_header(
+                        log.timings, log.elapsed_ms()).encode()))
+                return 200, recommendations, headers
+        finally:
+            if release:
+                self.in_flight -= 1
+
+    def late_scoring_done(self, future):
+        self.in_flight -= 1
+        if not future.cancelled():
+            future.exception()
+
+    def degraded(self, user, k, reason, log, headers):
+        """Fallback ranking page for ``user``, marked with an x-degraded header"""
+        ranking = self.fallback if isinstance(user, dict) else None
+        recommendations = ranking.page(user, k) if ranking is not None else []
+        log.set(degraded=reason, returned=len(recommendations))
+        metrics.count_degraded("/recommend", reason)
+        headers.append((b"x-degraded", reason.encode()))
+        return recommendations
+
+    def health(self):
+        return {"ready": self.ready, "inFlight": self.in_flight, "capacity": self.capacity,
+                "workers": self.workers, "rejected": self.rejected,
+                "fallback": self.fallback is not None}
+
+    def render_metrics(self):
+        return metrics.render(
+            gauge_lines("recommendation_in_flight",
+                        "Requests being scored or waiting for the pool",
+                        self.in_flight) +
+            gauge_lines("recommendation_rejected",
+                        "Requests shed with 503 since start", self.rejected) +
+            memory_gauge_lines())
+
+
+async def read_body(receive):
+    """Collect the full request body from ASGI messages"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, body, headers=()):
+    await send_body(send, status, dumps(body), b"application/json", headers)
+
+
+async def send_text(send, status, text):
+    await send_body(send, status, text.encode(),
+                    b"text/plain; version=0.0.4; charset=utf-8")
+
+
+async def send_body(send, status, payload, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type),
+                    (b"content-length", str(len(payload)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+app = AsyncRecommendationApp(
+    workers=int(os.environ.get("ASYNC_WORKERS", 0)) or None,
+    max_queue=(int(os.environ["ASYNC_MAX_QUEUE"])
+               if os.environ.get("ASYNC_MAX_QUEUE") else None),
+    retry_after=int(os.environ.get("ASYNC_RETRY_AFTER", 1)),
+    index_path=os.environ.get("TUTOR_INDEX_PATH"),
+)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--workers", type=int, default=app.workers)
+    parser.add_argument("--max-queue", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn is required for asgiService.py: pip install uvicorn")
+
+    configure_logging()
+    app.workers = args.workers
+    app.max_queue = (args.workers * 4 if args.max_queue is None
+                     else args.max_queue)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
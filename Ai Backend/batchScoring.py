@@ -0,0 +1,74 @@
+import logging
+
+import numpy as np
+
+from recommendationEngine import (
+    create_user_vector,
+    normalized_similarity,
+    prepare_recommendations_for_response,
+    location_score_matrix,
+    subject_match_matrix,
+    select_top_k,
+    DEFAULT_TOP_K,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of users scored per matrix pass, bounds the N x T working set
+DEFAULT_BATCH_SIZE = 256
+
+
+def score_users(users, snapshot):
+    """Compute every component score for a block of users as N x T matrices"""
+    encoded = snapshot.encoded
+
+    user_vectors = [create_user_vector(user) for user in users]
+    user_tfidf = snapshot.vectorizer.transform(user_vectors)
+    similarities = normalized_similarity(user_tfidf, snapshot.tfidf_matrix)
+
+    location = np.clip(location_score_matrix(users, encoded), 0, 1)
+    subject = np.clip(subject_match_matrix(users, encoded), 0, 1)
+
+    # Same weights and summation order as compute_recommendations
+    combined = (
+        location * 0.30 +
+        encoded.rating_score * 0.25 +
+        subject * 0.20 +
+        encoded.popularity_score * 0.10 +
+        encoded.experience_score * 0.05 +
+        encoded.availability_score * 0.10
+    )
+    return similarities, location, subject, combined
+
+
+def recommend_batch(users, snapshot, k=DEFAULT_TOP_K, batch_size=DEFAULT_BATCH_SIZE):
+    """Return the top-k recommendations for each user, in input order"""
+    tutors = snapshot.tutors
+    if tutors.empty or not users:
+        return [[] for _ in users]
+
+    encoded = snapshot.encoded
+    results = []
+    for start in range(0, len(users), batch_size):
+        block = users[start:start + batch_size]
+        similarities, location, subject, combined = score_users(
+            block, snapshot)
+
+        for row, user in enumerate(block):
+            top = select_top_k(combined[row], encoded.ids, k)
+
+            recommended = tutors.iloc[top].copy()
+            recommended["cosine_similarity"] = similarities[row, top]
+            recommended["location_score"] = location[row, top]
+            recommended["rating_score"] = encoded.rating_score[top]
+            recommended["subject_match_score"] = subject[row, top]
+            recommended["popularity_score"] = encoded.popularity_score[top]
+            recommended["experience_score"] = encoded.experience_score[top]
+            recommended["combined_score"] = combined[row, top]
+
+            results.append(
+                prepare_recommendations_for_response(recommended, user))
+
+    logger.debug("Scored %d users against %d tutors in batch",
+                 len(users), len(tutors))
+    return results
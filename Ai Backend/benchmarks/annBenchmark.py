@@ -0,0 +1,131 @@
+"""Measure recall@k and latency of approximate retrieval against the exact path
+
+Builds the tutor index for a synthetic catalogue with an ApproximateIndex
+(see approximateIndex), then for each --probes and --candidates setting
+reports, over synthetic users:
+
+- recall@k: the share of the exact top-k tutors (the ranking scoring the
+  whole catalogue gives) that the approximate search plus exact re-rank
+  returns
+- tutors scanned and re-ranked, and the median search plus re-rank time
+
+and the median time of a full /recommend index request on the exact
+pre-filtered path (RECOMMENDATION_PREFILTER) and on the approximate path
+with the service settings. Exits non-zero when no setting reaches
+--target-recall.
+
+Usage: python benchmarks/annBenchmark.py --tutors 200000 --probes 4 8 16
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from approximateIndex import ApproximateIndex  # noqa: E402
+from candidateIndex import combined_scores  # noqa: E402
+from recommendationEngine import (  # noqa: E402
+    create_user_vector,
+    location_score_matrix,
+    subject_match_matrix,
+    select_top_k,
+)
+from recommendationPipeline import CandidatePages, ApproximatePages  # noqa: E402
+from tutorIndex import TutorIndex  # noqa: E402
+
+
+def reranked(snapshot, user, rows, k):
+    """Rows of the exact top-k among ``rows``, ranked as a full pass ranks"""
+    encoded = snapshot.encoded.subset(rows)
+    scores = combined_scores(
+        snapshot.encoded, rows,
+        np.clip(location_score_matrix([user], encoded)[0], 0, 1),
+        np.clip(subject_match_matrix([user], encoded)[0], 0, 1))
+    return rows[select_top_k(scores, encoded.ids, k)]
+
+
+def median_ms(function, users):
+    latencies = []
+    for user in users:
+        start = time.perf_counter()
+        function(user)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=0)
+    parser.add_argument("--probes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[400, 1000, 2000])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    index = TutorIndex()
+    index.load(generate_tutors(args.tutors))
+    snapshot = index.snapshot()
+    start = time.perf_counter()
+    approximate = ApproximateIndex(snapshot.encoded, dimensions=args.dimensions,
+                                   lists=args.lists)
+    build = time.perf_counter() - start
+    snapshot.approximate = approximate
+    print(f"{args.tutors} tutors: {approximate.components.shape[0]} dimensions, "
+          f"{len(approximate.centroids)} lists, built in {build:.1f}s")
+
+    users = generate_users(args.users)
+    exact = [{str(snapshot.encoded.ids[row])
+              for row in snapshot.candidates.top_rows(user, args.k)[0]}
+             for user in users]
+
+    reached = []
+    for probes in args.probes:
+        for candidates in args.candidates:
+            recalls, scanned, latencies = [], [], []
+            for user, expected in zip(users, exact):
+                begin = time.perf_counter()
+                rows = approximate.search(user, probes, candidates)
+                top = reranked(snapshot, user, rows, args.k)
+                latencies.append((time.perf_counter() - begin) * 1000)
+                found = {str(snapshot.encoded.ids[row]) for row in top}
+                recalls.append(len(found & expected) / len(expected))
+                query = approximate.query(user)
+                lists = np.argsort(-(approximate.centroids[:, :-1] @ query[:-1] +
+                                     approximate.list_static))
+                scanned.append(sum(approximate.offsets[i + 1] - approximate.offsets[i]
+                                   for i in lists[:probes]))
+            recall = float(np.mean(recalls))
+            if recall >= args.target_recall:
+                reached.append((probes, candidates))
+            print(f"  probes {probes:3d} candidates {candidates:5d}: "
+                  f"recall@{args.k} {recall:.3f} (worst {min(recalls):.1f}), "
+                  f"scanned {np.mean(scanned):8.0f}, "
+                  f"search+rerank {np.median(latencies):6.2f}ms")
+
+    def request(pages):
+        return lambda user: pages(snapshot, user, create_user_vector(user)).page(args.k)
+
+    print(f"  /recommend exact pre-filtered {median_ms(request(CandidatePages), users):7.2f}ms, "
+          f"approximate (service settings) "
+          f"{median_ms(request(ApproximatePages), users):7.2f}ms")
+    if reached:
+        probes, candidates = min(reached)
+        print(f"  target recall@{args.k} {args.target_recall} first reached with "
+              f"RECOMMENDATION_ANN_PROBES={probes} "
+              f"RECOMMENDATION_ANN_CANDIDATES={candidates}")
+    else:
+        print(f"  no setting reached recall@{args.k} {args.target_recall}")
+    sys.exit(0 if reached else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Compare batch scoring throughput with the single-user /recommend path
+
+Usage: python benchmarks/batchBenchmark.py --tutors 2000 --users 200
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from tutorIndex import TutorIndex  # noqa: E402
+from batchScoring import recommend_batch  # noqa: E402
+from recommendationEngine import create_user_vector, compute_recommendations  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+    tutor_count, user_count = args.tutors, args.users
+    logging.disable(logging.CRITICAL)
+
+    index = TutorIndex()
+    index.load(generate_tutors(tutor_count))
+    snapshot = index.snapshot()
+    users = generate_users(user_count)
+
+    # Single-user path, one scoring call per user
+    start = time.perf_counter()
+    for user in users:
+        user_vector = create_user_vector(user)
+        compute_recommendations(user_vector, snapshot.tutors.copy(), user,
+                                snapshot.similarity(user_vector))
+    single_seconds = time.perf_counter() - start
+
+    # Batch path, all users in matrix passes
+    start = time.perf_counter()
+    recommend_batch(users, snapshot)
+    batch_seconds = time.perf_counter() - start
+
+    print(f"{tutor_count} tutors, {user_count} users")
+    print(f"single: {single_seconds:.3f}s ({user_count / single_seconds:.1f} users/s)")
+    print(f"batch:  {batch_seconds:.3f}s ({user_count / batch_seconds:.1f} users/s)")
+    print(f"speedup: {single_seconds / batch_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
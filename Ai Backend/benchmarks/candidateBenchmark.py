@@ -0,0 +1,102 @@
+"""Compare pre-filtered and exhaustive index scoring and check they agree
+
+For each catalogue size, every synthetic user is ranked twice against the
+same tutor index: once scoring only the candidates from the inverted
+indexes (plus the rating/availability fallback) and once scoring every
+tutor. The two must return identical pages, including later cursor pages;
+any difference is reported and makes the script exit non-zero. It also
+prints the median latency of both and the share of tutors that were
+candidates.
+
+    python benchmarks/candidateBenchmark.py --sizes 1000 10000 100000
+"""
+import argparse
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVICE_DIR)
+
+import recommendationPipeline  # noqa: E402
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from tutorIndex import TutorIndex  # noqa: E402
+from recommendationPipeline import recommend_from_index  # noqa: E402
+from recommendationEngine import recommendations_page, DEFAULT_TOP_K  # noqa: E402
+
+
+def comparable(recommendations):
+    """Response dicts with NaN replaced, so equal pages compare equal"""
+    return [{key: None if isinstance(value, float) and math.isnan(value) else value
+             for key, value in rec.items()} for rec in recommendations]
+
+
+def ranked_pages(user, index, k, pages, prefilter):
+    """The first ``pages`` pages of recommendations and the time of the first"""
+    recommendationPipeline.PREFILTER = prefilter
+    start = time.perf_counter()
+    first, scored, ids = recommend_from_index(user, index, k)
+    seconds = time.perf_counter() - start
+
+    results = [comparable(first)]
+    for page in range(1, pages):
+        if prefilter:
+            recommendations = scored.page(k, page * k)
+        else:
+            recommendations = recommendations_page(
+                scored, "combined_score", user, k, page * k, ids)
+        results.append(comparable(recommendations))
+    scored_tutors = scored.scored_count if prefilter else len(scored)
+    return results, seconds, scored_tutors
+
+
+def benchmark_size(size, users, args):
+    index = TutorIndex()
+    index.load(generate_tutors(size, seed=args.seed))
+
+    times = {"exhaustive": [], "prefilter": []}
+    candidates = []
+    mismatches = []
+    for user in users:
+        expected, seconds, _ = ranked_pages(user, index, args.k, args.pages, False)
+        times["exhaustive"].append(seconds)
+        actual, seconds, scored_tutors = ranked_pages(
+            user, index, args.k, args.pages, True)
+        times["prefilter"].append(seconds)
+        candidates.append(scored_tutors)
+        if actual != expected:
+            mismatches.append(user["id"])
+
+    exhaustive = statistics.median(times["exhaustive"]) * 1000
+    prefilter = statistics.median(times["prefilter"]) * 1000
+    print(f"{size:>8} tutors  exhaustive {exhaustive:8.1f}ms  "
+          f"prefilter {prefilter:8.1f}ms  ({exhaustive / prefilter:4.1f}x)  "
+          f"candidates {statistics.median(candidates) / size:6.1%}  "
+          f"mismatches {len(mismatches)}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--pages", type=int, default=3,
+                        help="pages compared per user, first one timed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    users = generate_users(args.users, seed=args.seed + 1)
+    failed = False
+    for size in args.sizes:
+        failed = bool(benchmark_size(size, users, args)) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
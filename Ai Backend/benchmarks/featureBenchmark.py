@@ -0,0 +1,81 @@
+"""Compare string-based and columnar feature building for the TF-IDF step
+
+Usage: python benchmarks/featureBenchmark.py --sizes 1000 10000 50000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from recommendationEngine import (  # noqa: E402
+    preprocess_tutor_data,
+    create_feature_vectors,
+    create_user_vector,
+    EncodedTutors,
+    FeatureVectorizer,
+)
+
+
+def string_similarities(tutors, user, user_vector, encoded):
+    """Feature strings joined per tutor and re-tokenized by TfidfVectorizer"""
+    features = create_feature_vectors(tutors, user, encoded)
+    tfidf_matrix = TfidfVectorizer(ngram_range=(1, 2), min_df=1).fit_transform(
+        [user_vector] + features)
+    return cosine_similarity(tfidf_matrix[0], tfidf_matrix[1:])[0]
+
+
+def columnar_similarities(tutors, user, user_vector, encoded):
+    """Term counts emitted directly from the tutor columns"""
+    tfidf_matrix = FeatureVectorizer().fit_transform(
+        tutors, user, encoded, user_vector)
+    return cosine_similarity(tfidf_matrix[0], tfidf_matrix[1:])[0]
+
+
+def measure(function, *args):
+    """Run a function once, returning its result, seconds and peak MiB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="catalogue sizes, in tutors")
+    sizes = parser.parse_args().sizes
+    logging.disable(logging.CRITICAL)
+    user = generate_users(1)[0]
+    user_vector = create_user_vector(user)
+
+    for size in sizes:
+        tutors = preprocess_tutor_data(pd.DataFrame(generate_tutors(size)))
+
+        # The token encoding is shared by both paths in the service
+        encoded = EncodedTutors(tutors)
+
+        expected, string_seconds, string_peak = measure(
+            string_similarities, tutors, user, user_vector, encoded)
+        actual, columnar_seconds, columnar_peak = measure(
+            columnar_similarities, tutors, user, user_vector, encoded)
+
+        print(f"{size} tutors: strings {string_seconds * 1000:.0f}ms/{string_peak:.1f}MiB, "
+              f"columnar {columnar_seconds * 1000:.0f}ms/{columnar_peak:.1f}MiB, "
+              f"max cosine diff {np.abs(expected - actual).max():.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Load test serve.py (or asgiService.py) at several worker counts
+
+Starts the server with a synthetic tutor index for each worker count,
+sends /recommend requests from concurrent clients for a fixed time and
+reports p50/p99 latency, requests per second, shed (503) requests and
+requests answered from the fallback ranking (X-Degraded). Several
+--budget-ms values repeat the runs with RECOMMENDATION_LATENCY_BUDGET_MS
+set to each (0 is no budget).
+
+Usage: python benchmarks/loadTest.py --workers 1 2 4 --tutors 5000
+       python benchmarks/loadTest.py --server asgi --clients 50 200
+       python benchmarks/loadTest.py --workers 2 --clients 32 --budget-ms 0 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+def post(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read(), response.headers
+
+
+def wait_until_ready(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def run_clients(url, users, clients, duration):
+    """Send requests from ``clients`` threads
+
+    Returns the latencies of successful requests, the number of requests
+    rejected with 503, the number answered from the fallback ranking and
+    the other errors.
+    """
+    latencies = []
+    rejected = []
+    degraded = []
+    errors = []
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        i = offset
+        while time.perf_counter() < stop_at:
+            user = users[i % len(users)]
+            i += clients
+            start = time.perf_counter()
+            try:
+                _, headers = post(url, {"user": user})
+                latencies.append(time.perf_counter() - start)
+                if headers.get("X-Degraded"):
+                    degraded.append(headers["X-Degraded"])
+            except urllib.error.HTTPError as e:
+                if e.code == 503:
+                    rejected.append(e.headers.get("Retry-After"))
+                    # Honour the back-off the server asked for
+                    time.sleep(float(e.headers.get("Retry-After") or 1))
+                else:
+                    errors.append(str(e))
+            except Exception as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=client, args=(i,))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(rejected), len(degraded), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--tutors", type=int, default=5000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[16])
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=5101)
+    parser.add_argument("--budget-ms", type=float, nargs="+", default=[0])
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(generate_tutors(args.tutors), f)
+        catalogue_path = f.name
+    users = generate_users(2000)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    env = dict(os.environ, TUTOR_INDEX_PATH=catalogue_path,
+               # Measure scoring, not response cache hits
+               RECOMMENDATION_CACHE_SIZE="0")
+    if args.server == "asgi":
+        command = [sys.executable, "asgiService.py"]
+        ready_path = "/ready"
+    else:
+        command = [sys.executable, "serve.py", "--threads", str(args.threads)]
+        ready_path = "/tutors"
+
+    try:
+        for workers in args.workers:
+            for budget in args.budget_ms:
+                server = subprocess.Popen(
+                    command + ["--port", str(args.port), "--workers", str(workers)],
+                    cwd=SERVICE_DIR,
+                    env=dict(env, RECOMMENDATION_LATENCY_BUDGET_MS=str(budget)),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    wait_until_ready(f"{base_url}{ready_path}")
+                    for clients in args.clients:
+                        report(workers, clients, budget, args, run_clients(
+                            f"{base_url}/recommend", users, clients, args.duration))
+                finally:
+                    server.terminate()
+                    server.wait()
+    finally:
+        os.unlink(catalogue_path)
+
+
+def report(workers, clients, budget, args, results):
+    latencies, rejected, degraded, errors = results
+    label = f"{args.server} workers={workers} clients={clients}"
+    if budget:
+        label += f" budget={budget:g}ms"
+    if not latencies:
+        print(f"{label}: no successful requests "
+              f"({rejected} shed, {len(errors)} errors, e.g. {errors[:1]})")
+        return
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{label}: {len(latencies) / args.duration:.1f} req/s, "
+          f"p50 {np.percentile(latencies_ms, 50):.0f}ms, "
+          f"p99 {np.percentile(latencies_ms, 99):.0f}ms, "
+          f"shed {rejected}, degraded {degraded}, errors {len(errors)}")
+
+
+if __name__ == '__main__':
+    main()
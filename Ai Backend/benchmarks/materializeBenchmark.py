@@ -0,0 +1,153 @@
+"""Measure materialized recommendation reads and change-driven refresh
+
+Registers synthetic students with a MaterializedRecommendations store (see
+materializedRecommendations) over a synthetic tutor index, then:
+
+- compares reading a stored page with scoring the student on the index
+- applies profile edits, tutor upserts, tutor deletes and a refit, and for
+  each reports how many students were marked for a refresh and how long
+  the refresh thread took to apply the change to all of them
+- checks after every change that each stored page equals what
+  /recommend computes on the index now
+
+Exits non-zero if any stored page differs.
+
+Usage: python benchmarks/materializeBenchmark.py --tutors 5000 --students 500
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users, ADDRESSES  # noqa: E402
+from materializedRecommendations import MaterializedRecommendations  # noqa: E402
+from recommendationCache import json_default  # noqa: E402
+from recommendationPipeline import (  # noqa: E402
+    recommend_from_index,
+    filter_recommendations,
+)
+from tutorIndex import TutorIndex  # noqa: E402
+
+
+def fresh_body(user, index, k):
+    """The page /recommend returns for ``user``, as stored"""
+    recommendations, _, _ = recommend_from_index(user, index, k)
+    return json.dumps(filter_recommendations(recommendations), default=json_default)
+
+
+def refreshed_within(store, timeout=600):
+    """Wait until no student waits for a refresh"""
+    start = time.perf_counter()
+    while store.stats()["pending"]:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError(f"refresh did not finish within {timeout}s")
+        time.sleep(0.005)
+
+
+def mismatches(store, index, users, k):
+    return sum(store.get(user["id"])["body"] != fresh_body(user, index, k)
+               for user in users)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=5000)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--changes", type=int, default=5,
+                        help="profiles edited, tutors upserted and deleted per step")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(2)
+
+    tutors = generate_tutors(args.tutors)
+    index = TutorIndex()
+    index.load(tutors)
+    users = {user["id"]: user for user in generate_users(args.students)}
+    path = os.path.join(tempfile.mkdtemp(), "materialized.sqlite")
+    store = MaterializedRecommendations(path, index, args.k)
+
+    start = time.perf_counter()
+    store.put_profiles(list(users.values()))
+    store.start()
+    refreshed_within(store)
+    initial = time.perf_counter() - start
+    print(f"{args.tutors} tutors, {args.students} students: "
+          f"initial materialization {initial:.1f}s")
+
+    # Read latency: stored page against scoring on the index
+    sample = rng.sample(list(users.values()), min(args.reads, len(users)))
+    for name, read in (("materialized", lambda user: store.get(user["id"])["body"]),
+                       ("index pipeline", lambda user: fresh_body(user, index, args.k))):
+        latencies = []
+        for user in sample:
+            begin = time.perf_counter()
+            read(user)
+            latencies.append((time.perf_counter() - begin) * 1000)
+        print(f"  read {name:<15} median {np.median(latencies):7.3f}ms  "
+              f"p99 {np.percentile(latencies, 99):7.3f}ms")
+
+    def on_pages():
+        """Tutor ids found on stored pages, most frequent first"""
+        counts = {}
+        for user_id in users:
+            for rec in json.loads(store.get(user_id)["body"]):
+                counts[rec["id"]] = counts.get(rec["id"], 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)
+
+    def edit_profiles():
+        edited = []
+        for user_id in rng.sample(list(users), args.changes):
+            users[user_id] = dict(users[user_id], address=rng.choice(ADDRESSES))
+            edited.append(users[user_id])
+        return store.put_profiles(edited)
+
+    def upsert_tutors():
+        by_id = {tutor["id"]: tutor for tutor in tutors}
+        # Existing tutors shown to many students, re-rated, and new tutors
+        changed = [dict(by_id[tutor_id], rating="3.0")
+                   for tutor_id in on_pages()[:args.changes // 2 + 1]]
+        changed += [dict(tutor, id=f"tutor-new-{i}", rating="5.0")
+                    for i, tutor in enumerate(rng.sample(tutors, args.changes))]
+        previous = index.snapshot()
+        index.upsert(changed)
+        return store.tutors_upserted([tutor["id"] for tutor in changed], previous)
+
+    def delete_tutors():
+        deleted = on_pages()[:args.changes]
+        previous = index.snapshot()
+        index.delete(deleted)
+        return store.tutors_deleted(deleted, previous)
+
+    def refit():
+        index.refit()
+        return store.index_rebuilt()
+
+    failed = False
+    for name, change in (("profile edit", edit_profiles),
+                         ("tutor upsert", upsert_tutors),
+                         ("tutor delete", delete_tutors),
+                         ("refit", refit)):
+        begin = time.perf_counter()
+        marked = change()
+        refreshed_within(store)
+        lag = time.perf_counter() - begin
+        wrong = mismatches(store, index, users.values(), args.k)
+        failed = failed or wrong > 0
+        print(f"  {name:<13} recomputed {marked:5d} of {len(users)} students "
+              f"({marked / len(users):6.1%}), all refreshed after {lag:.2f}s, "
+              f"{wrong} pages differ from /recommend")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
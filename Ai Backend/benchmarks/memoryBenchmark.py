@@ -0,0 +1,116 @@
+"""Report resident memory per worker with and without the feature store
+
+Starts --workers processes that each load the same synthetic catalogue
+into a TutorIndex and serve a few recommendations, then reports each
+worker's resident (RSS) and proportional (PSS) set size before loading
+and after. PSS splits shared pages between the processes mapping them, so
+the PSS total is the physical memory the workers use together.
+
+Modes: ``private`` keeps every array in each worker's heap; ``store``
+writes the features once to a feature store (see featureStore) and has
+every worker memory-map it. Needs Linux for /proc/self/smaps_rollup.
+
+Usage: python benchmarks/memoryBenchmark.py --tutors 100000 --workers 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVICE_DIR)
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+
+MIB = 1024 * 1024
+
+
+def worker(catalogue_path, store_path, users, loaded, done, results):
+    """Load the index, serve ``users``, report memory and wait for the others"""
+    logging.disable(logging.CRITICAL)
+    from pipelineMetrics import process_memory
+    from recommendationPipeline import recommend_from_index
+    from tutorIndex import TutorIndex
+
+    before = process_memory()
+    start = time.perf_counter()
+    index = TutorIndex(None, store_path)
+    index.load_file(catalogue_path)
+    load_seconds = time.perf_counter() - start
+    for user in users:
+        recommend_from_index(user, index, 10)
+    # Measure while every worker has its index loaded
+    loaded.wait()
+    results.put((before, process_memory(), load_seconds))
+    done.wait()
+
+
+def run(mode, args, catalogue_path, store_path, users):
+    context = multiprocessing.get_context("spawn")
+    loaded = context.Barrier(args.workers)
+    done = context.Barrier(args.workers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(
+            catalogue_path, store_path if mode == "store" else None,
+            users, loaded, done, results))
+        for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    done.wait()
+    for process in processes:
+        process.join()
+
+    def average_mib(when, field):
+        return sum(report[when][field] for report in reports) / len(reports) / MIB
+
+    total_pss = sum(after["pss"] for _, after, _ in reports) / MIB
+    load_seconds = max(seconds for _, _, seconds in reports)
+    print(f"{mode:<8} per worker RSS {average_mib(0, 'rss'):5.0f} MiB before, "
+          f"{average_mib(1, 'rss'):5.0f} MiB after "
+          f"(PSS {average_mib(1, 'pss'):5.0f} MiB); "
+          f"PSS of all {args.workers} workers {total_pss:5.0f} MiB; "
+          f"slowest load {load_seconds:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=["private", "store"],
+                        choices=["private", "store"])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        raise SystemExit("memoryBenchmark.py needs /proc/self/smaps_rollup (Linux)")
+
+    directory = tempfile.mkdtemp()
+    try:
+        catalogue_path = os.path.join(directory, "tutors.json")
+        with open(catalogue_path, "w") as f:
+            json.dump(generate_tutors(args.tutors), f)
+        users = generate_users(args.users)
+
+        # Build the store up front, as the first worker of a deploy would,
+        # so every measured worker opens the same version
+        store_path = os.path.join(directory, "store")
+        if "store" in args.modes:
+            from tutorIndex import TutorIndex
+            TutorIndex(None, store_path).load_file(catalogue_path)
+
+        print(f"{args.tutors} tutors, {args.workers} workers")
+        for mode in args.modes:
+            run(mode, args, catalogue_path, store_path, users)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
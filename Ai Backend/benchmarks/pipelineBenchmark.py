@@ -0,0 +1,235 @@
+"""Benchmark the recommendation pipeline stage by stage and store the results
+
+Times preprocess_tutor_data, create_feature_vectors (the string reference),
+the columnar FeatureVectorizer, compute_recommendations and the full
+/recommend round trip through the Flask test client (payload and index
+mode) for each catalogue size. For every stage it records the median time
+and the peak traced memory. It also checks that rankings are stable:
+repeated runs and both request modes must return the same top-k ids.
+
+Results are written as JSON. Pass an earlier results file with --compare to
+see time and ranking changes between commits:
+
+    python benchmarks/pipelineBenchmark.py --sizes 100 1000 10000 100000
+    python benchmarks/pipelineBenchmark.py --compare benchmarks/results/<old>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+
+# Every request has to be scored, not served from the response cache
+os.environ["RECOMMENDATION_CACHE_SIZE"] = "0"
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVICE_DIR)
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from recommendationEngine import (  # noqa: E402
+    preprocess_tutor_data,
+    create_feature_vectors,
+    create_user_vector,
+    compute_recommendations,
+    EncodedTutors,
+    FeatureVectorizer,
+    DEFAULT_TOP_K,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Slower than this many times the previous run (and by more than the noise
+# floor, which small catalogues stay under) counts as a regression
+REGRESSION_RATIO = 1.2
+NOISE_SECONDS = 0.005
+
+
+def measure(function, repeat):
+    """Median seconds over ``repeat`` runs, then one traced run for peak MiB
+
+    Returns the median, the peak memory and the result of the last run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def top_ids(recommendations):
+    return [str(rec.get("id")) for rec in recommendations]
+
+
+def benchmark_size(size, users, args, client, service):
+    """Time every stage for one catalogue size"""
+    tutors_data = generate_tutors(size, seed=args.seed)
+    user = users[0]
+    user_vector = create_user_vector(user)
+    stages = {}
+
+    def record(stage, function, repeat=args.repeat):
+        seconds, peak, result = measure(function, repeat)
+        stages[stage] = {"seconds": seconds, "peakMiB": round(peak, 2)}
+        print(f"  {stage:<24} {seconds * 1000:10.1f}ms {peak:9.1f}MiB")
+        return result
+
+    record("dataframe", lambda: pd.DataFrame(tutors_data))
+    tutors = record("preprocess_tutor_data",
+                    lambda: preprocess_tutor_data(pd.DataFrame(tutors_data)))
+    encoded = record("encode_tutors", lambda: EncodedTutors(tutors))
+
+    # The row-by-row reference gets slow; only run it on smaller catalogues
+    if size <= args.max_reference_size:
+        record("create_feature_vectors",
+               lambda: create_feature_vectors(tutors, user, encoded), repeat=1)
+    record("feature_vectorizer", lambda: FeatureVectorizer().fit_transform(
+        tutors, user, encoded, user_vector))
+
+    # compute_recommendations adds score columns, so give it its own copy
+    def compute(user=user):
+        return compute_recommendations(
+            create_user_vector(user), tutors.copy(), user, encoded=encoded,
+            k=args.k)
+    record("compute_recommendations", compute)
+
+    # Full round trips, including JSON encoding on the test client side
+    def round_trip(payload):
+        response = client.post("/recommend", json=payload)
+        return response.get_json()
+    record("recommend_payload", lambda: round_trip(
+        {"user": user, "tutors": tutors_data, "k": args.k}))
+    service.tutor_index.load(tutors_data)
+    record("recommend_index", lambda: round_trip({"user": user, "k": args.k}))
+
+    return stages, ranking_stability(users, tutors, encoded, args, round_trip)
+
+
+def ranking_stability(users, tutors, encoded, args, round_trip):
+    """Top-k ids per user, and whether every way of computing them agrees"""
+    rankings = {}
+    unstable = []
+    for user in users:
+        runs = [top_ids(compute_recommendations(
+            create_user_vector(user), tutors.copy(), user, encoded=encoded,
+            k=args.k)) for _ in range(2)]
+        # The service drops low scores, so compare on what it returned
+        index_ids = top_ids(round_trip({"user": user, "k": args.k}))
+        if runs[0] != runs[1] or index_ids != runs[0][:len(index_ids)]:
+            unstable.append(user["id"])
+        rankings[user["id"]] = runs[0]
+
+    if unstable:
+        print(f"  ranking differs between runs for {len(unstable)} users")
+    return {"rankings": rankings, "unstableUsers": unstable}
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scipy": scipy.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def compare(results, previous):
+    """Print stage time ratios and ranking changes against earlier results"""
+    print(f"\nCompared with {previous['environment'].get('commit')}:")
+    for size, current in results["sizes"].items():
+        before = previous["sizes"].get(size)
+        if before is None:
+            continue
+        for stage, timing in current["stages"].items():
+            old = before["stages"].get(stage)
+            if not old or not old["seconds"]:
+                continue
+            ratio = timing["seconds"] / old["seconds"]
+            slower = timing["seconds"] - old["seconds"]
+            flag = ("  REGRESSION" if ratio > REGRESSION_RATIO and
+                    slower > NOISE_SECONDS else "")
+            print(f"  {size:>7} {stage:<24} {ratio:5.2f}x{flag}")
+
+        old_rankings = before.get("rankings", {})
+        changed = [user_id for user_id, ids in current["rankings"].items()
+                   if user_id in old_rankings and old_rankings[user_id] != ids]
+        if changed:
+            print(f"  {size:>7} rankings changed for {len(changed)} of "
+                  f"{len(current['rankings'])} users")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 10000, 100000])
+    parser.add_argument("--users", type=int, default=5,
+                        help="user profiles checked for ranking stability")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-reference-size", type=int, default=10000,
+                        help="largest catalogue create_feature_vectors runs on")
+    parser.add_argument("--output", help="results file (default: "
+                        "benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.disable(logging.CRITICAL)
+
+    import recommendationService as service
+    client = service.app.test_client()
+    users = generate_users(args.users, seed=args.seed + 1)
+
+    results = {"environment": environment(),
+               "settings": {"k": args.k, "repeat": args.repeat,
+                            "users": args.users, "seed": args.seed},
+               "sizes": {}}
+    for size in args.sizes:
+        print(f"{size} tutors:")
+        stages, stability = benchmark_size(size, users, args, client, service)
+        results["sizes"][str(size)] = dict(stages=stages, **stability)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"pipeline-{results['environment']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
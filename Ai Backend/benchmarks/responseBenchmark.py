@@ -0,0 +1,79 @@
+"""Measure response size and build/encode time at several page sizes
+
+For each k, takes the top-k frames of scored synthetic users and compares
+the declared response projection (RESPONSE_FIELDS plus scores and
+reasons) with every column of the frame, encoded with the standard
+library ``json`` and with responseJson.dumps (orjson when installed).
+
+Usage: python benchmarks/responseBenchmark.py --tutors 5000 --k 10 100
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from recommendationCache import json_default  # noqa: E402
+from recommendationEngine import (  # noqa: E402
+    prepare_recommendations_for_response,
+    select_top_k,
+)
+from recommendationPipeline import recommend_from_payload  # noqa: E402
+from responseJson import dumps, orjson  # noqa: E402
+
+
+def stdlib_dumps(value):
+    return json.dumps(value, default=json_default).encode()
+
+
+def timed_ms(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 100])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tutors_data = generate_tutors(args.tutors)
+    users = generate_users(args.users)
+    scored = []
+    for user in users:
+        _, frame, ids = recommend_from_payload(user, tutors_data, 1)
+        scored.append((user, frame, ids))
+
+    encoder = "orjson" if orjson is not None else "json (orjson not installed)"
+    print(f"{args.tutors} tutors, {args.users} users, fast encoder: {encoder}")
+    for k in args.k:
+        results = {}
+        for user, frame, ids in scored:
+            page = frame.iloc[select_top_k(frame["combined_score"].to_numpy(), ids, k)]
+            for projection, fields in (("all columns", list(frame.columns)),
+                                       ("declared", None)):
+                body, build_ms = timed_ms(
+                    prepare_recommendations_for_response, page, user, fields)
+                for name, encode in (("json", stdlib_dumps), ("fast", dumps)):
+                    payload, encode_ms = timed_ms(encode, body)
+                    results.setdefault((projection, name), []).append(
+                        (len(payload), build_ms, encode_ms))
+
+        for (projection, name), rows in results.items():
+            size, build_ms, encode_ms = np.median(np.array(rows), axis=0)
+            print(f"  k={k:<4} {projection:<12} {name:<5} "
+                  f"{size / 1024:7.1f} KiB  build {build_ms:6.2f}ms  "
+                  f"encode {encode_ms:6.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
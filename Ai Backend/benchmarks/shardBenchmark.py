@@ -0,0 +1,88 @@
+"""Measure sharded payload scoring against the serial pipeline
+
+Scores synthetic payload requests (the tutors sent with the request) with
+recommend_from_payload on one core and with recommend_sharded (see
+shardedScoring) for each --shards count, and reports the median request
+time, the speedup over serial and the time spent in each sharded stage.
+
+Every sharded result is checked against the serial one: the response
+page, every tutor's combined score and cosine similarity, and the pages
+served from the scored frame after the first. Exits non-zero if any
+differs. The speedup is bounded by the cores available (printed first).
+
+Usage: python benchmarks/shardBenchmark.py --tutors 100000 --shards 2 4 8
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from recommendationPipeline import recommend_from_payload  # noqa: E402
+from requestLogging import request_log  # noqa: E402
+from shardedScoring import recommend_sharded, differences  # noqa: E402
+
+SHARD_STAGES = ("columns", "shard_features", "merge", "shard_counts",
+                "features", "tfidf", "similarity")
+
+
+def timed_request(score):
+    """Result of ``score()`` with its wall time and stage timings"""
+    with request_log("/recommend") as log:
+        start = time.perf_counter()
+        result = score()
+        elapsed = time.perf_counter() - start
+    return result, elapsed, log.timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=100000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=3,
+                        help="pages compared per request")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tutors = generate_tutors(args.tutors)
+    users = generate_users(args.users)
+    print(f"{args.tutors} tutors, {args.users} users, "
+          f"{os.cpu_count()} cores ({len(os.sched_getaffinity(0))} usable)")
+
+    # Each request gets its own copy of the payload, as a parsed body would
+    serial = []
+    for user in users:
+        serial.append(timed_request(
+            lambda: recommend_from_payload(user, [dict(t) for t in tutors], args.k)))
+    serial_ms = np.median([elapsed for _, elapsed, _ in serial]) * 1000
+    print(f"  serial    {serial_ms:8.0f}ms")
+
+    failed = False
+    for shards in args.shards:
+        runs = []
+        for user, (expected, _, _) in zip(users, serial):
+            result, elapsed, timings = timed_request(
+                lambda: recommend_sharded(user, [dict(t) for t in tutors], args.k, shards))
+            found = differences(expected, result, user, args.k, args.pages)
+            if found:
+                failed = True
+                print(f"  {shards} shards differ for {user['id']}: {', '.join(found)}")
+            runs.append((elapsed, timings))
+        median_ms = np.median([elapsed for elapsed, _ in runs]) * 1000
+        stages = ", ".join(
+            f"{stage} {np.median([timings.get(stage, 0) for _, timings in runs]):.0f}"
+            for stage in SHARD_STAGES)
+        print(f"  {shards:2d} shards {median_ms:8.0f}ms  "
+              f"speedup {serial_ms / median_ms:4.2f}x  ({stages} ms)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Measure import time, time-to-ready and first-request latency
+
+Reports what importing the service costs per heavy package (from
+``python -X importtime``), then starts serve.py with a synthetic tutor
+index in each startup mode and measures:
+
+- time until the server first answers (/health, or /tutors when preloaded)
+- time until it is ready to serve recommendations (/ready, or the same
+  first answer when preloaded)
+- latency of the first /recommend request and the median of the next ones
+
+Modes: ``preload`` loads everything before gunicorn binds its port,
+``fast`` is --fast-start with warm-up and ``fast-cold`` is --fast-start
+with RECOMMENDATION_WARMUP=0. Exits non-zero if a server never gets ready.
+
+Usage: python benchmarks/startupBenchmark.py --tutors 20000
+       python benchmarks/startupBenchmark.py --modes fast fast-cold --runs 3
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+# Packages whose import cost is reported on its own
+HEAVY_PACKAGES = ["numpy", "pandas", "scipy", "sklearn", "flask"]
+
+
+def import_times():
+    """Seconds spent importing each heavy package and the whole service
+
+    A package's time includes everything it imports that was not loaded
+    before, so the figures follow the service's import order.
+    """
+    env = dict(os.environ)
+    env.pop("TUTOR_INDEX_PATH", None)
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import recommendationService"],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True, check=True).stderr
+    wall = time.perf_counter() - start
+
+    times = {}
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and match.group(3) in HEAVY_PACKAGES + ["recommendationService"]:
+            times[match.group(3)] = int(match.group(1)) / 1e6
+    return times, wall
+
+
+def answers(url):
+    """HTTP status of a GET, or None while nothing listens"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def wait_for(url, started, timeout, status=200):
+    """Seconds from ``started`` until ``url`` answers with ``status``"""
+    while time.perf_counter() - started < timeout:
+        if answers(url) == status:
+            return time.perf_counter() - started
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer {status} within {timeout}s")
+
+
+def recommend(url, user):
+    request = urllib.request.Request(
+        url, data=json.dumps({"user": user}).encode(),
+        headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def start_up(mode, args, env, users):
+    """Start serve.py in ``mode`` and measure it until it serves"""
+    command = [sys.executable, "serve.py", "--workers", "1",
+               "--port", str(args.port)]
+    env = dict(env)
+    if mode != "preload":
+        command.append("--fast-start")
+        env["RECOMMENDATION_WARMUP"] = "0" if mode == "fast-cold" else "1"
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=SERVICE_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if mode == "preload":
+            # Nothing listens until the app and index are loaded
+            up = ready = wait_for(f"{base_url}/tutors", started, args.timeout)
+        else:
+            up = wait_for(f"{base_url}/health", started, args.timeout)
+            ready = wait_for(f"{base_url}/ready", started, args.timeout)
+        latencies = [recommend(f"{base_url}/recommend", user) for user in users]
+    finally:
+        server.terminate()
+        server.wait()
+    return up, ready, latencies[0], float(np.median(latencies[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["preload", "fast", "fast-cold"],
+                        choices=["preload", "fast", "fast-cold"])
+    parser.add_argument("--tutors", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=5111)
+    args = parser.parse_args()
+
+    times, wall = import_times()
+    print(f"import recommendationService: {times.get('recommendationService', 0):.2f}s "
+          f"(process {wall:.2f}s)")
+    for package in HEAVY_PACKAGES:
+        if package in times:
+            print(f"  {package:<10} {times[package]:.2f}s")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(generate_tutors(args.tutors), f)
+        catalogue_path = f.name
+    env = dict(os.environ, TUTOR_INDEX_PATH=catalogue_path,
+               # Every request should be scored, not served from cache
+               RECOMMENDATION_CACHE_SIZE="0")
+    users = generate_users(args.requests + 1)
+
+    failed = False
+    try:
+        for mode in args.modes:
+            for run in range(args.runs):
+                try:
+                    up, ready, first, median = start_up(mode, args, env, users)
+                except RuntimeError as e:
+                    print(f"{mode:<10} {e}")
+                    failed = True
+                    continue
+                print(f"{mode:<10} answers {up:.2f}s  ready {ready:.2f}s  "
+                      f"first /recommend {first * 1000:.0f}ms  "
+                      f"then median {median * 1000:.0f}ms")
+    finally:
+        os.unlink(catalogue_path)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import random
+
+# Values drawn from the shapes the Node backend sends to /recommend.
+# Weights roughly follow what tutors on the platform teach and where they
+# live: core science subjects and Kathmandu valley addresses dominate.
+SUBJECTS = ["Mathematics", "Physics", "Chemistry", "Biology", "English",
+            "Nepali", "Computer Science", "Accountancy", "Economics",
+            "Social Studies"]
+SUBJECT_WEIGHTS = [20, 14, 12, 9, 14, 6, 10, 5, 5, 5]
+GRADE_LEVELS = ["Grade 8", "Grade 9", "Grade 10", "Grade 11", "Grade 12",
+                "Bachelor"]
+GRADE_WEIGHTS = [10, 14, 22, 20, 22, 12]
+ADDRESSES = ["Baneshwor, Kathmandu", "Koteshwor, Kathmandu",
+             "Kalanki, Kathmandu", "Chabahil, Kathmandu", "Patan, Lalitpur",
+             "Jawalakhel, Lalitpur", "Thimi, Bhaktapur", "Lakeside, Pokhara"]
+ADDRESS_WEIGHTS = [18, 14, 12, 12, 14, 10, 10, 10]
+EXPERIENCE = ["fresher", "0-1", "1-2", "2-5", "5+", "3 years", "10 years",
+              None]
+EXPERIENCE_WEIGHTS = [10, 15, 20, 25, 12, 8, 5, 5]
+PREFERRED_SUBJECTS = ["math", "physics", "english", "Chemistry", "computer",
+                      "Biology"]
+# Ratings cluster around 4; unrated tutors show up as 0
+RATINGS = [0, 3, 3.5, 4, 4.2, 4.5, 4.8, 5]
+RATING_WEIGHTS = [15, 5, 10, 20, 18, 15, 10, 7]
+
+
+def generate_address(rng):
+    """An address as typed by a user: optional ward number, varying case"""
+    address = rng.choices(ADDRESSES, ADDRESS_WEIGHTS)[0]
+    if rng.random() < 0.2:
+        area, city = address.split(", ")
+        address = f"{area}-{rng.randint(1, 32)}, {city}"
+    if rng.random() < 0.1:
+        address = address.lower()
+    return address
+
+
+def generate_tutors(count, seed=0):
+    """Generate tutor dictionaries shaped like the /recommend payload"""
+    rng = random.Random(seed)
+    tutors = []
+    for i in range(count):
+        subjects = weighted_sample(rng, SUBJECTS, SUBJECT_WEIGHTS,
+                                   rng.choices([1, 2, 3], [45, 35, 20])[0])
+        grade_levels = weighted_sample(rng, GRADE_LEVELS, GRADE_WEIGHTS,
+                                       rng.randint(1, 3))
+        tutors.append({
+            "id": f"tutor-{i:06d}",
+            "username": f"tutor{i}",
+            "subjects": subjects,
+            "gradeLevels": grade_levels,
+            "subjectDetails": [{"name": subject,
+                                "gradeLevel": rng.choice(grade_levels)}
+                               for subject in subjects],
+            "address": generate_address(rng),
+            "rating": f"{rng.choices(RATINGS, RATING_WEIGHTS)[0]:.1f}",
+            # Most tutors have a handful of bookings, a few have many
+            "bookingsCount": min(int(rng.expovariate(1 / 12)), 150),
+            "experience": rng.choices(EXPERIENCE, EXPERIENCE_WEIGHTS)[0],
+            "isAvailable": rng.random() < 0.6,
+        })
+    return tutors
+
+
+def generate_users(count, seed=1):
+    """Generate student profiles shaped like the /recommend user payload"""
+    rng = random.Random(seed)
+    return [{
+        "id": f"user-{i:06d}",
+        "address": generate_address(rng),
+        "grade": rng.choices(GRADE_LEVELS, GRADE_WEIGHTS)[0],
+        "preferredSubjects": rng.sample(PREFERRED_SUBJECTS, rng.randint(0, 2)),
+    } for i in range(count)]
+
+
+def weighted_sample(rng, values, weights, count):
+    """Up to ``count`` distinct values, picked with the given weights"""
+    picked = []
+    for value in rng.choices(values, weights, k=count * 3):
+        if value not in picked:
+            picked.append(value)
+            if len(picked) == count:
+                break
+    return picked
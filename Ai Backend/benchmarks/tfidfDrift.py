@@ -0,0 +1,162 @@
+"""Measure how far index TF-IDF similarities drift from a per-request fit
+
+The tutor index fits its vocabulary and IDF weights once per catalogue and
+only transforms the user vector per request. Three intentional differences
+follow, and this script measures each on synthetic data:
+
+per-request fit
+    The payload path fits on the user vector plus tutor features that
+    repeat the user's subjects, grade and nearby locations; the index fits
+    once on features without that emphasis, so similarities differ a lot.
+incremental updates
+    Upserts and deletes below the refit threshold reuse the fitted
+    vocabulary and weights instead of refitting on the new catalogue.
+sparse product
+    Similarities are one product of L2-normalized rows instead of
+    cosine_similarity, which normalizes again (last-bit differences).
+
+Only the reported ``cosine_similarity`` column is affected: the combined
+score, and so every ranking, must come out identical. The script checks
+that, prints the largest similarity differences, checks that a saved
+TF-IDF artifact restores the same matrix, and exits non-zero on a ranking
+change or an incremental or product drift above --max-drift.
+tests/test_tfidf_drift.py runs the same checks with fixed tolerances.
+
+    python benchmarks/tfidfDrift.py --size 20000 --changed 0.05
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVICE_DIR)
+
+from syntheticData import generate_tutors, generate_users  # noqa: E402
+from tutorIndex import TutorIndex  # noqa: E402
+from recommendationEngine import create_user_vector, normalized_similarity  # noqa: E402
+from recommendationPipeline import recommend_from_index, recommend_from_payload  # noqa: E402
+
+
+def ranked(recommendations):
+    """Ids and combined scores, the part of a response drift must not touch"""
+    return [(rec["id"], rec["recommendationScore"]) for rec in recommendations]
+
+
+def similarity_drift(expected, actual):
+    """Largest cosine_similarity difference of the same tutors in two pages"""
+    expected = {rec["id"]: rec["cosine_similarity"] for rec in expected}
+    return max((abs(rec["cosine_similarity"] - expected[rec["id"]])
+                for rec in actual if rec["id"] in expected), default=0.0)
+
+
+def compare(name, users, expected_page, actual_page):
+    """Print the drift of one variant; return (drift, users ranked differently)"""
+    drift = 0.0
+    changed = 0
+    for user in users:
+        expected = expected_page(user)
+        actual = actual_page(user)
+        drift = max(drift, similarity_drift(expected, actual))
+        changed += ranked(expected) != ranked(actual)
+    print(f"  {name:<24} max similarity drift {drift:.2e}  "
+          f"rankings changed {changed}/{len(users)}")
+    return drift, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--changed", type=float, default=0.05,
+                        help="share of tutors upserted or deleted incrementally")
+    parser.add_argument("--max-drift", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    tutors_data = generate_tutors(args.size, seed=args.seed)
+    users = generate_users(args.users, seed=args.seed + 1)
+    index = TutorIndex()
+    index.load(tutors_data)
+    results = []
+
+    # Sparse product against cosine_similarity on the same fitted matrix
+    snapshot = index.snapshot()
+    user_tfidf = snapshot.vectorizer.transform(
+        [create_user_vector(user) for user in users])
+    product = np.abs(normalized_similarity(user_tfidf, snapshot.tfidf_matrix) -
+                     cosine_similarity(user_tfidf, snapshot.tfidf_matrix)).max()
+    print(f"  {'sparse product':<24} max similarity drift {product:.2e}")
+    results.append((product, 0))
+
+    # Index against a per-request fit over the same catalogue; only the
+    # rankings have to agree here
+    _, changed_rankings = compare(
+        "per-request fit", users,
+        lambda user: recommend_from_payload(user, tutors_data, args.k)[0],
+        lambda user: recommend_from_index(user, index, args.k)[0])
+    results.append((0.0, changed_rankings))
+
+    # Incremental upserts and deletes against refitting on the result
+    changed = int(args.size * args.changed)
+    base = tutors_data[:args.size - changed]
+    updated = [dict(tutor, rating="5.0") for tutor in base[:changed // 2]]
+    added = generate_tutors(changed, seed=args.seed + 2)
+    for i, tutor in enumerate(added):
+        tutor["id"] = f"added-{i:06d}"
+    deleted = [tutor["id"] for tutor in base[-(changed // 2):]]
+
+    incremental = TutorIndex()
+    incremental.load(base)
+    start = time.perf_counter()
+    incremental.upsert(updated + added)
+    incremental.delete(deleted)
+    incremental_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    refitted = TutorIndex()
+    refitted.load(incremental.snapshot().tutors.to_dict(orient="records"))
+    refitted.refit()
+    refit_seconds = time.perf_counter() - start
+    print(f"  incremental update {incremental_seconds:.2f}s, "
+          f"reload and refit {refit_seconds:.2f}s")
+    results.append(compare(
+        f"incremental ({args.changed:.0%})", users,
+        lambda user: recommend_from_index(user, refitted, args.k)[0],
+        lambda user: recommend_from_index(user, incremental, args.k)[0]))
+
+    # Saved artifact restores the fitted state exactly
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tfidf.npz")
+        catalogue = os.path.join(directory, "tutors.json")
+        with open(catalogue, "w") as f:
+            f.write(index.snapshot().tutors.to_json(orient="records"))
+        saved = TutorIndex(path)
+        start = time.perf_counter()
+        saved.load_file(catalogue)
+        fit_seconds = time.perf_counter() - start
+        restored = TutorIndex(path)
+        start = time.perf_counter()
+        restored.load_file(catalogue)
+        restore_seconds = time.perf_counter() - start
+        same = (saved.snapshot().tfidf_matrix != restored.snapshot().tfidf_matrix).nnz == 0
+        print(f"  artifact load {restore_seconds:.2f}s vs fit {fit_seconds:.2f}s, "
+              f"matrix {'identical' if same else 'DIFFERS'}")
+        results.append(compare(
+            "restored artifact", users,
+            lambda user: recommend_from_index(user, saved, args.k)[0],
+            lambda user: recommend_from_index(user, restored, args.k)[0]))
+
+    failed = (not same or
+              any(drift > args.max_drift or changed for drift, changed in results))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
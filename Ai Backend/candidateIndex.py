@@ -0,0 +1,222 @@
+"""Inverted indexes that narrow a /recommend request to candidate tutors
+
+A tutor whose address shares no token with the user's gets a location score
+of 0, and one teaching none of the user's preferred subjects (not even as
+part of a longer name) gets a subject score of 0, or the neutral 0.5 when
+the user has no preferred subjects. Such a tutor's combined score only
+depends on its own rating, popularity, experience and availability, so
+its rank among the other non-matching tutors is the same for every user.
+
+Requests therefore score only the candidates found through the address and
+subject postings. The best of the remaining tutors come from an order
+precomputed per neutral subject score; every tutor left out ranks after
+all the fallback tutors taken, so the top-k is the one scoring the whole
+catalogue gives. Grade level does not enter the combined score, so it does
+not widen the candidate set.
+
+In geo mode (see geoLocation) a located user's candidates are the located
+tutors within the scoring radius, found with a k-d tree, plus unlocated
+tutors sharing an address token, which keep the Jaccard score.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from recommendationEngine import normalize_location, select_top_k
+from geoLocation import SpatialIndex, user_coordinates, distance_scores
+
+
+class CandidateIndex:
+    """Address-token and subject postings for one snapshot of the tutor index"""
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+        # Column j of a CSC token matrix lists the tutors having token j
+        self.location_postings = encoded.location_matrix.tocsc()
+        self.subject_postings = encoded.subject_matrix.tocsc()
+
+        # Tutor positions, and address postings of the tutors without one
+        self.locate(encoded)
+        if self.spatial is not None:
+            unlocated = sp.diags((~self.located).astype(np.float64))
+            postings = unlocated @ encoded.location_matrix
+            postings.eliminate_zeros()
+            self.unlocated_postings = postings.tocsc()
+
+        # Scores and rank order of tutors matching neither address nor
+        # subjects, for users with and without preferred subjects
+        self.fallback_scores = {}
+        self.fallback_orders = {}
+        for neutral in (0.0, 0.5):
+            scores = combined_scores(
+                encoded, np.arange(len(encoded)), np.zeros(len(encoded)),
+                np.full(len(encoded), neutral))
+            self.fallback_scores[neutral] = scores
+            # Same tie-break and missing-score handling as select_top_k
+            scores = np.where(np.isnan(scores), -np.inf, scores)
+            self.fallback_orders[neutral] = np.lexsort((encoded.ids, -scores))
+
+    @classmethod
+    def restore(cls, encoded, location_postings, subject_postings,
+                unlocated_postings, fallback):
+        """Index saved earlier (see featureStore); ``fallback`` maps each
+        neutral subject score to its (scores, order)"""
+        candidates = object.__new__(cls)
+        candidates.encoded = encoded
+        candidates.location_postings = location_postings
+        candidates.subject_postings = subject_postings
+        candidates.locate(encoded)
+        candidates.unlocated_postings = unlocated_postings
+        candidates.fallback_scores = {
+            neutral: scores for neutral, (scores, _) in fallback.items()}
+        candidates.fallback_orders = {
+            neutral: order for neutral, (_, order) in fallback.items()}
+        return candidates
+
+    def locate(self, encoded):
+        """Spatial index over the located tutors, in geo mode"""
+        self.spatial = None
+        if encoded.coordinates is not None:
+            self.located = ~np.isnan(encoded.coordinates[:, 0])
+            self.spatial = SpatialIndex(encoded.coordinates)
+
+    def top_rows(self, user, count):
+        """Rows of the ``count`` best-ranked tutors for ``user``, best first
+
+        Returns the rows and the number of candidates that were scored.
+        """
+        preferred = [s.lower() for s in user.get("preferredSubjects") or []]
+        rows, scores = self.candidate_scores(user, preferred)
+
+        neutral = 0.0 if preferred else 0.5
+        fallback = self.fallback_rows(neutral, rows, count)
+        all_rows = np.concatenate([rows, fallback])
+        all_scores = np.concatenate(
+            [scores, self.fallback_scores[neutral][fallback]])
+
+        top = select_top_k(all_scores, self.encoded.ids[all_rows], count)
+        return all_rows[top], len(rows)
+
+    def candidate_scores(self, user, preferred):
+        """Rows of the candidates for ``user`` and their combined scores
+
+        Location and subject scores are computed from the postings with the
+        same arithmetic as location_score_matrix and subject_match_matrix.
+        """
+        encoded = self.encoded
+        n_tutors = len(encoded)
+
+        address = normalize_location(user.get("address", ""))
+        tokens = set(address.split())
+        user_position = None
+        token_postings = self.location_postings
+        if self.spatial is not None:
+            user_position = user_coordinates(user, address)
+            if user_position is not None:
+                # Located tutors are scored on distance, not shared tokens
+                token_postings = self.unlocated_postings
+        location_postings = [
+            posting(token_postings, encoded.location_vocab[token])
+            for token in tokens if token in encoded.location_vocab]
+        nearby = ([] if user_position is None
+                  else [self.spatial.within(user_position)])
+
+        # Postings of the catalogue subject names each preferred subject
+        # equals (exact match) or appears in (partial match)
+        weights = {}
+        for subject in preferred:
+            weights[subject] = weights.get(subject, 0) + 1
+        exact_postings = {}
+        contains_postings = {}
+        for subject in weights:
+            if subject in encoded.subject_vocab:
+                exact_postings[subject] = posting(
+                    self.subject_postings, encoded.subject_vocab[subject])
+            contains_postings[subject] = [
+                posting(self.subject_postings, column)
+                for name, column in encoded.subject_vocab.items()
+                if subject in name]
+
+        postings = location_postings + nearby + [
+            rows for subject_rows in contains_postings.values()
+            for rows in subject_rows]
+        if not postings:
+            return np.array([], dtype=np.int64), np.array([])
+        is_candidate = np.zeros(n_tutors, dtype=bool)
+        for rows in postings:
+            is_candidate[rows] = True
+        candidates = np.flatnonzero(is_candidate)
+
+        # Position of each candidate row in the candidate arrays
+        position = np.empty(n_tutors, dtype=np.int64)
+        position[candidates] = np.arange(len(candidates))
+
+        # Jaccard similarity from the number of shared tokens
+        common = np.zeros(len(candidates))
+        for rows in location_postings:
+            common[position[rows]] += 1
+        union = len(tokens) + encoded.location_sizes[candidates] - common
+        location = np.zeros(len(candidates))
+        np.divide(common, union, out=location,
+                  where=encoded.location_sizes[candidates] > 0)
+        if user_position is not None:
+            located = self.located[candidates]
+            location[located] = distance_scores(
+                user_position, encoded.coordinates[candidates[located]])
+
+        if preferred:
+            exact_matches = np.zeros(len(candidates))
+            partial_matches = np.zeros(len(candidates))
+            for subject, weight in weights.items():
+                exact = np.zeros(len(candidates), dtype=bool)
+                if subject in exact_postings:
+                    exact[position[exact_postings[subject]]] = True
+                contains = np.zeros(len(candidates), dtype=bool)
+                for rows in contains_postings[subject]:
+                    contains[position[rows]] = True
+                exact_matches += weight * exact
+                partial_matches += weight * (contains & ~exact)
+            subject_scores = (exact_matches * 1.0 +
+                              partial_matches * 0.5) / len(preferred)
+        else:
+            subject_scores = np.full(len(candidates), 0.5)
+
+        return candidates, combined_scores(
+            encoded, candidates, np.clip(location, 0, 1),
+            np.clip(subject_scores, 0, 1))
+
+    def fallback_rows(self, neutral, candidates, count):
+        """The ``count`` best-ranked tutors that are not candidates"""
+        order = self.fallback_orders[neutral]
+        is_candidate = np.zeros(len(order), dtype=bool)
+        is_candidate[candidates] = True
+
+        # Look further down the order only while candidates crowd it
+        length = 2 * count
+        while True:
+            fallback = order[:length]
+            fallback = fallback[~is_candidate[fallback]]
+            if len(fallback) >= count or length >= len(order):
+                return fallback[:count]
+            length *= 4
+
+
+def posting(postings, column):
+    """Rows of the tutors having the token in ``column``"""
+    return postings.indices[postings.indptr[column]:postings.indptr[column + 1]]
+
+
+def combined_scores(encoded, rows, location_scores, subject_scores):
+    """Combined scores of the tutors at ``rows``
+
+    Uses the weights and summation order of score_tutors, so the values are
+    identical to those of a full scoring pass.
+    """
+    return (
+        location_scores * 0.30 +
+        encoded.rating_score[rows] * 0.25 +
+        subject_scores * 0.20 +
+        encoded.popularity_score[rows] * 0.10 +
+        encoded.experience_score[rows] * 0.05 +
+        encoded.availability_score[rows] * 0.10
+    )
@@ -0,0 +1,94 @@
+"""Bulk-load a tutor catalogue from a newline-delimited JSON file
+
+Streams the file to a running service's PUT /tutors endpoint:
+
+    python catalogueLoader.py tutors.ndjson --url http://127.0.0.1:5001
+
+or, with --local, builds the index in this process to check a file and
+measure load throughput and peak memory without touching a server. In
+both cases the file is read as a stream, one line per tutor.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import urllib.request
+
+from tutorIndex import TutorIndex, DEFAULT_CHUNK_SIZE
+
+
+class ProgressReader:
+    """File wrapper that reports how much of the file has been sent"""
+
+    def __init__(self, f, total):
+        self.f = f
+        self.total = total
+        self.sent = 0
+        self.start = self.reported = time.perf_counter()
+
+    def read(self, size=-1):
+        block = self.f.read(size)
+        self.sent += len(block)
+        now = time.perf_counter()
+        # Report at most twice a second, and once at the end
+        if now - self.reported >= 0.5 or not block:
+            self.reported = now
+            rate = self.sent / (now - self.start) / 2 ** 20
+            print(f"\rSent {self.sent / 2 ** 20:.1f}/{self.total / 2 ** 20:.1f} MiB "
+                  f"({rate:.1f} MiB/s)", end="", file=sys.stderr)
+        return block
+
+
+def upload(path, url, chunk_size):
+    """Stream the file to PUT /tutors and return the service's summary"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        request = urllib.request.Request(
+            f"{url.rstrip('/')}/tutors?chunkSize={chunk_size}",
+            data=ProgressReader(f, size), method="PUT",
+            headers={"Content-Type": "application/x-ndjson",
+                     "Content-Length": str(size)})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            result = json.load(response)
+    print(file=sys.stderr)
+    return result
+
+
+def load_locally(path, chunk_size):
+    """Build a TutorIndex from the file in this process"""
+    def progress(rows, seconds):
+        print(f"\rRead {rows} tutors ({rows / seconds if seconds else 0:.0f} rows/s)",
+              end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        count = TutorIndex().load_stream(f, chunk_size, progress)
+    print(file=sys.stderr)
+    seconds = time.perf_counter() - start
+    return {"count": count, "seconds": round(seconds, 3),
+            "rowsPerSecond": round(count / seconds) if seconds else None,
+            # ru_maxrss is in KiB on Linux
+            "peakRssMiB": round(resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="NDJSON file, one tutor per line")
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--local", action="store_true",
+                        help="build the index here instead of uploading")
+    args = parser.parse_args()
+
+    if args.local:
+        result = load_locally(args.path, args.chunk_size)
+    else:
+        result = upload(args.path, args.url, args.chunk_size)
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Precomputed "popular and available" rankings served instead of scores
+
+When scoring a request fails, runs past its latency budget or finds the
+scoring queue full, the service answers from a ranking that does not
+depend on the user's profile beyond a bucket lookup, instead of an empty
+list or a timeout. The response is marked with an X-Degraded header.
+
+Tutors are ranked once per index version on their rating, bookings and
+availability, with the weights of the combined score (0.25, 0.10, 0.10)
+and ties broken by id as in select_top_k. The best FALLBACK_DEPTH tutors
+are kept per bucket, from most to least specific:
+
+    area + subject + grade, area + subject, area, subject, everything
+
+where the area is the first word of the normalized address. A user's page
+takes tutors from the first bucket matching their address, first
+preferred subject and grade, then from the next ones until it is full.
+Pages past FALLBACK_DEPTH are not available.
+
+RECOMMENDATION_LATENCY_BUDGET_MS sets how long an index request may
+spend scoring before it gets the fallback page instead (0, the default,
+waits for the scores). Requests that find the scoring queue full and
+requests whose scoring raises get it too.
+
+Response records are built when the ranking is, without user-specific
+location or subject scores, so serving a page only looks up dicts.
+FallbackTier rebuilds the ranking in a background thread when the index
+version changes or it is older than RECOMMENDATION_FALLBACK_REFRESH
+seconds. The service builds the first one before it is forked into
+workers; a process forked during a rebuild starts its own, as the
+building thread does not survive the fork.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommendationEngine import (
+    normalize_location,
+    prepare_recommendations_for_response,
+)
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_DEPTH = int(os.environ.get("RECOMMENDATION_FALLBACK_DEPTH", 20))
+FALLBACK_REFRESH = float(os.environ.get("RECOMMENDATION_FALLBACK_REFRESH", 300))
+# Seconds an index request may spend scoring; 0 waits for the scores
+LATENCY_BUDGET = float(os.environ.get("RECOMMENDATION_LATENCY_BUDGET_MS", 0)) / 1000
+
+# Bucket levels, most specific first
+BUCKET_LEVELS = (("area", "subject", "grade"), ("area", "subject"), ("area",),
+                 ("subject",), ())
+
+
+class FallbackRanking:
+    """Per-bucket rankings of one index version"""
+
+    def __init__(self, snapshot, depth=FALLBACK_DEPTH):
+        self.version = snapshot.version
+        self.built = time.time()
+        tutors, encoded = snapshot.tutors, snapshot.encoded
+
+        scores = (encoded.rating_score * 0.25 + encoded.popularity_score * 0.10 +
+                  encoded.availability_score * 0.10)
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        order = np.lexsort((encoded.ids, -scores))
+
+        # One row per tutor, subject and grade, in ranking order
+        frame = pd.DataFrame({
+            "row": order,
+            "area": [area_of(encoded.locations[row]) for row in order],
+            "subject": tutors["subjects_list"].to_numpy()[order],
+            "grade": tutors["gradeLevels_list"].to_numpy()[order],
+        }).explode("subject").explode("grade")
+        for column in ("subject", "grade"):
+            frame[column] = frame[column].fillna("").astype(str).str.lower()
+
+        buckets = {}
+        for level in BUCKET_LEVELS:
+            if not level:
+                buckets[()] = order[:depth]
+                continue
+            ranked = frame.drop_duplicates(["row", *level])
+            top = ranked.groupby(list(level), sort=False).head(depth)
+            for key, rows in top.groupby(list(level), sort=False)["row"]:
+                key = key if isinstance(key, tuple) else (key,)
+                buckets[tuple(zip(level, key))] = rows.to_numpy()
+
+        # Response records of every tutor in a bucket, built once
+        rows = np.unique(np.concatenate(list(buckets.values())))
+        page = tutors.take(rows).copy()
+        page["combined_score"] = scores[rows]
+        page["rating_score"] = encoded.rating_score[rows]
+        page["popularity_score"] = encoded.popularity_score[rows]
+        page["experience_score"] = encoded.experience_score[rows]
+        page["location_score"] = 0.0
+        page["subject_match_score"] = 0.0
+        records = dict(zip(rows.tolist(), prepare_recommendations_for_response(page, {})))
+        self.buckets = {key: [records[row] for row in bucket_rows.tolist()]
+                        for key, bucket_rows in buckets.items()}
+
+    def page(self, user, k):
+        """The user's first ``k`` tutors, best buckets first"""
+        area = area_of(normalize_location(user.get("address") or ""))
+        preferred = user.get("preferredSubjects") or []
+        values = {"area": area,
+                  "subject": preferred[0].lower() if preferred else None,
+                  "grade": (user.get("grade") or "").lower() or None}
+
+        page = []
+        seen = set()
+        for level in BUCKET_LEVELS:
+            if any(values[name] is None for name in level):
+                continue
+            for record in self.buckets.get(
+                    tuple((name, values[name]) for name in level), ()):
+                if id(record) not in seen:
+                    seen.add(id(record))
+                    page.append(record)
+                    if len(page) >= k:
+                        return page
+        return page
+
+
+def area_of(location):
+    """First word of a normalized address, the bucket area"""
+    words = location.split()
+    return words[0] if words else ""
+
+
+class FallbackTier:
+    """The fallback ranking of a tutor index, rebuilt in the background"""
+
+    def __init__(self, tutor_index, refresh=FALLBACK_REFRESH):
+        self.tutor_index = tutor_index
+        self.refresh = refresh
+        self.ranking = None
+        self._lock = threading.Lock()
+        self._building = False
+        os.register_at_fork(after_in_child=self._forked)
+
+    def current(self):
+        """Latest ranking, or None before the first build
+
+        Starts a rebuild when the index changed or the ranking is too old;
+        until it completes the previous ranking is served.
+        """
+        ranking = self.ranking
+        if (ranking is None or ranking.version != self.tutor_index.version or
+                time.time() - ranking.built > self.refresh):
+            self.rebuild()
+        return ranking
+
+    def rebuild(self, wait=False):
+        """Build the ranking of the current index, in a thread unless ``wait``"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        if wait:
+            self._build()
+        else:
+            threading.Thread(target=self._build, name="fallback",
+                             daemon=True).start()
+
+    def _build(self):
+        try:
+            snapshot = self.tutor_index.snapshot()
+            if not snapshot.tutors.empty:
+                self.ranking = FallbackRanking(snapshot)
+        except Exception:
+            logger.exception("Building the fallback ranking failed")
+        finally:
+            self._building = False
+
+    def _forked(self):
+        # A build in progress belonged to a thread the child does not have
+        self._lock = threading.Lock()
+        self._building = False
@@ -0,0 +1,205 @@
+"""Fast-start mode: answer health checks while the service loads
+
+Importing the service pulls in pandas, numpy, scipy and scikit-learn and
+loads the tutor index named by TUTOR_INDEX_PATH, which takes seconds, and
+the first recommendation afterwards still pays for first-call costs
+(pandas and scikit-learn setup, regex compilation, allocator growth). In
+fast-start mode the web server is given this small WSGI app instead, which
+needs only the standard library and does that work in a background thread:
+
+``GET /health``
+    200 as soon as the process is up, so supervisors see a live server
+    straight away; 500 if loading failed.
+``GET /ready``
+    503 while loading, then 200 once the service is imported, the index
+    is loaded and a synthetic recommendation has run through both scoring
+    paths, with the seconds each step took.
+
+Every other request gets a 503 with Retry-After until the service is
+ready, and goes to the Flask app unchanged afterwards.
+
+    python fastStart.py --port 5001
+    python serve.py --fast-start
+
+Set RECOMMENDATION_WARMUP=0 to skip the synthetic recommendation.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Close enough to process start, since fast-start mode imports this first
+STARTED = time.perf_counter()
+
+WARMUP = os.environ.get("RECOMMENDATION_WARMUP", "1") == "1"
+# Seconds clients are told to wait while the service is still loading
+RETRY_AFTER = os.environ.get("RECOMMENDATION_STARTUP_RETRY_AFTER", "1")
+
+# Synthetic request run before the service reports ready; small, but it
+# goes through every stage a real one does
+WARMUP_USER = {
+    "id": "warmup",
+    "address": "Baneshwor, Kathmandu",
+    "grade": "Grade 10",
+    "preferredSubjects": ["Mathematics", "physics"],
+}
+WARMUP_TUTORS = [
+    {"id": f"warmup-{i}", "username": f"warmup{i}", "subjects": subjects,
+     "gradeLevels": grades,
+     "subjectDetails": [{"name": subject, "gradeLevel": grades[0]}
+                        for subject in subjects],
+     "address": address, "rating": rating, "bookingsCount": bookings,
+     "experience": experience, "isAvailable": available}
+    for i, (subjects, grades, address, rating, bookings, experience, available)
+    in enumerate([
+        (["Mathematics", "Physics"], ["Grade 10", "Grade 11"],
+         "New Baneshwor, Kathmandu", "4.5", 12, "2-5", True),
+        (["English"], ["Grade 9"], "Patan, Lalitpur", "4.0", 3, "0-1", False),
+        (["Applied Mathematics"], ["Bachelor"], "Ward 3, Koteshwor", "0.0", 0,
+         "fresher", True),
+        (["Chemistry", "Biology"], ["Grade 12"], "Lakeside, Pokhara", "5.0", 40,
+         None, True),
+    ])
+]
+
+
+def warm_up(tutor_index, k=10):
+    """Run the synthetic request through the payload and index pipelines
+
+    Metrics are switched off meanwhile, so the warm-up does not show up in
+    request counts or stage histograms.
+    """
+    from pipelineMetrics import metrics
+    from recommendationPipeline import (
+        recommend_from_payload,
+        recommend_from_index,
+        filter_recommendations,
+    )
+
+    enabled = metrics.enabled
+    metrics.enabled = False
+    try:
+        recommendations, _, _ = recommend_from_payload(WARMUP_USER, WARMUP_TUTORS, k)
+        if len(tutor_index):
+            recommendations, _, _ = recommend_from_index(WARMUP_USER, tutor_index, k)
+        return filter_recommendations(recommendations)
+    finally:
+        metrics.enabled = enabled
+
+
+class FastStartApp:
+    """WSGI app that serves health checks until the real app has loaded"""
+
+    def __init__(self, warmup=WARMUP):
+        self.warmup = warmup
+        self.app = None
+        self.stage = "starting"
+        self.error = None
+        self.timings = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Begin loading in the background; later calls do nothing"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.load, name="fast-start", daemon=True)
+                self.thread.start()
+        return self
+
+    def load(self):
+        try:
+            self.stage = "importing"
+            start = time.perf_counter()
+            for module in ("flask", "recommendationPipeline"):
+                importlib.import_module(module)
+            self.timings["importSeconds"] = round(time.perf_counter() - start, 3)
+
+            # Creates the Flask app and loads TUTOR_INDEX_PATH
+            self.stage = "loading"
+            start = time.perf_counter()
+            import recommendationService
+            self.timings["loadSeconds"] = round(time.perf_counter() - start, 3)
+
+            if self.warmup:
+                self.stage = "warming"
+                start = time.perf_counter()
+                with recommendationService.app.test_request_context():
+                    recommendationService.json_response(
+                        warm_up(recommendationService.tutor_index))
+                self.timings["warmupSeconds"] = round(time.perf_counter() - start, 3)
+
+            self.timings["readySeconds"] = round(time.perf_counter() - STARTED, 3)
+            self.app = recommendationService.app
+            self.stage = "ready"
+            logger.info("Recommendation service ready in %ss: %s",
+                        self.timings['readySeconds'], self.timings)
+        except Exception as e:
+            logger.exception("Recommendation service failed to load")
+            self.error = str(e)
+            self.stage = "failed"
+
+    @property
+    def ready(self):
+        return self.app is not None
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD")
+        path = environ.get("PATH_INFO", "").rstrip("/")
+        if (method, path) == ("GET", "/health"):
+            status = 500 if self.error else 200
+            return respond(start_response, status, self.status())
+        if (method, path) == ("GET", "/ready"):
+            return respond(start_response, 200 if self.ready else 503, self.status())
+        if self.ready:
+            return self.app(environ, start_response)
+        if self.error:
+            return respond(start_response, 500, {"error": "Service failed to load"})
+        return respond(start_response, 503,
+                       {"error": "Recommendation service is starting"},
+                       [("Retry-After", RETRY_AFTER)])
+
+    def status(self):
+        status = {"ready": self.ready, "stage": self.stage,
+                  "uptimeSeconds": round(time.perf_counter() - STARTED, 3)}
+        status.update(self.timings)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+STATUS_LINES = {200: "200 OK", 500: "500 Internal Server Error",
+                503: "503 Service Unavailable"}
+
+
+def respond(start_response, status, body, headers=()):
+    payload = json.dumps(body).encode()
+    start_response(STATUS_LINES[status],
+                   [("Content-Type", "application/json"),
+                    ("Content-Length", str(len(payload)))] + list(headers))
+    return [payload]
+
+
+app = FastStartApp()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+
+    from werkzeug.serving import run_simple
+    from requestLogging import configure_logging
+
+    # Development server, threaded so health checks are answered mid-request
+    configure_logging()
+    app.start()
+    logger.info("Starting recommendation service on port %s (fast start)", args.port)
+    run_simple(args.host, args.port, app, threaded=True)
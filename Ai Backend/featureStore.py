@@ -0,0 +1,247 @@
+"""Tutor index features on disk, memory-mapped by every worker process
+
+Each worker process would otherwise hold its own copy of the encoded tutor
+arrays, the TF-IDF matrix and the candidate postings. With
+RECOMMENDATION_FEATURE_STORE set to a directory, the index writes them
+there as ``.npy`` files whenever it is rebuilt and serves from read-only
+memory maps of those files, so all workers share one copy in the page
+cache. A worker loading the same catalogue file later opens the stored
+version instead of encoding and fitting again.
+
+Layout of the store directory::
+
+    CURRENT             name of the live version, replaced atomically
+    <version>/          one directory per rebuild
+        meta.json       formats, source, id digest, vocabularies, terms, fit id
+        <name>.npy      numeric arrays and CSR/CSC components
+    .lock               serializes building, so workers starting together
+                        build once and open what the first one wrote
+
+A version directory is written under a temporary name and renamed when
+complete, and only then named in CURRENT, so readers never see a partial
+version. Older versions are removed after KEEP_VERSIONS newer ones;
+workers still mapping them keep their pages until they remap.
+
+The preprocessed tutor DataFrame (ids, names, subject lists) stays in each
+worker, since responses are built from it.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy.sparse as sp
+
+from candidateIndex import CandidateIndex
+from geoLocation import GEO_MODE, GAZETTEER_PATH
+from recommendationEngine import EncodedTutors, FeatureVectorizer
+from tfidfArtifact import ARTIFACT_FORMAT, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 1
+
+# Versions kept next to the current one
+KEEP_VERSIONS = 2
+
+
+def id_digest(ids):
+    """sha256 of the tutor ids in row order"""
+    digest = hashlib.sha256()
+    for tutor_id in ids:
+        digest.update(str(tutor_id).encode())
+        digest.update(b"\n")
+    return "sha256:" + digest.hexdigest()
+
+
+def features_key(source):
+    """What a stored version must have been built from to be reused"""
+    return {
+        "format": STORE_FORMAT,
+        "tfidfFormat": ARTIFACT_FORMAT,
+        "source": source,
+        # Coordinates depend on the mode and the gazetteer
+        "geo": (file_fingerprint(GAZETTEER_PATH)
+                if GEO_MODE and os.path.exists(GAZETTEER_PATH) else GEO_MODE),
+    }
+
+
+@contextmanager
+def store_lock(root):
+    """Exclusive lock on the store, held while building a version"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_version(root):
+    """Name of the live version, or None"""
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_store(root, encoded, vectorizer, tfidf_matrix, candidates,
+               index_version, source=None):
+    """Write a new version and make it current; returns its name"""
+    # Distinct normalized addresses once, with a code per tutor
+    names = {}
+    codes = np.array([names.setdefault(location, len(names))
+                      for location in encoded.locations], dtype=np.int32)
+
+    arrays = {
+        "location_sizes": encoded.location_sizes,
+        "rating_score": encoded.rating_score,
+        "popularity_score": encoded.popularity_score,
+        "experience_score": encoded.experience_score,
+        "availability_score": encoded.availability_score,
+        "ids": np.asarray(encoded.ids, dtype=str),
+        "location_codes": codes,
+        "idf": vectorizer.transformer.idf_,
+    }
+    if encoded.coordinates is not None:
+        arrays["coordinates"] = encoded.coordinates
+    for neutral, scores in candidates.fallback_scores.items():
+        arrays[f"fallback_scores-{neutral}"] = scores
+        arrays[f"fallback_orders-{neutral}"] = candidates.fallback_orders[neutral]
+    matrices = {
+        "location_matrix": encoded.location_matrix,
+        "subject_matrix": encoded.subject_matrix,
+        "tfidf_matrix": tfidf_matrix,
+        "location_postings": candidates.location_postings,
+        "subject_postings": candidates.subject_postings,
+    }
+    if candidates.spatial is not None:
+        matrices["unlocated_postings"] = candidates.unlocated_postings
+    components = {}
+    for name, matrix in matrices.items():
+        components[f"{name}.data"] = matrix.data
+        components[f"{name}.indices"] = matrix.indices
+        components[f"{name}.indptr"] = matrix.indptr
+
+    metadata = dict(
+        features_key(source),
+        ids=id_digest(encoded.ids),
+        indexVersion=index_version,
+        tutors=len(encoded),
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        arrays=list(arrays),
+        shapes={name: list(matrix.shape) for name, matrix in matrices.items()},
+        formats={name: matrix.format for name, matrix in matrices.items()},
+        locations=list(names),
+        locationVocab=encoded.location_vocab,
+        subjectVocab=encoded.subject_vocab,
+        terms=vectorizer.vocabulary.term_list[:len(vectorizer.transformer.idf_)],
+        fit=vectorizer.fit_id,
+    )
+
+    # Build the version under a temporary name and rename it when complete
+    version = f"{time.time_ns()}-{os.getpid()}"
+    temporary = os.path.join(root, f".{version}.tmp")
+    os.makedirs(temporary)
+    for name, array in {**arrays, **components}.items():
+        np.save(os.path.join(temporary, f"{name}.npy"), array)
+    with open(os.path.join(temporary, "meta.json"), "w") as f:
+        json.dump(metadata, f)
+    os.rename(temporary, os.path.join(root, version))
+
+    # Point CURRENT at it in one rename, then drop old versions
+    pointer = os.path.join(root, f".CURRENT.{os.getpid()}.tmp")
+    with open(pointer, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(root, "CURRENT"))
+    remove_old_versions(root, version)
+    return version
+
+
+def remove_old_versions(root, current):
+    versions = sorted(name for name in os.listdir(root)
+                      if not name.startswith(".") and name != "CURRENT")
+    for name in versions[:-(KEEP_VERSIONS + 1)]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def open_store(root, ids, source=None):
+    """Memory-mapped features of the current version, if it fits the catalogue
+
+    Returns what read_version does, or None when there is no current
+    version or it was built from other tutors, another source file or an
+    older format.
+    """
+    version = current_version(root)
+    if version is None or source is None:
+        return None
+    try:
+        with open(os.path.join(root, version, "meta.json")) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (any(metadata.get(name) != value for name, value in features_key(source).items())
+            or metadata.get("ids") != id_digest(ids)):
+        return None
+    return read_version(root, version)
+
+
+def read_version(root, version):
+    """(arrays, matrices, metadata) of a version, arrays read-only memory maps"""
+    directory = os.path.join(root, version)
+    with open(os.path.join(directory, "meta.json")) as f:
+        metadata = json.load(f)
+
+    def mapped(name):
+        # A plain read-only ndarray view of the file's pages
+        return np.asarray(np.load(os.path.join(directory, f"{name}.npy"),
+                                  mmap_mode="r"))
+
+    arrays = {name: mapped(name) for name in metadata["arrays"]}
+    matrices = {}
+    for name, shape in metadata["shapes"].items():
+        matrix_class = sp.csc_matrix if metadata["formats"][name] == "csc" else sp.csr_matrix
+        matrix = matrix_class(
+            (mapped(f"{name}.data"), mapped(f"{name}.indices"), mapped(f"{name}.indptr")),
+            shape=tuple(shape), copy=False)
+        matrices[name] = matrix
+    metadata["version"] = version
+    return arrays, matrices, metadata
+
+
+def restore_features(arrays, matrices, metadata):
+    """Encoded tutors, vectorizer, TF-IDF matrix and candidate index of a version"""
+    names = metadata["locations"]
+    encoded = EncodedTutors.restore(
+        locations=[names[code] for code in arrays["location_codes"].tolist()],
+        location_vocab=metadata["locationVocab"],
+        location_matrix=matrices["location_matrix"],
+        location_sizes=arrays["location_sizes"],
+        coordinates=arrays.get("coordinates"),
+        subject_vocab=metadata["subjectVocab"],
+        subject_matrix=matrices["subject_matrix"],
+        rating_score=arrays["rating_score"],
+        popularity_score=arrays["popularity_score"],
+        experience_score=arrays["experience_score"],
+        availability_score=arrays["availability_score"],
+        ids=arrays["ids"])
+    vectorizer = FeatureVectorizer.restore(metadata["terms"], arrays["idf"],
+                                           metadata.get("fit"))
+    fallback = {neutral: (arrays[f"fallback_scores-{neutral}"],
+                          arrays[f"fallback_orders-{neutral}"])
+                for neutral in (0.0, 0.5)}
+    candidates = CandidateIndex.restore(
+        encoded, matrices["location_postings"], matrices["subject_postings"],
+        matrices.get("unlocated_postings"), fallback)
+    return encoded, vectorizer, matrices["tfidf_matrix"], candidates
@@ -0,0 +1,174 @@
+"""Optional coordinate-based location scoring
+
+With RECOMMENDATION_LOCATION_MODE=geo the location score is taken from the
+great-circle distance between user and tutor instead of the word Jaccard
+of their addresses: 1 at the same point, falling linearly to 0 at
+RECOMMENDATION_GEO_RADIUS_KM. Coordinates come from ``latitude`` and
+``longitude`` fields when a tutor or user has them, otherwise from the first
+place named in the address that is listed in a local gazetteer file
+(RECOMMENDATION_GAZETTEER, a CSV of name, latitude, longitude), so nothing
+is looked up over the network. A pair where either side has no coordinates
+keeps its Jaccard score.
+"""
+import csv
+import logging
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+GEO_MODE = os.environ.get("RECOMMENDATION_LOCATION_MODE", "jaccard") == "geo"
+GAZETTEER_PATH = os.environ.get(
+    "RECOMMENDATION_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+RADIUS_KM = float(os.environ.get("RECOMMENDATION_GEO_RADIUS_KM", 5))
+
+# Mean earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+
+class Gazetteer:
+    """Place names, normalized like addresses, mapped to (latitude, longitude)"""
+
+    def __init__(self, places):
+        self.places = places
+        self.max_words = max((len(name.split()) for name in places), default=0)
+
+    @classmethod
+    def load(cls, path):
+        places = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                places[place_key(row["name"])] = (
+                    float(row["latitude"]), float(row["longitude"]))
+        return cls(places)
+
+    def lookup(self, location):
+        """Coordinates of the first known place in a normalized address
+
+        Longer names win at the same position, so "new baneshwor" is
+        preferred over "baneshwor". Ward numbers are skipped.
+        """
+        words = [word for word in location.split() if not word.isdigit()]
+        for start in range(len(words)):
+            for size in range(min(self.max_words, len(words) - start), 0, -1):
+                place = self.places.get(" ".join(words[start:start + size]))
+                if place is not None:
+                    return place
+        return None
+
+
+def place_key(name):
+    """Gazetteer names normalized the way normalize_location treats addresses"""
+    return " ".join(re.sub(r'[^\w\s]', ' ', name.lower()).split())
+
+
+_gazetteer = None
+
+
+def gazetteer():
+    """The gazetteer from GAZETTEER_PATH, loaded on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        try:
+            _gazetteer = Gazetteer.load(GAZETTEER_PATH)
+            logger.info("Loaded %d places from %s",
+                        len(_gazetteer.places), GAZETTEER_PATH)
+        except OSError as e:
+            logger.warning("No gazetteer loaded, addresses stay unlocated: %s", e)
+            _gazetteer = Gazetteer({})
+    return _gazetteer
+
+
+@lru_cache(maxsize=65536)
+def place_coordinates(location):
+    """Gazetteer coordinates of a normalized address, or None"""
+    return gazetteer().lookup(location)
+
+
+def user_coordinates(user, location):
+    """(latitude, longitude) of a user from its fields or normalized address"""
+    try:
+        latitude = float(user.get("latitude"))
+        longitude = float(user.get("longitude"))
+        if np.isfinite(latitude) and np.isfinite(longitude):
+            return latitude, longitude
+    except (TypeError, ValueError):
+        pass
+    return place_coordinates(location)
+
+
+def tutor_coordinates(tutors, locations):
+    """(n, 2) array of tutor latitudes and longitudes, NaN where unknown
+
+    ``locations`` are the tutors' normalized addresses, used for tutors
+    without usable ``latitude``/``longitude`` columns.
+    """
+    coordinates = np.full((len(tutors), 2), np.nan)
+    for axis, column in enumerate(("latitude", "longitude")):
+        if column in tutors.columns:
+            coordinates[:, axis] = np.asarray(
+                [number_or_nan(value) for value in tutors[column].tolist()])
+    coordinates[np.isnan(coordinates).any(axis=1)] = np.nan
+
+    for row in np.flatnonzero(np.isnan(coordinates[:, 0])):
+        place = place_coordinates(locations[row])
+        if place is not None:
+            coordinates[row] = place
+    return coordinates
+
+
+def number_or_nan(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points, in km"""
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distance_scores(position, coordinates):
+    """Location scores for tutor ``coordinates`` seen from a user ``position``"""
+    distances = haversine_km(position[0], position[1],
+                             coordinates[:, 0], coordinates[:, 1])
+    return np.clip(1 - distances / RADIUS_KM, 0, 1)
+
+
+def unit_vectors(coordinates):
+    """Points on the unit sphere, where chord length grows with distance"""
+    latitudes = np.radians(coordinates[:, 0])
+    longitudes = np.radians(coordinates[:, 1])
+    return np.column_stack((np.cos(latitudes) * np.cos(longitudes),
+                            np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)))
+
+
+class SpatialIndex:
+    """k-d tree over the located tutors, for radius queries"""
+
+    def __init__(self, coordinates):
+        self.rows = np.flatnonzero(~np.isnan(coordinates[:, 0]))
+        self.tree = (cKDTree(unit_vectors(coordinates[self.rows]))
+                     if len(self.rows) else None)
+
+    def within(self, position, radius_km=RADIUS_KM):
+        """Sorted rows of the tutors within ``radius_km`` of ``position``"""
+        if self.tree is None:
+            return np.array([], dtype=np.int64)
+        # Chord matching the radius, widened slightly so rounding never
+        # drops a tutor the haversine distance would keep
+        chord = 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM)) * (1 + 1e-6)
+        hits = self.tree.query_ball_point(
+            unit_vectors(np.array([position]))[0], chord)
+        return np.sort(self.rows[hits])
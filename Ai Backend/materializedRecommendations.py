@@ -0,0 +1,318 @@
+"""Per-student recommendations materialized in SQLite, refreshed on change
+
+Students open their dashboard far more often than tutors or profiles
+change. With RECOMMENDATION_MATERIALIZE_PATH set, students registered
+through PUT /students get their first page of index recommendations
+stored, and GET /students/<id>/recommendations is a key lookup.
+
+A background thread recomputes only the students a change can affect:
+
+profile edit
+    The student whose stored profile changed.
+tutor upsert
+    Students whose stored page holds an upserted tutor, and those for whom
+    an upserted tutor now scores at least the lowest score on their page,
+    so it could enter it.
+tutor delete
+    Students whose stored page holds a deleted tutor.
+full load or refit
+    Every student, since all similarity values change.
+
+Other tutors' scores do not change when one tutor does, so no other page
+can. A marked student is served the stored page until it is recomputed.
+Recompute counts and the lag from change to refresh are exported on
+/metrics, and GET /students reports the pending backlog.
+
+Catalogue changes must reach the process that owns the store, so run
+materialization with a single worker, as for /tutors updates. A process
+forked from the one that created the store (a gunicorn worker of a
+preloaded app) does not inherit its refresh thread; it starts its own on
+start() or on the next change.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from candidateIndex import combined_scores
+from pipelineMetrics import metrics
+from recommendationCache import json_default
+from recommendationEngine import (
+    location_score_matrix,
+    subject_match_matrix,
+    DEFAULT_TOP_K,
+)
+from recommendationPipeline import recommend_from_index, filter_recommendations
+from tutorIndex import id_keys
+
+logger = logging.getLogger(__name__)
+
+# Students recomputed, or checked against changed tutors, per pass
+DEFAULT_BATCH_SIZE = 256
+
+
+class MaterializedRecommendations:
+    """Stored top-k pages of registered students and their refresh worker"""
+
+    def __init__(self, path, tutor_index, k=DEFAULT_TOP_K,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.tutor_index = tutor_index
+        self.k = k
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._forked)
+        with self._connect() as db:
+            # floor is the lowest combined score on the stored page, or
+            # NULL when the page is not full and any tutor could join it
+            db.execute("CREATE TABLE IF NOT EXISTS students ("
+                       "id TEXT PRIMARY KEY, profile TEXT NOT NULL, "
+                       "recommendations TEXT, tutor_ids TEXT, floor REAL, "
+                       "index_version INTEGER, computed_at REAL, "
+                       "dirty_since REAL, reason TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS students_dirty "
+                       "ON students (dirty_since)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def start(self):
+        """Start the refresh thread in this process, once
+
+        Students marked before it started are refreshed straight away.
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="materialize", daemon=True)
+                    self._thread.start()
+                    self._wake.set()
+        return self
+
+    def _forked(self):
+        # Only the forking thread survives a fork: the refresh thread is
+        # gone and a lock it held would never be released
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _notify(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                while self.refresh_pending():
+                    pass
+            except Exception:
+                logger.exception("Materialized recommendation refresh failed")
+
+    # Change events
+
+    def put_profiles(self, users):
+        """Register students or update their profiles; returns how many changed"""
+        now = time.time()
+        changed = 0
+        with self._lock, self._connect() as db:
+            for user in users:
+                profile = json.dumps(user, sort_keys=True, default=json_default)
+                row = db.execute("SELECT profile FROM students WHERE id = ?",
+                                 (str(user["id"]),)).fetchone()
+                if row is not None and row[0] == profile:
+                    continue
+                db.execute(
+                    "INSERT INTO students (id, profile, dirty_since, reason) "
+                    "VALUES (?, ?, ?, 'profile') ON CONFLICT (id) DO UPDATE SET "
+                    "profile = excluded.profile, "
+                    "dirty_since = COALESCE(dirty_since, excluded.dirty_since), "
+                    "reason = COALESCE(reason, excluded.reason)",
+                    (str(user["id"]), profile, now))
+                changed += 1
+        if changed:
+            self._notify()
+        return changed
+
+    def remove(self, student_id):
+        with self._lock, self._connect() as db:
+            return db.execute("DELETE FROM students WHERE id = ?",
+                              (str(student_id),)).rowcount
+
+    def index_rebuilt(self):
+        """Mark every student after a full load or refit of the index"""
+        return self._mark("rebuild", "1 = 1", ())
+
+    def tutors_deleted(self, tutor_ids, previous):
+        """Mark the students whose stored page holds a deleted tutor
+
+        ``previous`` is the index snapshot from before the delete; a new
+        TF-IDF fit changes every student's similarities, so it marks all.
+        """
+        if refitted(self.tutor_index.snapshot(), previous):
+            return self.index_rebuilt()
+        deleted = {str(tutor_id) for tutor_id in tutor_ids}
+        return self._mark_ids("tutors", [
+            student_id for student_id, _, page_ids, _ in self._fresh_students()
+            if deleted.intersection(page_ids)])
+
+    def tutors_upserted(self, tutor_ids, previous):
+        """Mark the students an upsert of ``tutor_ids`` can change
+
+        ``previous`` is the index snapshot from before the upsert, as for
+        tutors_deleted.
+        """
+        snapshot = self.tutor_index.snapshot()
+        if refitted(snapshot, previous):
+            return self.index_rebuilt()
+
+        upserted = {str(tutor_id) for tutor_id in tutor_ids}
+        rows = np.flatnonzero(id_keys(snapshot.tutors).isin(upserted).to_numpy())
+        if not len(rows):
+            return 0
+        encoded = snapshot.encoded.subset(rows)
+
+        marked = []
+        students = list(self._fresh_students())
+        for start in range(0, len(students), self.batch_size):
+            block = students[start:start + self.batch_size]
+            users = [profile for _, profile, _, _ in block]
+            # New scores of the upserted tutors, as a full scoring pass
+            # would compute them
+            scores = combined_scores(
+                snapshot.encoded, rows,
+                np.clip(location_score_matrix(users, encoded), 0, 1),
+                np.clip(subject_match_matrix(users, encoded), 0, 1))
+            for (student_id, _, page_ids, floor), student_scores in zip(block, scores):
+                if (floor is None or upserted.intersection(page_ids) or
+                        (student_scores >= floor).any()):
+                    marked.append(student_id)
+        return self._mark_ids("tutors", marked)
+
+    def _fresh_students(self):
+        """(id, profile, page tutor ids, floor) of students not yet marked"""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, profile, tutor_ids, floor FROM students "
+                "WHERE dirty_since IS NULL AND recommendations IS NOT NULL").fetchall()
+        for student_id, profile, page_ids, floor in rows:
+            yield student_id, json.loads(profile), json.loads(page_ids), floor
+
+    def _mark(self, reason, condition, parameters):
+        with self._lock, self._connect() as db:
+            marked = db.execute(
+                f"UPDATE students SET dirty_since = ?, reason = ? "
+                f"WHERE dirty_since IS NULL AND ({condition})",
+                (time.time(), reason) + tuple(parameters)).rowcount
+        if marked:
+            self._notify()
+        return marked
+
+    def _mark_ids(self, reason, student_ids):
+        marked = 0
+        for start in range(0, len(student_ids), self.batch_size):
+            block = student_ids[start:start + self.batch_size]
+            marked += self._mark(
+                reason, f"id IN ({','.join('?' * len(block))})", block)
+        return marked
+
+    # Refresh and reads
+
+    def refresh_pending(self):
+        """Recompute the longest-waiting batch of marked students
+
+        Returns how many were recomputed, 0 once none are pending.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, profile, dirty_since, reason FROM students "
+                "WHERE dirty_since IS NOT NULL ORDER BY dirty_since LIMIT ?",
+                (self.batch_size,)).fetchall()
+        for student_id, profile, dirty_since, reason in rows:
+            self._recompute(student_id, json.loads(profile), dirty_since, reason)
+        return len(rows)
+
+    def _recompute(self, student_id, user, dirty_since, reason):
+        """Score one student against the index and store the page"""
+        version = self.tutor_index.version
+        recommendations = []
+        if len(self.tutor_index):
+            recommendations, _, _ = recommend_from_index(
+                user, self.tutor_index, self.k)
+        floor = (float(np.nanmin([rec["recommendationScore"]
+                                  for rec in recommendations]))
+                 if len(recommendations) >= self.k else None)
+        page = filter_recommendations(recommendations)
+
+        now = time.time()
+        with self._lock, self._connect() as db:
+            # Changes marked while this ran keep the student marked
+            db.execute(
+                "UPDATE students SET recommendations = ?, tutor_ids = ?, "
+                "floor = ?, index_version = ?, computed_at = ?, "
+                "reason = CASE WHEN dirty_since IS ? THEN NULL ELSE reason END, "
+                "dirty_since = CASE WHEN dirty_since IS ? THEN NULL "
+                "ELSE dirty_since END WHERE id = ?",
+                (json.dumps(page, default=json_default),
+                 json.dumps([str(rec.get("id")) for rec in recommendations]),
+                 floor, version, now, dirty_since, dirty_since, student_id))
+        if dirty_since is not None:
+            metrics.count_recompute(reason or "profile", now - dirty_since)
+
+    def get(self, student_id):
+        """Stored page of a student and its state, or None if not registered
+
+        ``body`` is the page as stored JSON text, ready to send. A student
+        registered but never computed is computed now.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT profile, recommendations, computed_at, index_version, "
+                "dirty_since, reason FROM students WHERE id = ?",
+                (str(student_id),)).fetchone()
+        if row is None:
+            return None
+        profile, body, computed_at, version, dirty_since, reason = row
+        if body is None:
+            self._recompute(str(student_id), json.loads(profile),
+                            dirty_since, reason)
+            return self.get(student_id)
+        return {"body": body, "computedAt": computed_at,
+                "indexVersion": version, "pending": dirty_since is not None}
+
+    def stats(self):
+        with self._connect() as db:
+            students, pending, oldest = db.execute(
+                "SELECT COUNT(*), COUNT(dirty_since), MIN(dirty_since) "
+                "FROM students").fetchone()
+        return {"students": students, "pending": pending,
+                "oldestPendingSeconds": (round(time.time() - oldest, 3)
+                                         if oldest is not None else 0.0)}
+
+
+def refitted(snapshot, previous):
+    """Whether ``snapshot`` has another TF-IDF fit than ``previous``
+
+    Compares fit ids rather than vectorizer objects: with a feature store,
+    every update restores the same fit into a new vectorizer.
+    """
+    return fit_id(snapshot) != fit_id(previous)
+
+
+def fit_id(snapshot):
+    return getattr(snapshot.vectorizer, "fit_id", None)
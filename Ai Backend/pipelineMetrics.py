@@ -0,0 +1,261 @@
+"""Stage timers and Prometheus metrics for the recommendation pipeline
+
+Pipeline code wraps each stage in ``timed("<stage>")``. The elapsed time
+goes into the current request's summary (see requestLogging) and, unless
+RECOMMENDATION_METRICS=0, into a per-stage latency histogram. ``render``
+writes every metric in the Prometheus text format for GET /metrics.
+
+Metrics live in process memory, so each gunicorn worker reports its own.
+"""
+import os
+import threading
+import time
+
+from requestLogging import current_request
+
+METRICS_ENABLED = os.environ.get("RECOMMENDATION_METRICS", "1") != "0"
+
+# Upper bounds in seconds, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds in seconds for the time a change takes to be materialized
+REFRESH_LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0,
+                       300.0, 900.0)
+
+# Upper bounds of the recall@k of approximate retrieval
+RECALL_BUCKETS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in series]
+        for labels, counts, total, count in series:
+            base = label_text(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(
+                f"{self.name}{{{label_text(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def label_text(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def gauge_lines(name, help_text, value):
+    """Prometheus lines for a single unlabelled gauge read at render time"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge",
+            f"{name} {value}"]
+
+
+def process_memory():
+    """Resident and proportional set size of this process, in bytes
+
+    Proportional size (PSS) divides pages shared with other processes,
+    such as a memory-mapped feature store, between them, so it is what a
+    worker really adds. Read from /proc on Linux; empty elsewhere.
+    """
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    memory[field.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+def memory_gauge_lines():
+    """Gauges for process_memory, for /metrics"""
+    memory = process_memory()
+    lines = []
+    if "rss" in memory:
+        lines += gauge_lines("recommendation_process_resident_bytes",
+                             "Resident set size of this worker", memory["rss"])
+    if "pss" in memory:
+        lines += gauge_lines("recommendation_process_proportional_bytes",
+                             "Proportional set size of this worker", memory["pss"])
+    return lines
+
+
+class PipelineMetrics:
+    """Every metric the recommendation service exports"""
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.stage_seconds = Histogram(
+            "recommendation_stage_seconds",
+            "Time spent in each recommendation pipeline stage", ("stage",))
+        self.request_seconds = Histogram(
+            "recommendation_request_seconds",
+            "Time to handle a request, by route", ("route",))
+        self.requests = Counter(
+            "recommendation_requests_total",
+            "Requests handled, by route and status code", ("route", "status"))
+        self.errors = Counter(
+            "recommendation_errors_total",
+            "Requests that failed while scoring, by route", ("route",))
+        self.scored_tutors = Counter(
+            "recommendation_scored_tutors_total",
+            "Tutors scored across all requests, by route", ("route",))
+        self.recomputes = Counter(
+            "recommendation_materialized_recomputes_total",
+            "Materialized students recomputed, by the change that caused it",
+            ("reason",))
+        self.refresh_lag_seconds = Histogram(
+            "recommendation_materialized_refresh_lag_seconds",
+            "Time from a change to the refreshed recommendations, by change",
+            ("reason",), REFRESH_LAG_BUCKETS)
+        self.degraded = Counter(
+            "recommendation_degraded_total",
+            "Requests answered from the fallback ranking, by route and reason",
+            ("route", "reason"))
+        self.ann_recall = Histogram(
+            "recommendation_ann_recall",
+            "Recall@k of approximate retrieval on sampled requests, by k",
+            ("k",), RECALL_BUCKETS)
+
+    def observe_stage(self, stage, seconds):
+        if self.enabled:
+            self.stage_seconds.observe((stage,), seconds)
+
+    def observe_timings(self, timings_ms):
+        """Feed stage timings collected elsewhere (e.g. a pool process)"""
+        for stage, ms in timings_ms.items():
+            self.observe_stage(stage, ms / 1000)
+
+    def observe_request(self, route, status, seconds):
+        if self.enabled:
+            self.requests.inc((route, status))
+            self.request_seconds.observe((route,), seconds)
+
+    def count_error(self, route):
+        if self.enabled:
+            self.errors.inc((route,))
+
+    def count_scored(self, route, tutors):
+        if self.enabled and tutors:
+            self.scored_tutors.inc((route,), tutors)
+
+    def count_degraded(self, route, reason):
+        if self.enabled:
+            self.degraded.inc((route, reason))
+
+    def count_recompute(self, reason, lag_seconds):
+        if self.enabled:
+            self.recomputes.inc((reason,))
+            self.refresh_lag_seconds.observe((reason,), lag_seconds)
+
+    def observe_recall(self, k, recall):
+        if self.enabled:
+            self.ann_recall.observe((k,), recall)
+
+    def render(self, extra_lines=()):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in (self.requests, self.errors, self.request_seconds,
+                       self.stage_seconds, self.scored_tutors, self.degraded,
+                       self.recomputes, self.refresh_lag_seconds,
+                       self.ann_recall):
+            lines.extend(metric.render())
+        lines.extend(extra_lines)
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this process
+metrics = PipelineMetrics()
+
+
+def timed(stage):
+    """Time a pipeline stage: ``with timed("sort"): ...``"""
+    return StageTimer(stage)
+
+
+class StageTimer:
+    """Context manager behind ``timed``
+
+    A class rather than a generator so entering and leaving cost a couple of
+    attribute lookups on the hot path.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        metrics.observe_stage(self.stage, elapsed)
+        log = current_request()
+        if log is not None:
+            log.add_timing(self.stage, elapsed * 1000)
+        return False
+
+
+def timing_header(timings_ms, total_ms=None):
+    """Server-Timing style value: ``stage;dur=ms, ...``"""
+    parts = [f"{stage};dur={ms:.2f}" for stage, ms in timings_ms.items()]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from recommendationEngine import (
+    normalize_location,
+    select_top_k,
+    tutor_ids,
+    RESPONSE_FIELDS,
+    SCORE_COLUMNS,
+)
+
+# Columns besides the response fields and scores that pages read: reasons
+# and the per-recommendation detail log
+PAGE_COLUMNS = ("username", "location_score", "subject_match_score", "rating",
+                "subjects_list", "bookingsCount", "experience_years")
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries expire after ``ttl`` seconds
+
+    With ``maxbytes``, entries are also evicted while the sizes given to
+    set() add up to more than that.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return a live entry and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value, nbytes = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.nbytes -= nbytes
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, nbytes=0):
+        """Store an entry, evicting the least recently used ones if full
+
+        Returns False, storing nothing, for an entry larger than maxbytes.
+        """
+        if self.maxbytes is not None and nbytes > self.maxbytes:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[2]
+            self._entries[key] = (time.monotonic() + self.ttl, value, nbytes)
+            self.nbytes += nbytes
+            while len(self._entries) > self.maxsize or (
+                    self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class ScoreCursors:
+    """Scored tutor frames kept so later pages do not rescore the catalogue
+
+    A cursor is ``<token>.<offset>``: the token names the cached scores and
+    the offset is the rank the next page starts at.
+
+    A scored frame is kept in rank order with only the columns pages are
+    built from, so a page is a slice of it; the user's preferred subjects
+    are all that is kept of the profile. Entries are bounded in number,
+    age and estimated bytes (objects shared with the index count in full);
+    a frame larger than ``maxbytes`` on its own gets no cursor.
+    """
+
+    def __init__(self, maxsize=256, ttl=600, maxbytes=None):
+        self._cache = TTLCache(maxsize, ttl, maxbytes)
+
+    @property
+    def nbytes(self):
+        return self._cache.nbytes
+
+    def __len__(self):
+        return len(self._cache)
+
+    def save(self, tutors, score_column, user_data, ids):
+        """Cache a scored frame and return its token, or None if too large"""
+        token = secrets.token_urlsafe(12)
+        if isinstance(tutors, pd.DataFrame):
+            tutors = ranked_page_columns(tutors, score_column, ids)
+            user_data = {"preferredSubjects": user_data.get("preferredSubjects")}
+            nbytes = frame_nbytes(tutors)
+        else:
+            # Pages ranked on demand (CandidatePages) hold a shared snapshot
+            nbytes = 0
+        if not self._cache.set(token, (tutors, score_column, user_data), nbytes):
+            return None
+        return token
+
+    def load(self, cursor):
+        """Return (token, tutors, score_column, user_data, ids, offset)
+
+        Returns None if the cursor is malformed or its scores have expired.
+        The ids of a cached frame are its ranks, as its rows are in order.
+        """
+        token, _, offset = str(cursor).partition(".")
+        entry = self._cache.get(token)
+        if entry is None or not offset.isdigit():
+            return None
+        tutors, score_column, user_data = entry
+        ids = np.arange(len(tutors)) if isinstance(tutors, pd.DataFrame) else None
+        return (token, tutors, score_column, user_data, ids, int(offset))
+
+
+def ranked_page_columns(tutors, score_column, ids=None):
+    """The columns pages are built from, rows in rank order"""
+    if ids is None:
+        ids = tutor_ids(tutors)
+    fields = tutors.columns if RESPONSE_FIELDS is None else RESPONSE_FIELDS
+    wanted = set(fields) | set(SCORE_COLUMNS) | set(PAGE_COLUMNS)
+    columns = [column for column in tutors.columns if column in wanted]
+    order = select_top_k(tutors[score_column].to_numpy(), ids, len(tutors))
+    return tutors[columns].take(order).reset_index(drop=True)
+
+
+def frame_nbytes(frame, sample=256):
+    """Estimated size of a frame, its objects sized from the first rows"""
+    nbytes = frame.memory_usage(index=False).sum()
+    head = frame.head(sample)
+    if len(head):
+        objects = (head.memory_usage(index=False, deep=True).sum() -
+                   head.memory_usage(index=False).sum())
+        nbytes += objects * len(frame) // len(head)
+    return int(nbytes)
+
+
+def make_cursor(token, offset):
+    return f"{token}.{offset}"
+
+
+class DiskTTLCache:
+    """SQLite-backed counterpart of TTLCache for values that are plain JSON
+
+    Survives restarts and can be shared by several worker processes on the
+    same host.
+    """
+
+    def __init__(self, path, maxsize=1024, ttl=300):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                       "key TEXT PRIMARY KEY, value TEXT, "
+                       "expires_at REAL, used_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value, expires_at FROM cache WHERE key = ?",
+                             (key,)).fetchone()
+            if row is None:
+                return default
+            if row[1] < now:
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return default
+            db.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        encoded = json.dumps(value, default=json_default)
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                       (key, encoded, now + self.ttl, now))
+            # Drop expired rows, then the least recently used beyond maxsize
+            db.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            evicted = db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,)).rowcount
+            self.evictions += max(evicted, 0)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return value
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM cache")
+
+
+def json_default(value):
+    """Serialize numpy scalars (and anything else) found in responses"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class ResponseCache:
+    """Recommendation responses keyed on the user profile and catalogue version
+
+    Only the profile fields that affect scoring are part of the key, so a
+    dashboard reload with an unchanged profile and catalogue is a lookup.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def clear(self):
+        """Drop every cached response, e.g. after the catalogue changes"""
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "size": len(self.backend),
+            "maxSize": self.backend.maxsize,
+            "ttl": self.backend.ttl,
+            "backend": type(self.backend).__name__,
+        }
+
+
+def profile_fingerprint(user, catalogue_version, k):
+    """Stable hash of the scoring-relevant user fields, catalogue and page size"""
+    key = {
+        "address": normalize_location(user.get("address", "")),
+        "grade": (user.get("grade") or "").lower(),
+        # Kept as sent: order and case show up in the recommendation reasons
+        "preferredSubjects": user.get("preferredSubjects") or [],
+        "catalogue": catalogue_version,
+        "k": k,
+    }
+    # Coordinates sent with the profile are used by geo location scoring
+    if user.get("latitude") is not None or user.get("longitude") is not None:
+        key["coordinates"] = [user.get("latitude"), user.get("longitude")]
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def catalogue_fingerprint(tutors_data):
+    """Hash of a tutor list sent with a request, used as its version"""
+    return hashlib.sha256(
+        json.dumps(tutors_data, sort_keys=True, default=str).encode()).hexdigest()
@@ -0,0 +1,1324 @@
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import TfidfTransformer
+import os
+import re
+import logging
+import secrets
+from functools import lru_cache
+
+from requestLogging import detail_level
+from pipelineMetrics import timed
+from geoLocation import GEO_MODE, tutor_coordinates, user_coordinates, distance_scores
+
+logger = logging.getLogger(__name__)
+
+# Number of recommendations returned when a request does not ask for k
+DEFAULT_TOP_K = 10
+
+# Tutor fields returned with each recommendation: those the Node backend
+# sends. RECOMMENDATION_RESPONSE_FIELDS overrides them with a comma-separated
+# list, or "all" to return every column, internal ones included
+TUTOR_FIELDS = ("id", "username", "subjects", "gradeLevels", "subjectDetails",
+                "address", "rating", "bookingsCount", "experience", "education",
+                "description", "teachingLocation", "image", "isAvailable",
+                "recentActivity", "completionRate")
+_response_fields = os.environ.get("RECOMMENDATION_RESPONSE_FIELDS", "")
+RESPONSE_FIELDS = (None if _response_fields == "all" else
+                   tuple(f.strip() for f in _response_fields.split(",") if f.strip())
+                   or TUTOR_FIELDS)
+# Score columns returned alongside the fields when a tutor frame has them
+SCORE_COLUMNS = ("combined_score", "weighted_score", "cosine_similarity",
+                 "rating_score", "popularity_score", "experience_score",
+                 "availability_score")
+
+# Experience parsing, compiled once
+YEARS_PATTERN = re.compile(r'(\d+)\s*(?:year|yr)')
+NUMBER_PATTERN = re.compile(r'\d+')
+EXPERIENCE_MAPPING = {
+    'fresher': 0.5,
+    '0-1': 0.5,
+    '1-2': 1.5,
+    '2-5': 3.5,
+    '5+': 6.0
+}
+
+
+def preprocess_tutor_data(tutors):
+    """Ensure tutors data has proper format for subjects and gradeLevels"""
+
+    # Handle subjects - ensure it's a list and join for feature creation
+    if 'subjects' in tutors.columns:
+        # Convert string representation to lists if needed
+        tutors['subjects_list'] = tutors['subjects'].apply(
+            lambda x: x if isinstance(x, list) else [
+                x] if isinstance(x, str) else []
+        )
+        # Create a string version for feature creation
+        tutors['subjects_str'] = tutors['subjects_list'].apply(
+            lambda x: ", ".join(x) if x else ""
+        )
+    else:
+        tutors['subjects_list'] = [[] for _ in range(len(tutors))]
+        tutors['subjects_str'] = ""
+
+    # Handle grade levels - ensure it's a list and join for feature creation
+    if 'gradeLevels' in tutors.columns:
+        # Convert string representation to lists if needed
+        tutors['gradeLevels_list'] = tutors['gradeLevels'].apply(
+            lambda x: x if isinstance(x, list) else [
+                x] if isinstance(x, str) else []
+        )
+        # Create a string version for feature creation
+        tutors['gradeLevels_str'] = tutors['gradeLevels_list'].apply(
+            lambda x: ", ".join(x) if x else ""
+        )
+    else:
+        tutors['gradeLevels_list'] = [[] for _ in range(len(tutors))]
+        tutors['gradeLevels_str'] = ""
+
+    # Convert bookingsCount to numeric for popularity ranking
+    if 'bookingsCount' in tutors.columns:
+        tutors['bookingsCount'] = compact_counts(pd.to_numeric(
+            tutors['bookingsCount'], errors='coerce').fillna(0))
+
+    # Normalize experience field for ranking; float32 holds every parsed
+    # value (whole and half years) exactly
+    if 'experience' in tutors.columns:
+        tutors['experience_years'] = experience_years_column(
+            tutors['experience'].tolist())
+    else:
+        tutors['experience_years'] = np.zeros(len(tutors), dtype=np.float32)
+
+    # Add availability as a feature
+    if 'isAvailable' in tutors.columns:
+        tutors['availability_score'] = np.fromiter(
+            (1.0 if x else 0.0 for x in tutors['isAvailable']),
+            dtype=np.float32, count=len(tutors))
+    else:
+        tutors['availability_score'] = np.zeros(len(tutors), dtype=np.float32)
+
+    return tutors
+
+
+def compact_counts(counts):
+    """Store whole-number counts as int32 instead of float64"""
+    values = counts.to_numpy(dtype=np.float64)
+    if len(values) and np.all(values == np.round(values)) and \
+            np.abs(values).max() < 2 ** 31:
+        return values.astype(np.int32)
+    return values
+
+
+def extract_years_from_experience(exp_str):
+    """Extract number of years from experience text"""
+    if not isinstance(exp_str, str):
+        return 0
+    return years_from_experience_text(exp_str)
+
+
+# Experience comes from a handful of distinct strings, so results are
+# memoized across tutors and requests
+@lru_cache(maxsize=4096)
+def years_from_experience_text(exp_str):
+    """Parse a single experience string (see extract_years_from_experience)"""
+    lowered = exp_str.lower()
+
+    # Look for numbers followed by "year" or "yr"
+    match = YEARS_PATTERN.search(lowered)
+    if match:
+        return int(match.group(1))
+
+    # Check if experience string matches any of our mappings
+    for key, value in EXPERIENCE_MAPPING.items():
+        if key in lowered:
+            return value
+
+    # If no match, check if experience contains any numbers
+    match = NUMBER_PATTERN.search(exp_str)
+    if match:
+        # Take the first number as an approximation
+        return int(match.group())
+
+    return 0
+
+
+def experience_years_column(values):
+    """Years of experience per tutor as float32, parsing each distinct value once"""
+    parsed = {}
+    years = np.zeros(len(values), dtype=np.float32)
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            if value not in parsed:
+                parsed[value] = years_from_experience_text(value)
+            years[i] = parsed[value]
+    return years
+
+
+def create_feature_vectors(tutors, user, encoded=None):
+    """Create feature vectors for tutors that emphasize relevant attributes"""
+
+    # Location similarity of every tutor to the user in one vectorized pass
+    if encoded is None:
+        encoded = EncodedTutors(tutors)
+    loc_similarities = location_score_matrix([user], encoded)[0]
+
+    # Extract features from tutors DataFrame
+    features = []
+    for position, (_, tutor) in enumerate(tutors.iterrows()):
+        # Create a weighted feature string
+        feature_parts = []
+
+        # Add subjects with moderate weight
+        subjects_str = tutor.get("subjects_str", "").lower()
+        feature_parts.append(subjects_str)
+
+        # Get list of subjects for exact matching
+        subject_list = tutor.get("subjects_list", [])
+        if isinstance(subject_list, list):
+            subject_list_lower = [s.lower()
+                                  for s in subject_list if isinstance(s, str)]
+        else:
+            subject_list_lower = []
+
+        # Process preferred subjects with medium emphasis (priority #3)
+        if "preferredSubjects" in user and user["preferredSubjects"]:
+            for subject in user["preferredSubjects"]:
+                subject_lower = subject.lower()
+
+                # Check for exact matches in subject list
+                if any(s == subject_lower or subject_lower in s for s in subject_list_lower):
+                    # Medium weight for subject matches
+                    feature_parts.extend([subject_lower] * 3)
+
+                # Also check in detailed subject names for exact matches
+                if "subjectDetails" in tutor and isinstance(tutor["subjectDetails"], list):
+                    exact_matches = [
+                        detail.get("name", "").lower()
+                        for detail in tutor["subjectDetails"]
+                        if detail.get("name", "").lower() == subject_lower
+                    ]
+
+                    # If we have exact matches in the subject details, add emphasis
+                    if exact_matches:
+                        feature_parts.extend([subject_lower] * 3)
+
+        # Add grade levels
+        feature_parts.append(tutor.get("gradeLevels_str", "").lower())
+
+        # Add user grade (if relevant)
+        if "grade" in user and user["grade"]:
+            user_grade = user["grade"].lower()
+            grade_levels_str = tutor.get("gradeLevels_str", "").lower()
+
+            if user_grade in grade_levels_str:
+                feature_parts.extend([user_grade] * 2)
+
+        # Add location features (normalized) with highest emphasis (priority #1)
+        tutor_location = normalize_location(tutor.get("address", ""))
+
+        # Location similarity precomputed for all tutors above
+        loc_similarity = loc_similarities[position]
+
+        # If locations match at area level, give very high emphasis
+        if loc_similarity > 0.5:
+            # Add multiple copies to heavily emphasize location - highest priority
+            feature_parts.extend([tutor_location] * 6)
+        elif loc_similarity > 0.3:
+            feature_parts.extend([tutor_location] * 4)
+        else:
+            feature_parts.append(tutor_location)
+
+        # Add rating with high emphasis (priority #2)
+        if "rating" in tutor:
+            try:
+                rating_val = float(tutor["rating"])
+                # Add rating based emphasis (more stars = more emphasis)
+                if rating_val >= 4.5:
+                    feature_parts.extend(["high_rating"] * 5)
+                elif rating_val >= 4.0:
+                    feature_parts.extend(["good_rating"] * 4)
+                elif rating_val >= 3.5:
+                    feature_parts.extend(["average_rating"] * 3)
+            except (ValueError, TypeError):
+                pass
+
+        # Add popularity/booking count with low-medium emphasis (priority #4)
+        if "bookingsCount" in tutor:
+            try:
+                bookings = int(tutor["bookingsCount"])
+                if bookings > 20:
+                    feature_parts.extend(["popular_tutor"] * 2)
+                elif bookings > 10:
+                    feature_parts.append("experienced_tutor")
+            except (ValueError, TypeError):
+                pass
+
+        # Add teaching experience with low emphasis (priority #5)
+        if "experience_years" in tutor:
+            try:
+                years = int(tutor["experience_years"])
+                if years > 5:
+                    feature_parts.append("veteran_teacher")
+                elif years > 3:
+                    feature_parts.append("experienced_teacher")
+                elif years > 1:
+                    feature_parts.append("qualified_teacher")
+            except (ValueError, TypeError):
+                pass
+
+        # Add availability as a feature
+        if tutor.get('availability_score', 0) > 0:
+            feature_parts.append("available_now")
+
+        # Combine all features
+        features.append(" ".join(feature_parts))
+
+    return features
+
+
+# Same tokenization as TfidfVectorizer's default analyzer
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+class FeatureVocabulary:
+    """Unigram/bigram vocabulary with cached token counts per feature segment
+
+    A segment is one piece of a tutor's feature text (its subjects, its
+    location, a rating token, ...). Each distinct segment is tokenized once.
+    """
+
+    def __init__(self):
+        self.terms = {}
+        self.term_list = []
+        self._segments = {}
+        self._pairs = {}
+
+    def __len__(self):
+        return len(self.term_list)
+
+    def __getstate__(self):
+        # The per-segment and bigram caches are rebuilt as they are used
+        return {"term_list": self.term_list}
+
+    def __setstate__(self, state):
+        self.term_list = state["term_list"]
+        self.terms = {term: term_id for term_id, term in enumerate(self.term_list)}
+        self._segments = {}
+        self._pairs = {}
+
+    def term_id(self, term, grow=True):
+        """Return the column of a term, adding it unless ``grow`` is False"""
+        term_id = self.terms.get(term)
+        if term_id is None and grow:
+            term_id = self.terms[term] = len(self.term_list)
+            self.term_list.append(term)
+        return term_id
+
+    def segment(self, text):
+        """Term ids/counts and first/last token ids of a segment of text"""
+        cached = self._segments.get(text)
+        if cached is None:
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            counts = {}
+            for term in tokens + [" ".join(pair) for pair in zip(tokens, tokens[1:])]:
+                term_id = self.term_id(term)
+                counts[term_id] = counts.get(term_id, 0) + 1
+            first = self.term_id(tokens[0]) if tokens else -1
+            last = self.term_id(tokens[-1]) if tokens else -1
+            cached = (np.array(list(counts), dtype=np.int64),
+                      np.array(list(counts.values()), dtype=np.float64),
+                      first, last)
+            self._segments[text] = cached
+        return cached
+
+    def pair_id(self, left, right):
+        """Term id of the bigram formed by two unigram term ids"""
+        key = (left, right)
+        pair_id = self._pairs.get(key)
+        if pair_id is None:
+            pair_id = self._pairs[key] = self.term_id(
+                f"{self.term_list[left]} {self.term_list[right]}")
+        return pair_id
+
+    def count_texts(self, texts, grow=True):
+        """Unigram and bigram counts of whole texts as a CSR matrix"""
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            for term in tokens + [" ".join(pair) for pair in zip(tokens, tokens[1:])]:
+                term_id = self.term_id(term, grow)
+                if term_id is not None:
+                    rows.append(row)
+                    cols.append(term_id)
+                    values.append(1.0)
+        return sp.csr_matrix((values, (rows, cols)),
+                             shape=(len(texts), len(self)))
+
+
+def feature_segments(tutors, user, encoded):
+    """Feature segments of every tutor as (codes, texts, repeat counts) columns
+
+    Mirrors the order and weights used by create_feature_vectors, with the
+    repetition of a token expressed as a count instead of a longer string.
+    Each tutor's text for a segment is ``texts[codes[row]]``.
+    """
+    n_tutors = len(tutors)
+    ones = np.ones(n_tutors, dtype=np.int64)
+    segments = []
+
+    # Subjects
+    segments.append(text_segment(column_values(tutors, "subjects_str"), ones))
+
+    # Preferred subjects taught by the tutor
+    if "preferredSubjects" in user and user["preferredSubjects"]:
+        list_sets = (tutor_subject_set(subjects, None)
+                     for subjects in column_values(tutors, "subjects_list"))
+        list_vocab = {}
+        list_matrix = token_matrix(list_sets, list_vocab)
+        list_names = sorted(list_vocab, key=list_vocab.get)
+
+        detail_sets = (tutor_subject_set(None, details)
+                       for details in column_values(tutors, "subjectDetails"))
+        detail_vocab = {}
+        detail_matrix = token_matrix(detail_sets, detail_vocab)
+
+        for subject in user["preferredSubjects"]:
+            subject_lower = subject.lower()
+
+            # Any subject in the list equal to or containing the preference
+            contains = np.array([subject_lower in name for name in list_names],
+                                dtype=np.float64)
+            list_hits = list_matrix @ contains > 0
+            segments.append(constant_segment(
+                subject_lower, np.where(list_hits, 3, 0)))
+
+            # Exact match in the detailed subject names
+            detail_column = detail_vocab.get(subject_lower)
+            if detail_column is None:
+                detail_hits = np.zeros(n_tutors, dtype=bool)
+            else:
+                detail_hits = detail_matrix[:, detail_column].toarray().ravel() > 0
+            segments.append(constant_segment(
+                subject_lower, np.where(detail_hits, 3, 0)))
+
+    # Grade levels
+    grade_segment = text_segment(column_values(tutors, "gradeLevels_str"), ones)
+    segments.append(grade_segment)
+
+    # User grade taught by the tutor
+    if "grade" in user and user["grade"]:
+        user_grade = user["grade"].lower()
+        grade_codes, grade_texts, _ = grade_segment
+        grade_hits = np.array([user_grade in text for text in grade_texts],
+                              dtype=bool)
+        segments.append(constant_segment(
+            user_grade, np.where(grade_hits[grade_codes], 2, 0)))
+
+    # Location, emphasized by its similarity to the user
+    loc_similarities = location_score_matrix([user], encoded)[0]
+    segments.append(text_segment(
+        encoded.locations,
+        np.select([loc_similarities > 0.5, loc_similarities > 0.3], [6, 4], 1)))
+
+    # Rating
+    if "rating" in tutors.columns:
+        ratings = pd.to_numeric(tutors["rating"], errors="coerce").to_numpy()
+        segments.append(categorical_segment(
+            [ratings >= 4.5, ratings >= 4.0, ratings >= 3.5],
+            [("high_rating", 5), ("good_rating", 4), ("average_rating", 3)]))
+
+    # Popularity
+    if "bookingsCount" in tutors.columns:
+        bookings = np.trunc(pd.to_numeric(
+            tutors["bookingsCount"], errors="coerce").to_numpy())
+        segments.append(categorical_segment(
+            [bookings > 20, bookings > 10],
+            [("popular_tutor", 2), ("experienced_tutor", 1)]))
+
+    # Teaching experience
+    if "experience_years" in tutors.columns:
+        years = np.trunc(pd.to_numeric(
+            tutors["experience_years"], errors="coerce").to_numpy())
+        segments.append(categorical_segment(
+            [years > 5, years > 3, years > 1],
+            [("veteran_teacher", 1), ("experienced_teacher", 1),
+             ("qualified_teacher", 1)]))
+
+    # Availability
+    available = numeric_column(tutors, "availability_score") > 0
+    segments.append(constant_segment(
+        "available_now", available.astype(np.int64)))
+
+    return segments
+
+
+def text_segment(values, repeats):
+    """Segment column from per-tutor text, lowercased once per distinct value"""
+    codes, distinct = pd.factorize(pd.Series(values, dtype=object),
+                                   use_na_sentinel=False)
+    return codes, [str(text).lower() for text in distinct], repeats
+
+
+def constant_segment(text, repeats):
+    """Segment column where every tutor shares the same text"""
+    return np.zeros(len(repeats), dtype=np.int64), [text], repeats
+
+
+def categorical_segment(conditions, choices):
+    """Segment column picking the first (token, repeat) whose condition holds"""
+    codes = np.select(conditions, list(range(len(choices))), len(choices))
+    repeats = np.select(conditions, [repeat for _, repeat in choices], 0)
+    return codes, [token for token, _ in choices] + [""], repeats
+
+
+def build_feature_counts(tutors, user, vocabulary, encoded=None):
+    """Columnar replacement for create_feature_vectors returning term counts
+
+    Produces, as a sparse matrix, the same unigram and bigram counts that
+    TfidfVectorizer(ngram_range=(1, 2)) would extract from the joined
+    feature strings, without building or re-tokenizing those strings.
+    """
+    if encoded is None:
+        encoded = EncodedTutors(tutors)
+    return segment_counts(
+        feature_segments(tutors, user, encoded), vocabulary, len(tutors))
+
+
+def segment_counts(segments, vocabulary, n_tutors, count=True):
+    """Term counts of tutors from their feature segments (see feature_segments)
+
+    Terms are added to ``vocabulary`` as they are met. With ``count`` False
+    only that is done, in the same order, so that once the vocabulary holds
+    every term of a catalogue, ranges of its tutors can be counted apart
+    with the term ids a single pass would give (see shardedScoring).
+    """
+    rows_all = np.arange(n_tutors)
+    blocks = []
+    previous_last = np.full(n_tutors, -1, dtype=np.int64)
+
+    for codes, texts, repeats in segments:
+        # Each distinct text is tokenized once (and cached in the vocabulary)
+        parsed = [vocabulary.segment(text) for text in texts]
+        firsts = np.array([p[2] for p in parsed], dtype=np.int64)
+        lasts = np.array([p[3] for p in parsed], dtype=np.int64)
+
+        present = (repeats > 0) & (firsts[codes] >= 0)
+        if not present.any():
+            continue
+
+        first = firsts[codes]
+        last = lasts[codes]
+        # Bigrams where a repeated segment wraps onto itself, and across the
+        # boundary with the previous non-empty segment
+        wrapped = present & (repeats > 1)
+        joined = present & (previous_last >= 0)
+
+        if count:
+            # Unigram and in-segment bigram counts, scaled by the repeat count
+            segment_rows = sp.csr_matrix(
+                (np.concatenate([p[1] for p in parsed]),
+                 np.concatenate([p[0] for p in parsed]),
+                 np.concatenate([[0], np.cumsum([len(p[0]) for p in parsed])])),
+                shape=(len(parsed), len(vocabulary)))
+            selector = sp.csr_matrix(
+                (repeats[present].astype(np.float64),
+                 (rows_all[present], codes[present])),
+                shape=(n_tutors, len(parsed)))
+            blocks.append((selector @ segment_rows).tocoo())
+
+            blocks.append(pair_counts(
+                vocabulary, n_tutors, rows_all[wrapped], last[wrapped],
+                first[wrapped], repeats[wrapped] - 1))
+            blocks.append(pair_counts(
+                vocabulary, n_tutors, rows_all[joined], previous_last[joined],
+                first[joined], np.ones(joined.sum())))
+        else:
+            pair_ids(vocabulary, last[wrapped], first[wrapped])
+            pair_ids(vocabulary, previous_last[joined], first[joined])
+
+        previous_last = np.where(present, last, previous_last)
+
+    if not count:
+        return None
+    counts = sp.csr_matrix((n_tutors, len(vocabulary)))
+    if blocks:
+        # Blocks are dropped once joined, before the CSR copy is made
+        data = np.concatenate([b.data for b in blocks])
+        rows = np.concatenate([b.row for b in blocks])
+        columns = np.concatenate([b.col for b in blocks])
+        del blocks
+        counts = sp.csr_matrix((data, (rows, columns)),
+                               shape=(n_tutors, len(vocabulary)))
+    return counts
+
+
+def pair_counts(vocabulary, n_tutors, rows, left, right, counts):
+    """COO block of bigram counts for (left, right) unigram term id pairs"""
+    if not len(rows):
+        return sp.coo_matrix((n_tutors, len(vocabulary)))
+    columns = pair_ids(vocabulary, left, right)
+    return sp.coo_matrix(
+        (np.asarray(counts, dtype=np.float64), (rows, columns)),
+        shape=(n_tutors, len(vocabulary)))
+
+
+def pair_ids(vocabulary, left, right):
+    """Bigram term ids of (left, right) unigram term id pairs
+
+    New bigrams are added to the vocabulary in pair order.
+    """
+    # Encode each pair as one integer so np.unique works on a flat array
+    width = len(vocabulary)
+    unique_pairs, inverse = np.unique(left * width + right, return_inverse=True)
+    ids = np.array([vocabulary.pair_id(int(pair // width), int(pair % width))
+                    for pair in unique_pairs], dtype=np.int64)
+    return ids[inverse.ravel()]
+
+
+class FeatureVectorizer:
+    """TF-IDF over columnar tutor term counts with a TfidfVectorizer-like API
+
+    Once fitted, terms the vocabulary picks up later (from tutors added
+    with ``transform_tutors``) have no IDF weight and are left out until
+    the next fit.
+
+    ``fit_id`` names the fit. It is saved and restored with the weights, so
+    a restored copy of a fit can be told apart from a new fit.
+    """
+
+    def __init__(self):
+        self.vocabulary = FeatureVocabulary()
+        self.transformer = TfidfTransformer()
+        self.fit_id = None
+
+    @classmethod
+    def restore(cls, terms, idf, fit_id=None):
+        """Vectorizer fitted earlier, from its vocabulary and IDF weights"""
+        vectorizer = cls()
+        for term in terms:
+            vectorizer.vocabulary.term_id(term)
+        vectorizer.transformer.idf_ = idf
+        vectorizer.fit_id = fit_id
+        return vectorizer
+
+    @property
+    def fitted_terms(self):
+        return len(self.transformer.idf_)
+
+    def fit_transform(self, tutors, user, encoded=None, user_vector=None,
+                      tutor_counts=None):
+        """Fit IDF weights on the tutors (and the user vector, placed first)
+
+        ``tutor_counts`` are the tutors' term counts if they were already
+        built with this vectorizer's vocabulary.
+        """
+        with timed("features"):
+            if tutor_counts is None:
+                tutor_counts = build_feature_counts(
+                    tutors, user, self.vocabulary, encoded)
+            rows = [tutor_counts]
+            if user_vector is not None:
+                rows.insert(0, self.vocabulary.count_texts([user_vector]))
+            for counts in rows:
+                counts.resize((counts.shape[0], len(self.vocabulary)))
+        with timed("tfidf"):
+            self.fit_id = secrets.token_hex(8)
+            return self.transformer.fit_transform(sp.vstack(rows).tocsr())
+
+    def transform(self, texts):
+        """TF-IDF rows for texts, ignoring terms outside the fitted vocabulary"""
+        with timed("tfidf"):
+            counts = self.vocabulary.count_texts(texts, grow=False)
+            return self.transformer.transform(counts[:, :self.fitted_terms])
+
+    def transform_tutors(self, tutors, encoded=None):
+        """TF-IDF rows for more tutors with the fitted vocabulary and weights"""
+        with timed("features"):
+            counts = build_feature_counts(tutors, {}, self.vocabulary, encoded)
+        with timed("tfidf"):
+            return self.transformer.transform(counts[:, :self.fitted_terms])
+
+
+def normalized_similarity(user_tfidf, tfidf_matrix):
+    """Cosine similarity of L2-normalized TF-IDF rows as one sparse product
+
+    Same as cosine_similarity, which would normalize the whole tutor matrix
+    again on every call; results can differ from it in the last bits only.
+    """
+    return (user_tfidf @ tfidf_matrix.T).toarray()
+
+
+def create_user_vector(user):
+    """Create a feature vector for user preferences with weights matching our priority"""
+    feature_parts = []
+
+    # Location - highest priority (#1)
+    if "address" in user and user["address"]:
+        location = normalize_location(user["address"])
+        # Add multiple times to give location the highest weight
+        feature_parts.extend([location] * 6)
+
+    # Rating preference is implicit (always prioritized - #2)
+    feature_parts.extend(["high_rating"] * 4)
+
+    # Preferred subjects - medium priority (#3)
+    if "preferredSubjects" in user and user["preferredSubjects"]:
+        for subject in user["preferredSubjects"]:
+            # Add with medium emphasis
+            feature_parts.extend([subject.lower()] * 3)
+
+    # Popularity is implicit (medium-low priority - #4)
+    feature_parts.append("popular_tutor")
+
+    # Experience is lowest priority (#5)
+    feature_parts.append("experienced_teacher")
+
+    # Add user's grade
+    if "grade" in user and user["grade"]:
+        feature_parts.append(user["grade"].lower())
+
+    # Add availability preference (users generally prefer available tutors)
+    feature_parts.append("available_now")
+
+    # Return the combined user preference vector
+    return " ".join(feature_parts)
+
+
+def normalize_location(address):
+    """Extract and normalize location information"""
+    if not isinstance(address, str):
+        return ""
+
+    # Convert to lowercase
+    address = address.lower()
+
+    # Remove common words, punctuation
+    address = re.sub(r'[^\w\s]', ' ', address)
+
+    # Return normalized address
+    return address.strip()
+
+
+def location_similarity(loc1, loc2):
+    """Calculate simple location similarity score"""
+    # Handle empty strings
+    if not loc1 or not loc2:
+        return 0
+
+    # Count common words
+    words1 = set(loc1.split())
+    words2 = set(loc2.split())
+
+    common = words1.intersection(words2)
+
+    if not words1 or not words2:
+        return 0
+
+    # Return Jaccard similarity
+    return len(common) / len(words1.union(words2))
+
+
+def compute_recommendations(user_vector, tutors, user_data, similarities=None,
+                            encoded=None, k=DEFAULT_TOP_K, offset=0):
+    """Compute and return recommendations based on similarity with updated weights
+
+    When ``similarities`` is given (e.g. from a TutorIndex) the per-request
+    TF-IDF fit is skipped and those cosine scores are used instead.
+    ``encoded`` reuses tutor token matrices that were already built.
+    Scores are left on ``tutors`` so later pages can be served from them;
+    ``offset`` returns ranks offset..offset+k instead of the first page.
+    """
+    try:
+        if encoded is None:
+            encoded = EncodedTutors(tutors)
+        score_column = score_tutors(
+            user_vector, tutors, user_data, similarities, encoded)
+        return recommendations_page(
+            tutors, score_column, user_data, k, offset, encoded.ids)
+
+    except Exception as e:
+        logger.error("Error in compute_recommendations: %s", e)
+        # Rank by rating as fallback
+        if "rating" in tutors.columns:
+            tutors["score"] = tutors["rating"].astype(float)
+            top = select_top_k(
+                tutors["score"].to_numpy(), tutor_ids(tutors), k, offset)
+            recommended = tutors.iloc[top]
+            return recommended.to_dict(orient="records")
+        else:
+            # Return first tutors if we can't sort
+            return tutors.iloc[offset:offset + k].to_dict(orient="records")
+
+
+def score_tutors(user_vector, tutors, user_data, similarities, encoded):
+    """Add component and final scores to ``tutors``; return the score column"""
+    # Location and subject scores for all tutors as arrays
+    with timed("match"):
+        location_scores = location_score_matrix([user_data], encoded)[0]
+        subject_scores = subject_match_matrix([user_data], encoded)[0]
+
+    # If user vector is empty, use a ranking based on our priority criteria
+    if not user_vector.strip():
+        logger.warning(
+            "Empty user vector, using weighted criteria-based recommendation")
+
+        # Calculate weighted score based on our priorities
+        tutors["weighted_score"] = (
+            # Location (30%)
+            location_scores * 0.30 +
+            tutors["rating"].astype(float) / 5.0 * 0.25 +  # Rating (25%)
+            # Subject (20%)
+            subject_scores * 0.20 +
+            # Popularity (10%, capped at 100 bookings)
+            tutors["bookingsCount"] / 100 * 0.10 +
+            # Experience (5%, capped at 10 years)
+            tutors["experience_years"].astype(float) / 10 * 0.05 +
+            # Availability (10%)
+            tutors["availability_score"].astype(float) * 0.10
+        )
+        return "weighted_score"
+
+    if similarities is None:
+        similarities = fitted_similarities(
+            user_vector, tutors, user_data, encoded)
+
+    with timed("scoring"):
+        # Add similarity scores to DataFrame
+        tutors["cosine_similarity"] = similarities
+
+        # Calculate individual component scores, capped at 1.0; rating,
+        # popularity and experience are precomputed on the encoded tutors
+        location_scores = np.clip(location_scores, 0, 1)
+        subject_scores = np.clip(subject_scores, 0, 1)
+        tutors["location_score"] = location_scores
+        tutors["rating_score"] = encoded.rating_score
+        tutors["subject_match_score"] = subject_scores
+        tutors["popularity_score"] = encoded.popularity_score
+        tutors["experience_score"] = encoded.experience_score
+
+        # Calculate weighted final score with our priority weights
+        tutors["combined_score"] = (
+            location_scores * 0.30 +                # Location (30%)
+            encoded.rating_score * 0.25 +           # Rating (25%)
+            subject_scores * 0.20 +                 # Subject (20%)
+            encoded.popularity_score * 0.10 +       # Popularity (10%)
+            encoded.experience_score * 0.05 +       # Experience (5%)
+            encoded.availability_score * 0.10       # Availability (10%)
+        )
+    return "combined_score"
+
+
+def fitted_similarities(user_vector, tutors, user_data, encoded,
+                        vectorizer=None, tutor_counts=None):
+    """Cosine similarity of the user vector to each tutor, fitting TF-IDF on both
+
+    ``vectorizer`` and ``tutor_counts`` are passed to fit_transform when the
+    tutors' term counts were built beforehand.
+    """
+    # TF-IDF over term counts built straight from the tutor columns,
+    # with the user vector first as in the original corpus
+    if vectorizer is None:
+        vectorizer = FeatureVectorizer()
+    tfidf_matrix = vectorizer.fit_transform(
+        tutors, user_data, encoded, user_vector, tutor_counts)
+
+    # Extract user vector and tutor matrix
+    user_tfidf = tfidf_matrix[0]
+    tutors_tfidf = tfidf_matrix[1:]
+
+    # Compute similarity
+    with timed("similarity"):
+        return cosine_similarity(user_tfidf, tutors_tfidf)[0]
+
+
+def recommendations_page(tutors, score_column, user_data, k=DEFAULT_TOP_K,
+                         offset=0, ids=None):
+    """Build the response for ranks offset..offset+k of already scored tutors"""
+    with timed("sort"):
+        if ids is None:
+            ids = tutor_ids(tutors)
+        top = select_top_k(tutors[score_column].to_numpy(), ids, k, offset)
+        recommended = tutors.iloc[top]
+
+    # Log what factors influenced each recommendation (DEBUG unless sampled)
+    level = detail_level()
+    if score_column == "combined_score" and logger.isEnabledFor(level):
+        for idx, tutor in recommended.iterrows():
+            logger.log(
+                level,
+                "Recommendation: %s - Location: %.2f, Rating: %.2f, "
+                "Subject: %.2f, Popularity: %.2f, Experience: %.2f, "
+                "Availability: %.2f, Final score: %.2f",
+                tutor.get('username', 'Unknown'), tutor['location_score'],
+                tutor['rating_score'], tutor['subject_match_score'],
+                tutor['popularity_score'], tutor['experience_score'],
+                tutor['availability_score'], tutor['combined_score'])
+
+    # Prepare recommendations for the response
+    with timed("prepare"):
+        return prepare_recommendations_for_response(recommended, user_data)
+
+
+def select_top_k(scores, ids, k, offset=0):
+    """Positions of ranks offset..offset+k by descending score, ties by id
+
+    Uses a partial partition to find the score of the last requested rank and
+    only sorts the tutors scoring at least that much, instead of the whole
+    catalogue. Missing (NaN) scores rank last.
+    """
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    n_tutors = len(scores)
+    end = min(offset + k, n_tutors)
+    if end <= offset:
+        return np.array([], dtype=np.int64)
+
+    if end < n_tutors:
+        # Every tutor scoring at least the end-th best score, ties included
+        threshold = np.partition(scores, n_tutors - end)[n_tutors - end]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(n_tutors)
+
+    order = np.lexsort((ids[candidates], -scores[candidates]))
+    return candidates[order][offset:end]
+
+
+def tutor_ids(tutors):
+    """Tutor ids used for deterministic tie-breaking (row position if absent)"""
+    if "id" in tutors.columns:
+        return tutors["id"].astype(str).to_numpy()
+    return np.arange(len(tutors))
+
+
+def calculate_location_score(tutor_row, user_data):
+    """Calculate location similarity score between tutor and user"""
+    tutor_location = normalize_location(tutor_row.get("address", ""))
+    user_location = normalize_location(user_data.get("address", ""))
+
+    # Return location similarity score (0-1)
+    return location_similarity(tutor_location, user_location)
+
+
+def calculate_subject_match(tutor_row, user_data):
+    """Calculate subject match score between tutor and user"""
+    user_preferred_subjects = [s.lower()
+                               for s in user_data.get("preferredSubjects", [])]
+
+    # If user has no preferred subjects, return 0.5 (neutral)
+    if not user_preferred_subjects:
+        return 0.5
+
+    # Get tutor's subjects
+    tutor_subjects = []
+
+    # Add from subjects_list
+    if 'subjects_list' in tutor_row and isinstance(tutor_row['subjects_list'], list):
+        tutor_subjects.extend(
+            [s.lower() for s in tutor_row['subjects_list'] if isinstance(s, str)])
+
+    # Add from subjectDetails
+    if 'subjectDetails' in tutor_row and isinstance(tutor_row['subjectDetails'], list):
+        for detail in tutor_row['subjectDetails']:
+            if isinstance(detail, dict) and 'name' in detail and isinstance(detail['name'], str):
+                tutor_subjects.append(detail['name'].lower())
+
+    # If tutor has no subjects, return 0
+    if not tutor_subjects:
+        return 0
+
+    # Remove duplicates
+    tutor_subjects = list(set(tutor_subjects))
+
+    # Count exact and partial matches
+    exact_matches = sum(
+        1 for subj in user_preferred_subjects if subj in tutor_subjects)
+    partial_matches = sum(1 for subj in user_preferred_subjects
+                          if not subj in tutor_subjects and any(subj in ts for ts in tutor_subjects))
+
+    # Calculate weighted score (exact matches are worth more)
+    return (exact_matches * 1.0 + partial_matches * 0.5) / len(user_preferred_subjects)
+
+
+class EncodedTutors:
+    """Tutor attributes encoded once as token matrices and numeric arrays
+
+    Addresses and subject names are mapped to integer token ids so that
+    location Jaccard and subject matching for many users can be computed
+    with sparse matrix products instead of per-row Python loops.
+    """
+
+    def __init__(self, tutors):
+        # Location tokens, same normalization as location_similarity;
+        # each distinct address is normalized only once
+        normalized = {}
+        self.locations = [
+            normalized[address] if address in normalized
+            else normalized.setdefault(address, normalize_location(address))
+            for address in column_values(tutors, "address")]
+        location_sets = (set(location.split()) for location in self.locations)
+        self.location_vocab = {}
+        self.location_matrix = token_matrix(location_sets, self.location_vocab)
+        # Distinct tokens per tutor, the stored entries of its row
+        self.location_sizes = np.diff(self.location_matrix.indptr).astype(np.int64)
+
+        # Tutor positions for distance scoring (RECOMMENDATION_LOCATION_MODE=geo)
+        self.coordinates = (tutor_coordinates(tutors, self.locations)
+                            if GEO_MODE else None)
+
+        # Subject names, same sources as calculate_subject_match
+        subject_sets = (
+            tutor_subject_set(subjects, details)
+            for subjects, details in zip(
+                column_values(tutors, "subjects_list"),
+                column_values(tutors, "subjectDetails"))
+        )
+        self.subject_vocab = {}
+        self.subject_matrix = token_matrix(subject_sets, self.subject_vocab)
+        self.subject_names = sorted(
+            self.subject_vocab, key=self.subject_vocab.get)
+
+        # User-independent component scores, capped like compute_recommendations.
+        # Kept as float64 so sums (and so rankings and response values) match
+        # the DataFrame arithmetic exactly
+        self.rating_score = np.clip(
+            numeric_column(tutors, "rating") / 5.0, 0, 1)
+        self.popularity_score = np.clip(
+            numeric_column(tutors, "bookingsCount") / 100, 0, 1)
+        self.experience_score = np.clip(
+            numeric_column(tutors, "experience_years") / 10, 0, 1)
+        self.availability_score = numeric_column(tutors, "availability_score")
+
+        # Ids for deterministic tie-breaking in top-k selection
+        self.ids = tutor_ids(tutors)
+
+    @classmethod
+    def restore(cls, **attributes):
+        """Encoding saved earlier (see featureStore), from its attributes"""
+        encoded = object.__new__(cls)
+        encoded.__dict__.update(attributes)
+        encoded.subject_names = sorted(
+            encoded.subject_vocab, key=encoded.subject_vocab.get)
+        return encoded
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Encoding of the tutors of ``parts`` in order, as encoding them at once gives
+
+        Token ids are assigned in order of first appearance, as they are
+        when the tutors are encoded together.
+        """
+        encoded = object.__new__(cls)
+        encoded.locations = [location for part in parts for location in part.locations]
+        encoded.location_vocab = {}
+        encoded.location_matrix = concatenate_token_matrices(
+            [(part.location_matrix, part.location_vocab) for part in parts],
+            encoded.location_vocab)
+        encoded.subject_vocab = {}
+        encoded.subject_matrix = concatenate_token_matrices(
+            [(part.subject_matrix, part.subject_vocab) for part in parts],
+            encoded.subject_vocab)
+        encoded.subject_names = sorted(
+            encoded.subject_vocab, key=encoded.subject_vocab.get)
+        encoded.coordinates = (None if parts[0].coordinates is None else
+                               np.concatenate([part.coordinates for part in parts]))
+        for name in ("location_sizes", "rating_score", "popularity_score",
+                     "experience_score", "availability_score", "ids"):
+            setattr(encoded, name,
+                    np.concatenate([getattr(part, name) for part in parts]))
+        return encoded
+
+    def __len__(self):
+        return len(self.location_sizes)
+
+    def subset(self, rows):
+        """Encoding of only the tutors at ``rows``, sharing the vocabularies"""
+        subset = object.__new__(EncodedTutors)
+        subset.locations = [self.locations[row] for row in rows]
+        subset.location_vocab = self.location_vocab
+        subset.location_matrix = self.location_matrix[rows]
+        subset.location_sizes = self.location_sizes[rows]
+        subset.coordinates = (None if self.coordinates is None
+                              else self.coordinates[rows])
+        subset.subject_vocab = self.subject_vocab
+        subset.subject_matrix = self.subject_matrix[rows]
+        subset.subject_names = self.subject_names
+        subset.rating_score = self.rating_score[rows]
+        subset.popularity_score = self.popularity_score[rows]
+        subset.experience_score = self.experience_score[rows]
+        subset.availability_score = self.availability_score[rows]
+        subset.ids = self.ids[rows]
+        return subset
+
+
+def column_values(tutors, column):
+    """Return a column as a list, or a list of None if it is missing"""
+    if column in tutors.columns:
+        return tutors[column].tolist()
+    return [None] * len(tutors)
+
+
+def numeric_column(tutors, column):
+    """Return a column as a float array, or zeros if it is missing"""
+    if column in tutors.columns:
+        return tutors[column].astype(float).to_numpy()
+    return np.zeros(len(tutors))
+
+
+def tutor_subject_set(subjects_list, subject_details):
+    """Lowercased subject names of a tutor from its list and subject details"""
+    tutor_subjects = set()
+    if isinstance(subjects_list, list):
+        tutor_subjects.update(s.lower()
+                              for s in subjects_list if isinstance(s, str))
+    if isinstance(subject_details, list):
+        for detail in subject_details:
+            if isinstance(detail, dict) and isinstance(detail.get("name"), str):
+                tutor_subjects.add(detail["name"].lower())
+    return tutor_subjects
+
+
+def token_matrix(token_sets, vocabulary, grow=True):
+    """Build a binary CSR matrix (rows x vocabulary) from sets of tokens
+
+    New tokens are added to ``vocabulary`` unless ``grow`` is False, in which
+    case tokens outside the vocabulary are skipped. ``token_sets`` may be a
+    generator, so the sets of a whole catalogue need not be held at once.
+    """
+    indptr = [0]
+    indices = []
+    for tokens in token_sets:
+        for token in tokens:
+            token_id = vocabulary.get(token)
+            if token_id is None:
+                if not grow:
+                    continue
+                token_id = vocabulary[token] = len(vocabulary)
+            indices.append(token_id)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr),
+                         shape=(len(indptr) - 1, len(vocabulary)))
+
+
+def concatenate_token_matrices(parts, vocabulary):
+    """Stack token matrices built with their own vocabularies onto ``vocabulary``
+
+    ``parts`` are (matrix, vocabulary) pairs; tokens new to ``vocabulary``
+    are added in the order of the parts and of their own token ids.
+    """
+    mappings = []
+    for _, part_vocabulary in parts:
+        mapping = np.empty(len(part_vocabulary), dtype=np.int64)
+        for token in sorted(part_vocabulary, key=part_vocabulary.get):
+            mapping[part_vocabulary[token]] = vocabulary.setdefault(token, len(vocabulary))
+        mappings.append(mapping)
+    return sp.vstack([
+        sp.csr_matrix((matrix.data, mapping[matrix.indices], matrix.indptr),
+                      shape=(matrix.shape[0], len(vocabulary)))
+        for (matrix, _), mapping in zip(parts, mappings)], format="csr")
+
+
+def location_score_matrix(users, encoded):
+    """Jaccard similarity of every user address against every tutor address
+
+    In geo mode, pairs where both sides are located get a distance score.
+    """
+    user_locations = [normalize_location(user.get("address", "")) for user in users]
+    user_sets = [set(location.split()) for location in user_locations]
+    user_sizes = np.array([len(tokens) for tokens in user_sets],
+                          dtype=np.int64)
+    user_matrix = token_matrix(user_sets, encoded.location_vocab, grow=False)
+
+    # Shared tokens via a sparse product, union from the set sizes
+    common = (user_matrix @ encoded.location_matrix.T).toarray()
+    union = user_sizes[:, None] + encoded.location_sizes[None, :] - common
+
+    scores = np.zeros(common.shape)
+    valid = (user_sizes[:, None] > 0) & (encoded.location_sizes[None, :] > 0)
+    np.divide(common, union, out=scores, where=valid)
+
+    # Distance replaces Jaccard wherever both sides have coordinates
+    if encoded.coordinates is not None:
+        located = ~np.isnan(encoded.coordinates[:, 0])
+        for row, user in enumerate(users):
+            position = user_coordinates(user, user_locations[row])
+            if position is not None:
+                scores[row, located] = distance_scores(
+                    position, encoded.coordinates[located])
+    return scores
+
+
+def subject_match_matrix(users, encoded):
+    """Exact/partial subject match score of every user against every tutor"""
+    preferred = [[s.lower() for s in user.get("preferredSubjects") or []]
+                 for user in users]
+
+    # Distinct preferred subjects across the batch
+    distinct = {}
+    for subjects in preferred:
+        for subject in subjects:
+            distinct.setdefault(subject, len(distinct))
+
+    n_tutors = len(encoded)
+    exact_hits = np.zeros((len(distinct), n_tutors), dtype=bool)
+    partial_hits = np.zeros((len(distinct), n_tutors), dtype=bool)
+    if distinct and encoded.subject_names:
+        # Which catalogue subject names each preferred subject equals/appears in
+        exact = np.zeros((len(distinct), len(encoded.subject_names)))
+        contains = np.zeros_like(exact)
+        for subject, row in distinct.items():
+            if subject in encoded.subject_vocab:
+                exact[row, encoded.subject_vocab[subject]] = 1
+            contains[row] = [subject in name for name in encoded.subject_names]
+
+        exact_hits = (encoded.subject_matrix @ exact.T).T > 0
+        contains_hits = (encoded.subject_matrix @ contains.T).T > 0
+        partial_hits = contains_hits & ~exact_hits
+
+    # How many times each user lists each distinct subject
+    weights = np.zeros((len(users), len(distinct)))
+    for row, subjects in enumerate(preferred):
+        for subject in subjects:
+            weights[row, distinct[subject]] += 1
+
+    exact_matches = weights @ exact_hits
+    partial_matches = weights @ partial_hits
+
+    scores = np.full((len(users), n_tutors), 0.5)
+    for row, subjects in enumerate(preferred):
+        if subjects:
+            scores[row] = (exact_matches[row] * 1.0 +
+                           partial_matches[row] * 0.5) / len(subjects)
+    return scores
+
+
+def prepare_recommendations_for_response(recommended_df, user_data,
+                                         fields=None):
+    """Prepare the recommendation DataFrame for response with needed frontend info
+
+    Each recommendation holds the declared tutor ``fields`` the tutor has
+    (RESPONSE_FIELDS by default), the scores and up to three reasons. The
+    dicts are built from whole columns, without a Series per tutor, and
+    internal columns such as ``subjects_list`` are left out.
+    """
+    if fields is None:
+        fields = RESPONSE_FIELDS
+    if fields is None:
+        # RECOMMENDATION_RESPONSE_FIELDS=all: every column, internal ones too
+        fields = recommended_df.columns
+    n_tutors = len(recommended_df)
+
+    def column(name, default=0):
+        if name in recommended_df.columns:
+            return recommended_df[name].tolist()
+        return [default] * n_tutors
+
+    columns = {name: recommended_df[name].tolist() for name in fields
+               if name in recommended_df.columns}
+    for name in SCORE_COLUMNS:
+        if name in recommended_df.columns and name not in columns:
+            columns[name] = recommended_df[name].tolist()
+
+    # Component scores for frontend display
+    combined_scores = column("combined_score")
+    location_scores = column("location_score")
+    subject_scores = column("subject_match_score")
+    reasons = map(
+        recommendation_reasons, column("availability_score"), location_scores,
+        column("rating"), subject_scores,
+        column("subjects_list", None), column("bookingsCount"),
+        column("experience_years"), [user_data.get("preferredSubjects")] * n_tutors)
+
+    recommendations = []
+    for row, tutor_reasons in enumerate(reasons):
+        tutor_dict = {name: values[row] for name, values in columns.items()}
+        tutor_dict["recommendationScore"] = float(combined_scores[row])
+        tutor_dict["location_match_score"] = float(location_scores[row])
+        tutor_dict["subject_match_score"] = float(subject_scores[row])
+        # Limit to top 3 reasons
+        tutor_dict["recommendationReasons"] = tutor_reasons[:3]
+        recommendations.append(tutor_dict)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for tutor_dict in recommendations:
+            logger.debug("Adding recommendation for %s with score %s",
+                         tutor_dict.get('username', 'Unknown'),
+                         tutor_dict['recommendationScore'])
+    return recommendations
+
+
+def recommendation_reasons(availability, location, rating, subject_score,
+                           subjects, bookings, experience_years, preferred):
+    """Reasons for one recommendation, highest priority first"""
+    reasons = []
+
+    # Availability reason (new high priority)
+    if availability > 0:
+        reasons.append("Available now for tutoring")
+
+    # Location reason (highest priority)
+    if location > 0.7:
+        reasons.append("Very close to your location")
+    elif location > 0.5:
+        reasons.append("Near your location")
+    elif location > 0.3:
+        reasons.append("In your area")
+
+    # Rating reason (second priority)
+    try:
+        rating = float(rating)
+        if rating >= 4.5:
+            reasons.append(f"Excellent rating ({rating}/5)")
+        elif rating >= 4.0:
+            reasons.append(f"Very good rating ({rating}/5)")
+        elif rating >= 3.5:
+            reasons.append(f"Good rating ({rating}/5)")
+    except (ValueError, TypeError):
+        pass
+
+    # Subject match reason (third priority)
+    if subject_score > 0.8 and preferred:
+        matching_subjects = []
+        if isinstance(subjects, list):
+            tutor_subjects = [s.lower() for s in subjects if isinstance(s, str)]
+            matching_subjects = [s for s in preferred
+                                 if any(s.lower() in ts for ts in tutor_subjects)]
+
+        if matching_subjects:
+            subject_str = ", ".join(matching_subjects[:2])
+            reasons.append(
+                f"Teaches your preferred subject(s): {subject_str}")
+        else:
+            reasons.append("Matches your subject preferences")
+    elif subject_score > 0.5:
+        reasons.append("Teaches subjects you're interested in")
+
+    # Popularity reason (fourth priority)
+    try:
+        bookings = int(bookings)
+        if bookings > 30:
+            reasons.append(
+                f"Very popular tutor ({bookings}+ completed sessions)")
+        elif bookings > 15:
+            reasons.append(
+                f"Popular tutor ({bookings}+ completed sessions)")
+        elif bookings > 5:
+            reasons.append(f"Has completed {bookings}+ tutoring sessions")
+    except (ValueError, TypeError):
+        pass
+
+    # Experience reason (fifth priority)
+    try:
+        years = int(experience_years)
+        if years > 5:
+            reasons.append(f"{years}+ years of teaching experience")
+        elif years > 0:
+            reasons.append(
+                f"{years} year{'' if years == 1 else 's'} of teaching experience")
+    except (ValueError, TypeError):
+        pass
+
+    return reasons
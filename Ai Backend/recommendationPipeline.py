@@ -0,0 +1,224 @@
+import logging
+import os
+import random
+
+import pandas as pd
+
+from requestLogging import detail_level, record
+from pipelineMetrics import metrics, timed
+from approximateIndex import ANN_RETRIEVAL, CANDIDATES, RECALL_SAMPLE
+from shardedScoring import use_shards, recommend_sharded
+from recommendationEngine import (
+    preprocess_tutor_data,
+    create_user_vector,
+    compute_recommendations,
+    EncodedTutors,
+    DEFAULT_TOP_K,
+)
+
+logger = logging.getLogger(__name__)
+
+# Default and maximum number of recommendations per page
+TOP_K = int(os.environ.get("RECOMMENDATION_TOP_K", DEFAULT_TOP_K))
+MAX_TOP_K = int(os.environ.get("RECOMMENDATION_MAX_TOP_K", 100))
+
+# Score only candidate tutors from the index's inverted indexes (see
+# candidateIndex); set to 0 to score the whole catalogue on every request
+PREFILTER = os.environ.get("RECOMMENDATION_PREFILTER", "1") == "1"
+
+
+def parse_top_k(value):
+    """Requested page size, defaulting to TOP_K and capped at MAX_TOP_K"""
+    try:
+        k = int(TOP_K if value is None else value)
+    except (TypeError, ValueError):
+        k = TOP_K
+    return max(1, min(k, MAX_TOP_K))
+
+
+def scored_column(tutors):
+    """Name of the final score column on a scored frame, if there is one"""
+    if isinstance(tutors, CandidatePages):
+        return "combined_score"
+    if tutors is not None:
+        for column in ("combined_score", "weighted_score"):
+            if column in tutors.columns:
+                return column
+    return None
+
+
+def scored_count(scored):
+    """Number of tutors a request actually scored"""
+    if scored is None:
+        return 0
+    if isinstance(scored, CandidatePages):
+        return scored.scored_count
+    return len(scored)
+
+
+def filter_recommendations(recommendations):
+    """Drop recommendations below the minimum score"""
+    # Per-tutor scores are DEBUG detail unless the request is sampled
+    level = detail_level()
+    if logger.isEnabledFor(level):
+        for rec in recommendations:
+            logger.log(level, "Tutor: %s, Score: %s",
+                       rec.get('username', 'Unknown'),
+                       rec.get('recommendationScore', 0))
+
+    # Filter out recommendations with scores less than 0.05
+    filtered_recommendations = [
+        rec for rec in recommendations if rec.get('recommendationScore', 0) >= 0.05]
+
+    # Counts and ids go into the request's summary record
+    record(candidates=len(recommendations),
+           returned=len(filtered_recommendations),
+           topIds=[rec.get('id') for rec in filtered_recommendations])
+    return filtered_recommendations
+
+
+def recommend_from_payload(user, tutors_data, k=DEFAULT_TOP_K):
+    """Score a tutor list (or decoded tutor DataFrame) sent with the request
+
+    Returns the recommendations, the scored frame and the tutor ids. Large
+    payloads are scored on several cores with RECOMMENDATION_SHARDS (see
+    shardedScoring), with the same results.
+    """
+    record(mode="payload", tutors=len(tutors_data))
+    if use_shards(tutors_data):
+        return recommend_sharded(user, tutors_data, k)
+
+    # Convert tutors to DataFrame for easier processing
+    with timed("dataframe"):
+        if isinstance(tutors_data, pd.DataFrame):
+            # Columnar request bodies are decoded straight into a frame
+            tutors = tutors_data
+        else:
+            tutors = pd.DataFrame(tutors_data)
+
+    # Check if we have tutors to recommend
+    if tutors.empty:
+        logger.warning("No tutors available for recommendation")
+        return [], None, None
+
+    # Handle array format for subjects and gradeLevels
+    with timed("preprocess"):
+        tutors = preprocess_tutor_data(tutors)
+
+    # Encode addresses and subjects once; feature term counts and component
+    # scores are both built from it inside compute_recommendations
+    with timed("encode"):
+        encoded = EncodedTutors(tutors)
+
+    # Create user preference vector
+    user_vector = create_user_vector(user)
+
+    # Compute similarity scores
+    logger.debug("Computing similarity scores")
+    recommendations = compute_recommendations(
+        user_vector, tutors, user, encoded=encoded, k=k)
+    return recommendations, tutors, encoded.ids
+
+
+def recommend_from_index(user, tutor_index, k=DEFAULT_TOP_K):
+    """Score the preloaded tutor index without re-vectorizing the catalogue"""
+    snapshot = tutor_index.snapshot()
+    record(mode="index", tutors=len(snapshot.tutors),
+           indexVersion=snapshot.version)
+
+    if snapshot.tutors.empty:
+        logger.warning("No tutors available for recommendation")
+        return [], None, None
+
+    # Create user preference vector and compare it with the fitted matrix
+    user_vector = create_user_vector(user)
+    if ANN_RETRIEVAL and snapshot.approximate is not None and user_vector.strip():
+        pages = ApproximatePages(snapshot, user, user_vector)
+        return pages.page(k), pages, None
+    if PREFILTER and snapshot.candidates is not None and user_vector.strip():
+        pages = CandidatePages(snapshot, user, user_vector)
+        return pages.page(k), pages, None
+    similarities = snapshot.similarity(user_vector)
+
+    # Scoring adds columns, so work on a copy of the shared frame
+    with timed("copy"):
+        tutors = snapshot.tutors.copy()
+
+    logger.debug("Computing similarity scores")
+    recommendations = compute_recommendations(
+        user_vector, tutors, user, similarities, snapshot.encoded, k)
+    return recommendations, tutors, snapshot.encoded.ids
+
+
+class CandidatePages:
+    """Pages of a pre-filtered index request, each ranked from the snapshot
+
+    A page ranks the user's candidate tutors plus as many of the best other
+    tutors as it needs, instead of the whole catalogue, and only builds
+    response columns for the tutors up to the end of the page. Cursors keep
+    this object, so later pages are ranked against the same snapshot.
+    """
+
+    def __init__(self, snapshot, user, user_vector):
+        self.snapshot = snapshot
+        self.user = user
+        self.user_vector = user_vector
+        self.scored_count = 0
+
+    def __len__(self):
+        return len(self.snapshot.tutors)
+
+    def page(self, k, offset=0):
+        """Recommendations ranked offset..offset+k, as full scoring gives them"""
+        snapshot = self.snapshot
+        rows, candidates = self.ranked_rows(offset + k)
+        self.scored_count = candidates
+        record(candidateTutors=candidates)
+
+        # Response columns, similarity included, only for the ranked rows
+        similarities = snapshot.similarity(self.user_vector, rows)
+
+        # Scoring adds columns; taking the rows already makes a copy
+        with timed("copy"):
+            tutors = snapshot.tutors.take(rows)
+
+        logger.debug("Computing similarity scores")
+        return compute_recommendations(
+            self.user_vector, tutors, self.user, similarities,
+            snapshot.encoded.subset(rows), k, offset)
+
+    def ranked_rows(self, count):
+        """Rows holding the ``count`` best tutors, and how many were scored"""
+        with timed("candidates"):
+            return self.snapshot.candidates.top_rows(self.user, count)
+
+
+class ApproximatePages(CandidatePages):
+    """Pages ranked from the tutors approximate retrieval returns
+
+    The candidates come from the reduced tutor vectors (see
+    approximateIndex) and are ranked exactly, so a page can leave out
+    tutors the exact path would rank on it. RECALL_SAMPLE of first pages
+    are also ranked exactly to report recall.
+    """
+
+    def page(self, k, offset=0):
+        recommendations = super().page(k, offset)
+        if offset == 0 and RECALL_SAMPLE and random.random() < RECALL_SAMPLE:
+            recall = self.recall(recommendations, k)
+            metrics.observe_recall(k, recall)
+            record(annRecall=round(recall, 3))
+        return recommendations
+
+    def ranked_rows(self, count):
+        with timed("ann_search"):
+            rows = self.snapshot.approximate.search(
+                self.user, candidates=max(CANDIDATES, count))
+        return rows, len(rows)
+
+    def recall(self, recommendations, k):
+        """Share of the exact top-k tutors found on an approximate page"""
+        exact, _ = self.snapshot.candidates.top_rows(self.user, k)
+        expected = {str(self.snapshot.encoded.ids[row]) for row in exact}
+        found = {str(rec.get("id")) for rec in recommendations}
+        return len(expected & found) / len(expected) if expected else 1.0
@@ -1,618 +1,577 @@
-from flask import Flask, request, jsonify
-import pandas as pd
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-import re
+from flask import Flask, request, jsonify, g
+import contextvars
+import io
+import os
 import logging
-from datetime import datetime
-
-# Set up logging with timestamps
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from recommendationEngine import recommendations_page
+from recommendationPipeline import (
+    recommend_from_payload,
+    recommend_from_index,
+    filter_recommendations,
+    scored_column,
+    scored_count,
+    parse_top_k,
+    CandidatePages,
+)
+from requestLogging import configure_logging, request_log, record, current_request
+from pipelineMetrics import (
+    metrics,
+    timed,
+    timing_header,
+    gauge_lines,
+    memory_gauge_lines,
+)
+from requestFormats import is_binary_format, decode_request, UnsupportedFormat
+from responseJson import dumps
+from tutorIndex import TutorIndex, DEFAULT_CHUNK_SIZE, log_progress
+from batchScoring import recommend_batch
+from materializedRecommendations import MaterializedRecommendations
+from fallbackRanking import FallbackTier, LATENCY_BUDGET
+from recommendationCache import (
+    ScoreCursors,
+    TTLCache,
+    DiskTTLCache,
+    ResponseCache,
+    make_cursor,
+    profile_fingerprint,
+    catalogue_fingerprint,
+)
+
+# Set up logging with timestamps (RECOMMENDATION_LOG_FORMAT=json for JSON lines)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Tutor catalogue kept in memory between requests; RECOMMENDATION_TFIDF_PATH
+# keeps its fitted TF-IDF on disk so restarts can skip the fit, and
+# RECOMMENDATION_FEATURE_STORE shares its features between worker processes
+tutor_index = TutorIndex(os.environ.get("RECOMMENDATION_TFIDF_PATH"),
+                         os.environ.get("RECOMMENDATION_FEATURE_STORE"))
+if os.environ.get("TUTOR_INDEX_PATH"):
+    tutor_index.load_file(os.environ["TUTOR_INDEX_PATH"])
+
+# Stored pages of registered students, refreshed when a change can affect
+# them (see materializedRecommendations); catalogue changes must reach this
+# process, so run it with a single worker
+if os.environ.get("RECOMMENDATION_MATERIALIZE_PATH"):
+    materialized = MaterializedRecommendations(
+        os.environ["RECOMMENDATION_MATERIALIZE_PATH"], tutor_index)
+    if len(tutor_index):
+        materialized.index_rebuilt()
+else:
+    materialized = None
+
+# Popular-and-available ranking per bucket, served when scoring fails or
+# cannot finish in time (see fallbackRanking). The first one is built
+# before workers are forked from a preloaded app, so each starts with it
+fallback = FallbackTier(tutor_index)
+if len(tutor_index):
+    fallback.rebuild(wait=True)
+
+
+def start_background_threads():
+    """Start this process's refresh threads
+
+    Runs at import and again in every worker forked from a preloaded app
+    (see serve.py), since threads do not survive a fork.
+    """
+    if materialized is not None:
+        materialized.start()
+
+
+start_background_threads()
+
+
+# With a latency budget, index requests are scored in a small thread pool:
+# a request waits at most the budget for its scores, and a request that
+# finds SCORING_QUEUE requests already scoring or waiting does not wait at
+# all. Both get the fallback ranking; a late result is still cached.
+SCORING_THREADS = int(os.environ.get("RECOMMENDATION_SCORING_THREADS", 1))
+SCORING_QUEUE = int(os.environ.get("RECOMMENDATION_SCORING_QUEUE", 2))
+scoring_pool = ThreadPoolExecutor(SCORING_THREADS, thread_name_prefix="scoring")
+scoring_slots = threading.BoundedSemaphore(SCORING_QUEUE)
+
+# Scores of recent requests, so "next page" requests do not rescore;
+# bounded in entries, seconds and MiB
+CURSOR_SIZE = int(os.environ.get("RECOMMENDATION_CURSOR_SIZE", 256))
+CURSOR_TTL = float(os.environ.get("RECOMMENDATION_CURSOR_TTL", 600))
+CURSOR_MAX_MB = float(os.environ.get("RECOMMENDATION_CURSOR_MAX_MB", 256))
+score_cursors = ScoreCursors(CURSOR_SIZE, CURSOR_TTL, int(CURSOR_MAX_MB * 2**20))
+
+# Finished responses keyed on user profile and catalogue version; set
+# RECOMMENDATION_CACHE_PATH to keep them in SQLite instead of memory
+CACHE_SIZE = int(os.environ.get("RECOMMENDATION_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("RECOMMENDATION_CACHE_TTL", 300))
+if os.environ.get("RECOMMENDATION_CACHE_PATH"):
+    response_cache = ResponseCache(DiskTTLCache(
+        os.environ["RECOMMENDATION_CACHE_PATH"], CACHE_SIZE, CACHE_TTL))
+else:
+    response_cache = ResponseCache(TTLCache(CACHE_SIZE, CACHE_TTL))
+
+# Content types of newline-delimited JSON catalogue uploads
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Send per-stage timings in an X-Timing header on every response; clients
+# can also ask for it on a single request by sending an X-Timing header
+TIMING_HEADER = os.environ.get("RECOMMENDATION_TIMING_HEADER", "0") == "1"
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def count_request(response):
+    """Request counter and latency histogram, labelled by route pattern"""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe_request(route, str(response.status_code),
+                            time.perf_counter() - g.request_start)
+    return response
+
 
 @app.route('/recommend', methods=['POST'])
 def recommend():
-    """Generate tutor recommendations based on user preferences"""
+    """Generate tutor recommendations based on user preferences
+
+    The request may carry the full ``tutors`` list (legacy mode); if it only
+    sends the ``user`` profile, the preloaded tutor index is used instead.
+    ``k`` sets the page size; when more tutors remain, the ``X-Next-Cursor``
+    header holds a cursor that can be posted back to get the next page.
+    Besides JSON, the body may be Arrow IPC or MessagePack (see requestFormats).
+    """
+    with request_log("/recommend", logger) as log:
+        user, tutors_data, k = None, None, parse_top_k(None)
+        try:
+            with timed("parse"):
+                data = request_data()
+            k = requested_top_k(data)
+            log.set(k=k)
+
+            # Later pages are served from the scores cached for the first one
+            if data.get("cursor"):
+                log.set(mode="cursor")
+                return next_recommendations_page(data["cursor"], k)
+
+            # Extract user and tutor data from the request
+            user = data["user"]
+            tutors_data = data.get("tutors")
+            log.set(userId=user["id"])
+
+            # Serve unchanged profiles against an unchanged catalogue from cache
+            with timed("cache"):
+                if tutors_data is None:
+                    catalogue_version = f"index:{tutor_index.version}"
+                else:
+                    catalogue_version = (data.get("catalogueVersion") or
+                                         catalogue_fingerprint(tutors_data))
+                cache_key = profile_fingerprint(user, catalogue_version, k)
+                cached = response_cache.get(cache_key) if CACHE_SIZE > 0 else None
+            if cached is not None:
+                log.set(cache="hit", returned=len(cached[0]))
+                return recommendations_response(*cached)
+            log.set(cache="miss")
+
+            if tutors_data is None and LATENCY_BUDGET > 0:
+                scoring, reason = score_within_budget(user, k, cache_key)
+                if scoring is None:
+                    return degraded_response(user, k, reason)
+                recommendations, scored, ids = scoring
+            elif tutors_data is None:
+                recommendations, scored, ids = recommend_from_index(
+                    user, tutor_index, k)
+            else:
+                recommendations, scored, ids = recommend_from_payload(
+                    user, tutors_data, k)
+            metrics.count_scored("/recommend", scored_count(scored))
+            return recommendations_response(*first_page(
+                user, k, cache_key, recommendations, scored, ids))
+
+        except UnsupportedFormat as e:
+            log.set(error=str(e))
+            return jsonify({"error": str(e)}), 415
+        except Exception as e:
+            logger.error("Error in recommendation service: %s", e)
+            log.set(error=str(e))
+            metrics.count_error("/recommend")
+            # Index requests get the fallback ranking; payload requests,
+            # whose catalogue it does not cover, an empty list
+            return degraded_response(
+                user if tutors_data is None else None, k, "error")
+
+
+def first_page(user, k, cache_key, recommendations, scored, ids):
+    """Filtered first page and next page cursor, cached for the profile"""
+    with timed("filter"):
+        filtered_recommendations = filter_recommendations(recommendations)
+
+    # Keep the scores around if there is another page to serve
+    next_cursor = None
+    score_column = scored_column(scored)
+    if score_column and len(scored) > k:
+        token = score_cursors.save(scored, score_column, user, ids)
+        if token is not None:
+            next_cursor = make_cursor(token, k)
+
+    if CACHE_SIZE > 0:
+        response_cache.set(cache_key, [filtered_recommendations, next_cursor])
+    return filtered_recommendations, next_cursor
+
+
+def score_within_budget(user, k, cache_key):
+    """Index scoring of ``user`` if it finishes within LATENCY_BUDGET
+
+    Returns what recommend_from_index does and None, or None and why the
+    fallback ranking is served instead: "overload" when the scoring queue
+    is full, "budget" when the scores take too long. Late scores still
+    become the cached first page for the next identical request.
+    """
+    if not scoring_slots.acquire(blocking=False):
+        return None, "overload"
+    # The request's log and stage timers follow it into the pool thread
+    future = scoring_pool.submit(contextvars.copy_context().run,
+                                 recommend_from_index, user, tutor_index, k)
+    future.add_done_callback(lambda _: scoring_slots.release())
     try:
-        # Log incoming request data
-        logger.info("Received recommendation request")
-        data = request.get_json()
-
-        # Extract user and tutor data from the request
-        user = data["user"]
-        tutors_data = data["tutors"]
-
-        logger.info(f"Processing recommendation for user: {user['id']}")
-        logger.info(f"Number of tutors available: {len(tutors_data)}")
-
-        # Convert tutors to DataFrame for easier processing
-        tutors = pd.DataFrame(tutors_data)
-
-        # Check if we have tutors to recommend
-        if tutors.empty:
-            logger.warning("No tutors available for recommendation")
-            return jsonify([])
-
-        # Handle array format for subjects and gradeLevels
-        tutors = preprocess_tutor_data(tutors)
-
-        # Create feature vectors for similarity calculation with updated weights
-        tutors["features"] = create_feature_vectors(tutors, user)
-
-        # Create user preference vector
-        user_vector = create_user_vector(user)
-
-        # Compute similarity scores
-        logger.info("Computing similarity scores")
-        recommendations = compute_recommendations(user_vector, tutors, user)
-
-        # Log before filtering
-        logger.info(
-            f"Before filtering: {len(recommendations)} recommendations")
-        for rec in recommendations:
-            logger.info(
-                f"Tutor: {rec.get('username', 'Unknown')}, Score: {rec.get('recommendationScore', 0)}")
-
-        # Filter out recommendations with scores less than 0.05
-        filtered_recommendations = [
-            rec for rec in recommendations if rec.get('recommendationScore', 0) >= 0.05]
-
-        # Log after filtering
-        logger.info(
-            f"After filtering: {len(filtered_recommendations)} recommendations")
-        for rec in filtered_recommendations:
-            logger.info(
-                f"Tutor: {rec.get('username', 'Unknown')}, Score: {rec.get('recommendationScore', 0)}")
-
-        # Return recommendations
-        logger.info(
-            f"Returning {len(filtered_recommendations)} recommendations")
-        return jsonify(filtered_recommendations)
-
-    except Exception as e:
-        logger.error(f"Error in recommendation service: {str(e)}")
-        # Return empty list in case of errors
-        return jsonify([])
-
-
-def preprocess_tutor_data(tutors):
-    """Ensure tutors data has proper format for subjects and gradeLevels"""
-
-    # Handle subjects - ensure it's a list and join for feature creation
-    if 'subjects' in tutors.columns:
-        # Convert string representation to lists if needed
-        tutors['subjects_list'] = tutors['subjects'].apply(
-            lambda x: x if isinstance(x, list) else [
-                x] if isinstance(x, str) else []
-        )
-        # Create a string version for feature creation
-        tutors['subjects_str'] = tutors['subjects_list'].apply(
-            lambda x: ", ".join(x) if x else ""
-        )
-    else:
-        tutors['subjects_list'] = [[]]
-        tutors['subjects_str'] = ""
-
-    # Handle grade levels - ensure it's a list and join for feature creation
-    if 'gradeLevels' in tutors.columns:
-        # Convert string representation to lists if needed
-        tutors['gradeLevels_list'] = tutors['gradeLevels'].apply(
-            lambda x: x if isinstance(x, list) else [
-                x] if isinstance(x, str) else []
-        )
-        # Create a string version for feature creation
-        tutors['gradeLevels_str'] = tutors['gradeLevels_list'].apply(
-            lambda x: ", ".join(x) if x else ""
-        )
-    else:
-        tutors['gradeLevels_list'] = [[]]
-        tutors['gradeLevels_str'] = ""
-
-    # Convert bookingsCount to numeric for popularity ranking
-    if 'bookingsCount' in tutors.columns:
-        tutors['bookingsCount'] = pd.to_numeric(
-            tutors['bookingsCount'], errors='coerce').fillna(0)
-
-    # Normalize experience field for ranking
-    if 'experience' in tutors.columns:
-        tutors['experience_years'] = tutors['experience'].apply(
-            extract_years_from_experience)
+        return future.result(timeout=LATENCY_BUDGET), None
+    except FutureTimeout:
+        def cache_late_scores(done):
+            if CACHE_SIZE > 0 and done.exception() is None:
+                first_page(user, k, cache_key, *done.result())
+
+        future.add_done_callback(cache_late_scores)
+        return None, "budget"
+
+
+def degraded_response(user, k, reason):
+    """Fallback ranking page for ``user``, marked with an X-Degraded header"""
+    ranking = fallback.current() if isinstance(user, dict) else None
+    recommendations = ranking.page(user, k) if ranking is not None else []
+    record(degraded=reason, returned=len(recommendations))
+    metrics.count_degraded("/recommend", reason)
+    response = recommendations_response(recommendations)
+    response.headers["X-Degraded"] = reason
+    return response
+
+
+def request_data():
+    """Request body as a dict, decoding columnar formats by Content-Type"""
+    if is_binary_format(request.mimetype):
+        record(format=request.mimetype)
+        return decode_request(request.mimetype, request.get_data())
+    return request.get_json()
+
+
+def next_recommendations_page(cursor, k):
+    """Serve the page a cursor points at from its cached scores"""
+    entry = score_cursors.load(cursor)
+    if entry is None:
+        return jsonify({"error": "Cursor expired or invalid"}), 410
+
+    token, scored, score_column, user, ids, offset = entry
+    record(offset=offset, tutors=len(scored))
+
+    if isinstance(scored, CandidatePages):
+        # Pre-filtered requests score just enough tutors for each page
+        recommendations = scored.page(k, offset)
     else:
-        tutors['experience_years'] = 0
+        recommendations = recommendations_page(
+            scored, score_column, user, k, offset, ids)
+    next_cursor = None
+    if offset + k < len(scored):
+        next_cursor = make_cursor(token, offset + k)
+    return recommendations_response(
+        filter_recommendations(recommendations), next_cursor)
+
+
+def recommendations_response(recommendations, next_cursor=None):
+    """JSON list response, with the next page cursor as a header"""
+    with timed("serialize"):
+        response = json_response(recommendations)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return with_timing_header(response)
 
-    # Add availability as a feature
-    if 'isAvailable' in tutors.columns:
-        tutors['availability_score'] = tutors['isAvailable'].apply(
-            lambda x: 1.0 if x else 0.0)
-    else:
-        tutors['availability_score'] = 0.0
-
-    return tutors
-
-
-def extract_years_from_experience(exp_str):
-    """Extract number of years from experience text"""
-    if not isinstance(exp_str, str):
-        return 0
-
-    # Look for numbers followed by "year" or "yr"
-    year_pattern = r'(\d+)\s*(?:year|yr)'
-    match = re.search(year_pattern, exp_str.lower())
-    if match:
-        return int(match.group(1))
-
-    # Map experience categories to years
-    exp_mapping = {
-        'fresher': 0.5,
-        '0-1': 0.5,
-        '1-2': 1.5,
-        '2-5': 3.5,
-        '5+': 6.0
-    }
-
-    # Check if experience string matches any of our mappings
-    for key, value in exp_mapping.items():
-        if key in exp_str.lower():
-            return value
-
-    # If no match, check if experience contains any numbers
-    numbers = re.findall(r'\d+', exp_str)
-    if numbers:
-        # Take the first number as an approximation
-        return int(numbers[0])
-
-    return 0
-
-
-def create_feature_vectors(tutors, user):
-    """Create feature vectors for tutors that emphasize relevant attributes"""
-
-    # Extract features from tutors DataFrame
-    features = []
-    for _, tutor in tutors.iterrows():
-        # Create a weighted feature string
-        feature_parts = []
-
-        # Add subjects with moderate weight
-        subjects_str = tutor.get("subjects_str", "").lower()
-        feature_parts.append(subjects_str)
-
-        # Get list of subjects for exact matching
-        subject_list = tutor.get("subjects_list", [])
-        if isinstance(subject_list, list):
-            subject_list_lower = [s.lower()
-                                  for s in subject_list if isinstance(s, str)]
-        else:
-            subject_list_lower = []
-
-        # Process preferred subjects with medium emphasis (priority #3)
-        if "preferredSubjects" in user and user["preferredSubjects"]:
-            for subject in user["preferredSubjects"]:
-                subject_lower = subject.lower()
-
-                # Check for exact matches in subject list
-                if any(s == subject_lower or subject_lower in s for s in subject_list_lower):
-                    # Medium weight for subject matches
-                    feature_parts.extend([subject_lower] * 3)
-
-                # Also check in detailed subject names for exact matches
-                if "subjectDetails" in tutor and isinstance(tutor["subjectDetails"], list):
-                    exact_matches = [
-                        detail.get("name", "").lower()
-                        for detail in tutor["subjectDetails"]
-                        if detail.get("name", "").lower() == subject_lower
-                    ]
-
-                    # If we have exact matches in the subject details, add emphasis
-                    if exact_matches:
-                        feature_parts.extend([subject_lower] * 3)
-
-        # Add grade levels
-        feature_parts.append(tutor.get("gradeLevels_str", "").lower())
-
-        # Add user grade (if relevant)
-        if "grade" in user and user["grade"]:
-            user_grade = user["grade"].lower()
-            grade_levels_str = tutor.get("gradeLevels_str", "").lower()
-
-            if user_grade in grade_levels_str:
-                feature_parts.extend([user_grade] * 2)
-
-        # Add location features (normalized) with highest emphasis (priority #1)
-        tutor_location = normalize_location(tutor.get("address", ""))
-        user_location = normalize_location(user.get("address", ""))
-
-        # Calculate location similarity
-        loc_similarity = location_similarity(tutor_location, user_location)
-
-        # If locations match at area level, give very high emphasis
-        if loc_similarity > 0.5:
-            # Add multiple copies to heavily emphasize location - highest priority
-            feature_parts.extend([tutor_location] * 6)
-        elif loc_similarity > 0.3:
-            feature_parts.extend([tutor_location] * 4)
-        else:
-            feature_parts.append(tutor_location)
-
-        # Add rating with high emphasis (priority #2)
-        if "rating" in tutor:
-            try:
-                rating_val = float(tutor["rating"])
-                # Add rating based emphasis (more stars = more emphasis)
-                if rating_val >= 4.5:
-                    feature_parts.extend(["high_rating"] * 5)
-                elif rating_val >= 4.0:
-                    feature_parts.extend(["good_rating"] * 4)
-                elif rating_val >= 3.5:
-                    feature_parts.extend(["average_rating"] * 3)
-            except (ValueError, TypeError):
-                pass
-
-        # Add popularity/booking count with low-medium emphasis (priority #4)
-        if "bookingsCount" in tutor:
-            try:
-                bookings = int(tutor["bookingsCount"])
-                if bookings > 20:
-                    feature_parts.extend(["popular_tutor"] * 2)
-                elif bookings > 10:
-                    feature_parts.append("experienced_tutor")
-            except (ValueError, TypeError):
-                pass
-
-        # Add teaching experience with low emphasis (priority #5)
-        if "experience_years" in tutor:
-            try:
-                years = int(tutor["experience_years"])
-                if years > 5:
-                    feature_parts.append("veteran_teacher")
-                elif years > 3:
-                    feature_parts.append("experienced_teacher")
-                elif years > 1:
-                    feature_parts.append("qualified_teacher")
-            except (ValueError, TypeError):
-                pass
-
-        # Add availability as a feature
-        if tutor.get('availability_score', 0) > 0:
-            feature_parts.append("available_now")
-
-        # Combine all features
-        features.append(" ".join(feature_parts))
-
-    return features
-
-
-def create_user_vector(user):
-    """Create a feature vector for user preferences with weights matching our priority"""
-    feature_parts = []
-
-    # Location - highest priority (#1)
-    if "address" in user and user["address"]:
-        location = normalize_location(user["address"])
-        # Add multiple times to give location the highest weight
-        feature_parts.extend([location] * 6)
-
-    # Rating preference is implicit (always prioritized - #2)
-    feature_parts.extend(["high_rating"] * 4)
-
-    # Preferred subjects - medium priority (#3)
-    if "preferredSubjects" in user and user["preferredSubjects"]:
-        for subject in user["preferredSubjects"]:
-            # Add with medium emphasis
-            feature_parts.extend([subject.lower()] * 3)
-
-    # Popularity is implicit (medium-low priority - #4)
-    feature_parts.append("popular_tutor")
-
-    # Experience is lowest priority (#5)
-    feature_parts.append("experienced_teacher")
-
-    # Add user's grade
-    if "grade" in user and user["grade"]:
-        feature_parts.append(user["grade"].lower())
-
-    # Add availability preference (users generally prefer available tutors)
-    feature_parts.append("available_now")
-
-    # Return the combined user preference vector
-    return " ".join(feature_parts)
-
-
-def normalize_location(address):
-    """Extract and normalize location information"""
-    if not isinstance(address, str):
-        return ""
-
-    # Convert to lowercase
-    address = address.lower()
-
-    # Remove common words, punctuation
-    address = re.sub(r'[^\w\s]', ' ', address)
-
-    # Return normalized address
-    return address.strip()
-
-
-def location_similarity(loc1, loc2):
-    """Calculate simple location similarity score"""
-    # Handle empty strings
-    if not loc1 or not loc2:
-        return 0
-
-    # Count common words
-    words1 = set(loc1.split())
-    words2 = set(loc2.split())
 
-    common = words1.intersection(words2)
+def json_response(body):
+    """Response with a JSON body written by the fast encoder"""
+    return app.response_class(dumps(body), mimetype="application/json")
 
-    if not words1 or not words2:
-        return 0
 
-    # Return Jaccard similarity
-    return len(common) / len(words1.union(words2))
+def with_timing_header(response):
+    """Add the stage timings of the current request if they were asked for"""
+    log = current_request()
+    if log is not None and (TIMING_HEADER or "X-Timing" in request.headers):
+        response.headers["X-Timing"] = timing_header(log.timings, log.elapsed_ms())
+    return response
 
 
-def compute_recommendations(user_vector, tutors, user_data):
-    """Compute and return recommendations based on similarity with updated weights"""
+def requested_top_k(data):
+    """Page size from the body or query string, capped at MAX_TOP_K"""
+    return parse_top_k(data.get("k", request.args.get("k")))
+
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_many():
+    """Generate recommendations for many users in one matrix pass"""
+    data = request.get_json(silent=True)
+    if (not isinstance(data, dict) or not isinstance(data.get("users"), list) or
+            not all(isinstance(user, dict) for user in data["users"])):
+        return jsonify({"error": "Expected a list of users"}), 400
+    if data.get("tutors") is not None and not isinstance(data["tutors"], list):
+        return jsonify({"error": "Expected a list of tutors"}), 400
+
+    users = data["users"]
+    k = requested_top_k(data)
+
+    with request_log("/recommend/batch", logger) as log:
+        log.set(users=len(users), k=k)
+        try:
+            with timed("index"):
+                if data.get("tutors") is None:
+                    snapshot = tutor_index.snapshot()
+                else:
+                    # Index the sent tutors once and score every user against them
+                    request_index = TutorIndex()
+                    try:
+                        request_index.load(data["tutors"])
+                    except ValueError as e:
+                        log.set(error=str(e))
+                        return jsonify({"error": str(e)}), 400
+                    snapshot = request_index.snapshot()
+
+            with timed("batch_scoring"):
+                batch = recommend_batch(users, snapshot, k)
+            metrics.count_scored("/recommend/batch",
+                                 len(users) * len(snapshot.tutors))
+        except Exception as e:
+            logger.error("Error in batch recommendation service: %s", e)
+            log.set(error=str(e))
+            metrics.count_error("/recommend/batch")
+            return jsonify({"error": str(e)}), 500
+
+        results = []
+        for user, recommendations in zip(users, batch):
+            # Apply the same score threshold as /recommend
+            filtered_recommendations = [
+                rec for rec in recommendations if rec.get('recommendationScore', 0) >= 0.05]
+            results.append({"userId": user.get("id"),
+                            "recommendations": filtered_recommendations})
+        log.set(tutors=len(snapshot.tutors),
+                returned=sum(len(r["recommendations"]) for r in results))
+        with timed("serialize"):
+            response = json_response(results)
+        return with_timing_header(response)
+
+
+@app.route('/recommend/cache', methods=['GET'])
+def recommendation_cache_stats():
+    """Hit/miss counters and size of the response cache"""
+    return jsonify(response_cache.stats())
+
+
+@app.route('/recommend/cache', methods=['DELETE'])
+def clear_recommendation_cache():
+    """Drop every cached recommendation response"""
+    response_cache.clear()
+    return jsonify(response_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, error and stage latency metrics in Prometheus text format"""
+    cache = response_cache.stats()
+    extra = (
+        gauge_lines("recommendation_catalogue_tutors",
+                    "Tutors in the preloaded index", len(tutor_index)) +
+        gauge_lines("recommendation_catalogue_version",
+                    "Version of the preloaded index", tutor_index.version) +
+        gauge_lines("recommendation_cache_hits",
+                    "Response cache hits since start", cache["hits"]) +
+        gauge_lines("recommendation_cache_misses",
+                    "Response cache misses since start", cache["misses"]) +
+        gauge_lines("recommendation_cache_size",
+                    "Entries in the response cache", cache["size"]) +
+        gauge_lines("recommendation_cursor_entries",
+                    "Scored requests kept for next page cursors",
+                    len(score_cursors)) +
+        gauge_lines("recommendation_cursor_bytes",
+                    "Estimated bytes of the scores kept for cursors",
+                    score_cursors.nbytes) +
+        memory_gauge_lines()
+    )
+    if materialized is not None:
+        students = materialized.stats()
+        extra += (
+            gauge_lines("recommendation_materialized_students",
+                        "Students with materialized recommendations",
+                        students["students"]) +
+            gauge_lines("recommendation_materialized_pending",
+                        "Students waiting for a refresh", students["pending"]))
+    return (metrics.render(extra), 200,
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+@app.route('/tutors', methods=['GET'])
+def tutor_index_status():
+    """Report the size and version of the tutor index"""
+    return jsonify({"count": len(tutor_index), "version": tutor_index.version,
+                    "featureStore": tutor_index.store_version})
+
+
+@app.route('/tutors', methods=['POST', 'PUT'])
+def update_tutor_index():
+    """Upsert tutors into the index (POST) or replace the catalogue (PUT)"""
+    if request.mimetype in NDJSON_TYPES:
+        return stream_tutor_index()
+
+    data = request.get_json(silent=True)
+    tutors_data = data.get("tutors") if isinstance(data, dict) else data
+    if not isinstance(tutors_data, list):
+        return jsonify({"error": "Expected a list of tutors"}), 400
+
+    previous = tutor_index.snapshot()
     try:
-        # If user vector is empty, use a ranking based on our priority criteria
-        if not user_vector.strip():
-            logger.warning(
-                "Empty user vector, using weighted criteria-based recommendation")
-
-            # Calculate weighted score based on our priorities
-            tutors["weighted_score"] = (
-                # Location (30%)
-                tutors.apply(lambda x: calculate_location_score(x, user_data) * 0.30, axis=1) +
-                tutors["rating"].astype(float) / 5.0 * 0.25 +  # Rating (25%)
-                # Subject (20%)
-                tutors.apply(lambda x: calculate_subject_match(x, user_data) * 0.20, axis=1) +
-                # Popularity (10%, capped at 100 bookings)
-                tutors["bookingsCount"] / 100 * 0.10 +
-                # Experience (5%, capped at 10 years)
-                tutors["experience_years"] / 10 * 0.05 +
-                tutors["availability_score"] * 0.10  # Availability (10%)
-            )
-
-            recommended = tutors.sort_values(
-                by="weighted_score", ascending=False).head(10)
-            return prepare_recommendations_for_response(recommended, user_data)
-
-        # Use TF-IDF vectorizer for better feature extraction
-        vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=1)
-
-        # Create corpus with user vector first
-        corpus = [user_vector] + list(tutors["features"])
-
-        # Fit and transform
-        tfidf_matrix = vectorizer.fit_transform(corpus)
-
-        # Extract user vector and tutor matrix
-        user_tfidf = tfidf_matrix[0]
-        tutors_tfidf = tfidf_matrix[1:]
-
-        # Compute similarity
-        similarities = cosine_similarity(user_tfidf, tutors_tfidf)[0]
-
-        # Add similarity scores to DataFrame
-        tutors["cosine_similarity"] = similarities
-
-        # Calculate individual component scores
-        tutors["location_score"] = tutors.apply(
-            lambda x: calculate_location_score(x, user_data), axis=1)
-        tutors["rating_score"] = tutors["rating"].astype(float) / 5.0
-        tutors["subject_match_score"] = tutors.apply(
-            lambda x: calculate_subject_match(x, user_data), axis=1)
-        tutors["popularity_score"] = tutors["bookingsCount"] / \
-            100  # Normalize to 0-1 (capped at 100 bookings)
-        tutors["experience_score"] = tutors["experience_years"] / \
-            10  # Normalize to 0-1 (capped at 10 years)
-
-        # Cap scores at 1.0
-        for score_col in ["location_score", "rating_score", "subject_match_score", "popularity_score", "experience_score"]:
-            tutors[score_col] = tutors[score_col].clip(0, 1)
-
-        # Calculate weighted final score with our priority weights
-        tutors["combined_score"] = (
-            tutors["location_score"] * 0.30 +     # Location (30%)
-            tutors["rating_score"] * 0.25 +       # Rating (25%)
-            tutors["subject_match_score"] * 0.20 +  # Subject (20%)
-            tutors["popularity_score"] * 0.10 +    # Popularity (10%)
-            tutors["experience_score"] * 0.05 +    # Experience (5%)
-            tutors["availability_score"] * 0.10    # Availability (10%)
-        )
-
-        # Recommend top 10 tutors
-        recommended = tutors.sort_values(
-            by="combined_score", ascending=False).head(10)
-
-        # Log what factors influenced each recommendation
-        for idx, tutor in recommended.iterrows():
-            logger.info(
-                f"Recommendation: {tutor.get('username', 'Unknown')} - " +
-                f"Location: {tutor['location_score']:.2f}, " +
-                f"Rating: {tutor['rating_score']:.2f}, " +
-                f"Subject: {tutor['subject_match_score']:.2f}, " +
-                f"Popularity: {tutor['popularity_score']:.2f}, " +
-                f"Experience: {tutor['experience_score']:.2f}, " +
-                f"Availability: {tutor['availability_score']:.2f}, " +
-                f"Final score: {tutor['combined_score']:.2f}"
-            )
-
-        # Prepare recommendations for the response
-        return prepare_recommendations_for_response(recommended, user_data)
-
-    except Exception as e:
-        logger.error(f"Error in compute_recommendations: {str(e)}")
-        # Sort by rating as fallback
-        if "rating" in tutors.columns:
-            tutors["score"] = tutors["rating"].astype(float)
-            recommended = tutors.sort_values(
-                by="score", ascending=False).head(5)
-            return recommended.to_dict(orient="records")
+        if request.method == 'PUT':
+            count = tutor_index.load(tutors_data)
         else:
-            # Return first 5 tutors if we can't sort
-            return tutors.head(5).to_dict(orient="records")
-
-
-def calculate_location_score(tutor_row, user_data):
-    """Calculate location similarity score between tutor and user"""
-    tutor_location = normalize_location(tutor_row.get("address", ""))
-    user_location = normalize_location(user_data.get("address", ""))
-
-    # Return location similarity score (0-1)
-    return location_similarity(tutor_location, user_location)
-
-
-def calculate_subject_match(tutor_row, user_data):
-    """Calculate subject match score between tutor and user"""
-    user_preferred_subjects = [s.lower()
-                               for s in user_data.get("preferredSubjects", [])]
-
-    # If user has no preferred subjects, return 0.5 (neutral)
-    if not user_preferred_subjects:
-        return 0.5
-
-    # Get tutor's subjects
-    tutor_subjects = []
-
-    # Add from subjects_list
-    if 'subjects_list' in tutor_row and isinstance(tutor_row['subjects_list'], list):
-        tutor_subjects.extend(
-            [s.lower() for s in tutor_row['subjects_list'] if isinstance(s, str)])
-
-    # Add from subjectDetails
-    if 'subjectDetails' in tutor_row and isinstance(tutor_row['subjectDetails'], list):
-        for detail in tutor_row['subjectDetails']:
-            if isinstance(detail, dict) and 'name' in detail and isinstance(detail['name'], str):
-                tutor_subjects.append(detail['name'].lower())
-
-    # If tutor has no subjects, return 0
-    if not tutor_subjects:
-        return 0
-
-    # Remove duplicates
-    tutor_subjects = list(set(tutor_subjects))
-
-    # Count exact and partial matches
-    exact_matches = sum(
-        1 for subj in user_preferred_subjects if subj in tutor_subjects)
-    partial_matches = sum(1 for subj in user_preferred_subjects
-                          if not subj in tutor_subjects and any(subj in ts for ts in tutor_subjects))
-
-    # Calculate weighted score (exact matches are worth more)
-    return (exact_matches * 1.0 + partial_matches * 0.5) / len(user_preferred_subjects)
-
-
-def prepare_recommendations_for_response(recommended_df, user_data):
-    """Prepare the recommendation DataFrame for response with needed frontend info"""
-    recommendations = []
-    for idx, tutor in recommended_df.iterrows():
-        # Create a dictionary with all the original tutor data
-        tutor_dict = tutor.to_dict()
-
-        # Add component scores for frontend display
-        # CHANGE THIS LINE - use recommendationScore instead of combined_score
-        tutor_dict["recommendationScore"] = float(
-            tutor.get("combined_score", 0))
-        tutor_dict["location_match_score"] = float(
-            tutor.get("location_score", 0))
-        tutor_dict["subject_match_score"] = float(
-            tutor.get("subject_match_score", 0))
-
-        # Generate recommendation reasons
-        reasons = []
-
-        # Availability reason (new high priority)
-        if tutor.get("availability_score", 0) > 0:
-            reasons.append("Available now for tutoring")
-
-        # Location reason (highest priority)
-        loc_score = tutor.get("location_score", 0)
-        if loc_score > 0.7:
-            reasons.append("Very close to your location")
-        elif loc_score > 0.5:
-            reasons.append("Near your location")
-        elif loc_score > 0.3:
-            reasons.append("In your area")
-
-        # Rating reason (second priority)
-        try:
-            rating = float(tutor.get("rating", 0))
-            if rating >= 4.5:
-                reasons.append(f"Excellent rating ({rating}/5)")
-            elif rating >= 4.0:
-                reasons.append(f"Very good rating ({rating}/5)")
-            elif rating >= 3.5:
-                reasons.append(f"Good rating ({rating}/5)")
-        except (ValueError, TypeError):
-            pass
-
-        # Subject match reason (third priority)
-        subj_score = tutor.get("subject_match_score", 0)
-        if subj_score > 0.8 and user_data.get("preferredSubjects"):
-            matching_subjects = []
-            if 'subjects_list' in tutor and isinstance(tutor['subjects_list'], list):
-                user_subjects = [s.lower()
-                                 for s in user_data.get("preferredSubjects", [])]
-                tutor_subjects = [
-                    s.lower() for s in tutor['subjects_list'] if isinstance(s, str)]
-
-                matching_subjects = [s for s in user_data.get("preferredSubjects", [])
-                                     if any(s.lower() in ts.lower() for ts in tutor_subjects)]
-
-            if matching_subjects:
-                subject_str = ", ".join(matching_subjects[:2])
-                reasons.append(
-                    f"Teaches your preferred subject(s): {subject_str}")
-            else:
-                reasons.append("Matches your subject preferences")
-        elif subj_score > 0.5:
-            reasons.append("Teaches subjects you're interested in")
+            count = tutor_index.upsert(tutors_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info("Tutor index updated with %d tutors", count)
+    if materialized is not None:
+        if request.method == 'PUT':
+            materialized.index_rebuilt()
+        else:
+            materialized.tutors_upserted(
+                [tutor.get("id") for tutor in tutors_data
+                 if isinstance(tutor, dict)], previous)
 
-        # Popularity reason (fourth priority)
-        try:
-            bookings = int(tutor.get("bookingsCount", 0))
-            if bookings > 30:
-                reasons.append(
-                    f"Very popular tutor ({bookings}+ completed sessions)")
-            elif bookings > 15:
-                reasons.append(
-                    f"Popular tutor ({bookings}+ completed sessions)")
-            elif bookings > 5:
-                reasons.append(f"Has completed {bookings}+ tutoring sessions")
-        except (ValueError, TypeError):
-            pass
-
-        # Experience reason (fifth priority)
-        try:
-            years = int(tutor.get("experience_years", 0))
-            if years > 5:
-                reasons.append(f"{years}+ years of teaching experience")
-            elif years > 0:
-                reasons.append(
-                    f"{years} year{'' if years == 1 else 's'} of teaching experience")
-        except (ValueError, TypeError):
-            pass
+    # Responses computed against the old catalogue are no longer valid
+    response_cache.clear()
+    return jsonify({"updated": count, "count": len(tutor_index),
+                    "version": tutor_index.version})
 
-        # Add reasons to the tutor data
-        # Limit to top 3 reasons
-        tutor_dict["recommendationReasons"] = reasons[:3]
 
-        # Add debug info
-        logger.info(
-            f"Adding recommendation for {tutor.get('username', 'Unknown')} with score {tutor_dict['recommendationScore']}")
+def stream_tutor_index():
+    """Replace the catalogue from an NDJSON body, read and indexed in chunks
 
-        recommendations.append(tutor_dict)
+    The body is consumed as a stream, so a large catalogue never has to be
+    held as one JSON document. ``chunkSize`` in the query string sets how
+    many tutors are preprocessed at a time.
+    """
+    if request.method != 'PUT':
+        return jsonify({"error": "NDJSON catalogues replace the index; use PUT"}), 400
+    chunk_size = request.args.get("chunkSize", DEFAULT_CHUNK_SIZE, type=int)
 
-    return recommendations
+    start = time.perf_counter()
+    try:
+        # Buffered, so lines are not read from the socket a few bytes at a time
+        count = tutor_index.load_stream(
+            io.BufferedReader(request.stream, 1 << 16), max(chunk_size, 1),
+            log_progress)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    seconds = time.perf_counter() - start
+    logger.info("Tutor index streamed: %d tutors in %.1fs", count, seconds)
+    if materialized is not None:
+        materialized.index_rebuilt()
+
+    # Responses computed against the old catalogue are no longer valid
+    response_cache.clear()
+    return jsonify({"updated": count, "count": len(tutor_index),
+                    "version": tutor_index.version,
+                    "seconds": round(seconds, 3),
+                    "rowsPerSecond": round(count / seconds) if seconds else None})
+
+
+@app.route('/tutors/refit', methods=['POST'])
+def refit_tutor_index():
+    """Refit the TF-IDF vocabulary on the current catalogue (e.g. nightly)"""
+    count = tutor_index.refit()
+    if materialized is not None:
+        materialized.index_rebuilt()
+
+    # Similarity scores of cached responses came from the old fit
+    response_cache.clear()
+    return jsonify({"count": count, "version": tutor_index.version})
+
+
+@app.route('/tutors/<tutor_id>', methods=['DELETE'])
+def delete_tutor(tutor_id):
+    """Remove a single tutor from the index"""
+    previous = tutor_index.snapshot()
+    removed = tutor_index.delete([tutor_id])
+    if not removed:
+        return jsonify({"error": f"Tutor {tutor_id} not found"}), 404
+    if materialized is not None:
+        materialized.tutors_deleted([tutor_id], previous)
+
+    # Responses computed against the old catalogue are no longer valid
+    response_cache.clear()
+    return jsonify({"deleted": removed, "count": len(tutor_index),
+                    "version": tutor_index.version})
+
+
+@app.route('/students', methods=['POST', 'PUT'])
+def update_students():
+    """Register students for materialized recommendations or update profiles"""
+    if materialized is None:
+        return jsonify({"error": "Set RECOMMENDATION_MATERIALIZE_PATH to "
+                                 "materialize recommendations"}), 404
+    data = request.get_json(silent=True)
+    users = data.get("students") if isinstance(data, dict) else data
+    if (not isinstance(users, list) or
+            not all(isinstance(user, dict) and user.get("id") is not None
+                    for user in users)):
+        return jsonify({"error": "Expected a list of students with ids"}), 400
+
+    changed = materialized.put_profiles(users)
+    return jsonify(dict(materialized.stats(), changed=changed))
+
+
+@app.route('/students', methods=['GET'])
+def materialized_stats():
+    """Registered students and how many wait for a refresh"""
+    if materialized is None:
+        return jsonify({"error": "Materialized recommendations are off"}), 404
+    return jsonify(materialized.stats())
+
+
+@app.route('/students/<student_id>', methods=['DELETE'])
+def delete_student(student_id):
+    """Stop materializing a student's recommendations"""
+    if materialized is None or not materialized.remove(student_id):
+        return jsonify({"error": f"Student {student_id} not found"}), 404
+    return jsonify({"deleted": 1})
+
+
+@app.route('/students/<student_id>/recommendations', methods=['GET'])
+def student_recommendations(student_id):
+    """Stored recommendations of a registered student
+
+    The same list /recommend returns for the stored profile. While a change
+    that affects the student waits to be applied, the previous list is
+    returned with X-Refresh-Pending: 1.
+    """
+    page = materialized.get(student_id) if materialized is not None else None
+    if page is None:
+        return jsonify({"error": f"Student {student_id} not found"}), 404
+    record(materialized=True, pending=page["pending"])
+    response = app.response_class(page["body"], mimetype="application/json")
+    response.headers["X-Materialized-At"] = f"{page['computedAt']:.3f}"
+    response.headers["X-Refresh-Pending"] = "1" if page["pending"] else "0"
+    return with_timing_header(response)
 
 
 if __name__ == '__main__':
+    # Development server; use serve.py for multi-worker production serving
     logger.info("Starting recommendation service on port 5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001,
+            debug=os.environ.get("FLASK_DEBUG", "1") == "1")
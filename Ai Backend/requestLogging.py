@@ -0,0 +1,147 @@
+"""Structured, sampled logging for recommendation requests
+
+Each request collects its counts, stage timings and top-k ids in a
+RequestLog and emits them as one summary record when it finishes. Per-tutor
+detail is logged at DEBUG, or at INFO for a sampled fraction of requests:
+
+    RECOMMENDATION_LOG_FORMAT       text (default) or json
+    RECOMMENDATION_LOG_LEVEL        root log level, INFO by default
+    RECOMMENDATION_LOG_SAMPLE_RATE  share of requests (0-1) whose per-tutor
+                                    detail is logged at INFO, 0 by default
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+LOG_FORMAT = os.environ.get("RECOMMENDATION_LOG_FORMAT", "text")
+LOG_LEVEL = os.environ.get("RECOMMENDATION_LOG_LEVEL", "INFO").upper()
+DETAIL_SAMPLE_RATE = float(os.environ.get("RECOMMENDATION_LOG_SAMPLE_RATE", 0))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# RequestLog of the request being handled by the current thread or task
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RequestLog:
+    """Counts and timings of one request, logged as a single summary record"""
+
+    def __init__(self, route, sampled=None):
+        self.route = route
+        if sampled is None:
+            sampled = random.random() < DETAIL_SAMPLE_RATE
+        self.sampled = sampled
+        self.fields = {}
+        self.timings = {}
+        self._start = time.perf_counter()
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    @contextmanager
+    def timer(self, stage):
+        """Add the time spent in the block to ``stage``, in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(stage, (time.perf_counter() - start) * 1000)
+
+    def add_timing(self, stage, ms):
+        self.timings[stage] = self.timings.get(stage, 0.0) + ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def summary(self):
+        summary = {"route": self.route}
+        summary.update(self.fields)
+        summary["durationMs"] = round(self.elapsed_ms(), 2)
+        if self.timings:
+            summary["timingsMs"] = {
+                stage: round(ms, 2) for stage, ms in self.timings.items()}
+        return summary
+
+    def emit(self, logger, level=logging.INFO):
+        """Log the summary record of this request"""
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s completed", self.route,
+                       extra={"fields": self.summary()})
+
+
+@contextmanager
+def request_log(route, logger=None, sampled=None):
+    """Make a RequestLog current for the block and emit it at the end
+
+    Pass ``logger=None`` to collect without emitting, e.g. inside a worker
+    process whose caller logs the summary.
+    """
+    log = RequestLog(route, sampled)
+    token = _current_request.set(log)
+    try:
+        yield log
+    finally:
+        _current_request.reset(token)
+        if logger is not None:
+            log.emit(logger)
+
+
+def current_request():
+    """RequestLog of the request being handled, or None outside a request"""
+    return _current_request.get()
+
+
+def detail_level():
+    """Level for per-tutor log lines: INFO when the request is sampled"""
+    log = _current_request.get()
+    return logging.INFO if log is not None and log.sampled else logging.DEBUG
+
+
+def record(**fields):
+    """Add fields to the current request's summary, if there is one"""
+    log = _current_request.get()
+    if log is not None:
+        log.set(**fields)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual text format, with summary fields appended as key=value"""
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(
+                f"{key}={json.dumps(value, default=str, separators=(',', ':'))}"
+                for key, value in fields.items())
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, summary fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """Set up the root logger once, in text or JSON format"""
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(TEXT_FORMAT))
+    logging.basicConfig(level=level, handlers=[handler])
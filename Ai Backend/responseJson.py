@@ -0,0 +1,25 @@
+"""JSON encoding of recommendation responses
+
+Responses are encoded with orjson when it is installed, which writes the
+recommendation dicts several times faster than the standard library, and
+with ``json`` otherwise. Numpy values are converted in both cases. One
+difference: orjson writes NaN as null, where ``json`` writes a bare NaN.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from recommendationCache import json_default
+
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                  if orjson is not None else 0)
+
+
+def dumps(value):
+    """Compact JSON bytes for a response body"""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(value, default=json_default, separators=(",", ":")).encode()
@@ -0,0 +1,112 @@
+"""Production entry point for the recommendation service
+
+Runs the Flask app under gunicorn with several worker processes:
+
+    python serve.py --workers 4 --threads 2 --port 5001
+
+The app module (and the tutor index named by TUTOR_INDEX_PATH) is loaded
+once in the master process before the workers are forked, so the
+preprocessed catalogue is shared copy-on-write instead of being built in
+every worker. Each worker still owns its index afterwards: catalogue
+updates posted to /tutors only reach the worker that handled them, so in
+multi-worker mode load the catalogue from TUTOR_INDEX_PATH and restart (or
+send gunicorn a HUP) to pick up changes.
+
+With --fast-start (or RECOMMENDATION_FAST_START=1) nothing is preloaded:
+each worker starts with the lightweight app of fastStart, answers /health
+at once and /ready once it has loaded the service and index and run a
+warm-up request in the background. Workers then hold private copies of
+the index, trading memory for a server that is up in well under a second;
+set RECOMMENDATION_FEATURE_STORE to have them share its numeric features
+and matrices through memory-mapped files instead (see featureStore).
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+
+from requestLogging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers():
+    """One worker per core, which suits the CPU-bound scoring"""
+    return multiprocessing.cpu_count()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("PORT", 5001)))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY",
+                                                   default_workers())))
+    parser.add_argument("--threads", type=int,
+                        default=int(os.environ.get("WEB_THREADS", 1)))
+    parser.add_argument("--timeout", type=int,
+                        default=int(os.environ.get("WEB_TIMEOUT", 60)))
+    parser.add_argument("--fast-start", action="store_true",
+                        default=os.environ.get("RECOMMENDATION_FAST_START", "0") == "1",
+                        help="answer health checks while loading in the background")
+    return parser.parse_args(argv)
+
+
+def load_app():
+    """Import the Flask app and freeze its objects before workers fork"""
+    from recommendationService import app
+
+    # Move everything allocated so far out of the GC's reach, so collections
+    # in the workers do not touch (and copy) the shared pages
+    gc.freeze()
+    return app
+
+
+def post_fork(server, worker):
+    """Start the preloaded service's background threads in a new worker"""
+    from recommendationService import start_background_threads
+
+    start_background_threads()
+
+
+def load_fast_start_app():
+    """Health-check app of a worker, loading the service in the background"""
+    from fastStart import app
+
+    return app.start()
+
+
+def serve(args):
+    """Run the app under gunicorn with the given worker/thread counts"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is required for serve.py: pip install gunicorn")
+
+    class RecommendationApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("timeout", args.timeout)
+            self.cfg.set("preload_app", not args.fast_start)
+            if not args.fast_start:
+                self.cfg.set("post_fork", post_fork)
+
+        def load(self):
+            # Without preloading this runs in each worker after the fork, so
+            # the background loader thread lives in the worker
+            return load_fast_start_app() if args.fast_start else load_app()
+
+    logger.info(
+        "Starting recommendation service on %s:%s with %s workers x %s threads%s",
+        args.host, args.port, args.workers, args.threads,
+        " (fast start)" if args.fast_start else "")
+    RecommendationApplication().run()
+
+
+if __name__ == '__main__':
+    configure_logging()
+    serve(parse_args())
@@ -0,0 +1,254 @@
+"""Score one large payload request on several cores
+
+A /recommend request that carries its own tutors runs the whole pipeline
+(preprocess_tutor_data, encoding, feature term counts, TF-IDF and the
+component scores) on one core. With RECOMMENDATION_SHARDS=N (N > 1),
+payloads of at least RECOMMENDATION_SHARD_MIN_TUTORS tutors are split into
+N contiguous shards handled by one pool of processes forked for the
+request, which read the payload (and its field names, listed once) from
+memory shared at fork time instead of having it pickled to them:
+
+1. each shard builds and preprocesses a frame of its tutors, encodes them
+   and computes their feature segments, the per-tutor Python work
+2. the request process joins the shards' frames into the one responses
+   are taken from, merges the encodings and segments and adds every term
+   of the catalogue to one feature vocabulary, in the order a single pass
+   would, without counting
+3. each shard counts its tutors' terms against that vocabulary, read-only;
+   the pool's processes were forked before it existed, so the vocabulary
+   terms and the shard's segment rows are sent to them
+4. the request process fits TF-IDF on the stacked counts, scores every
+   tutor from the merged encoding and ranks them
+
+Rankings are taken once over the merged scores rather than merged from
+per-shard top-k lists, since cursors keep every tutor's score for the
+pages after the first. Term and token ids, counts and so scores, ties and
+responses are the same as with RECOMMENDATION_SHARDS=1;
+benchmarks/shardBenchmark.py checks this and reports the speedup per
+shard count. Forking needs the fork start method, so elsewhere (and for
+smaller payloads) requests are scored in the request process.
+
+The service forks from a process running other threads (request threads,
+the scoring pool, cache refreshes). Only the forking thread exists in the
+pool's processes, so shard work must not wait on anything another thread
+could have held at fork time: it only reads the request's state and runs
+pandas/numpy code. Logging is safe, as its locks are reset after a fork.
+"""
+import gc
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from pipelineMetrics import timed
+from responseJson import dumps
+from recommendationEngine import (
+    preprocess_tutor_data,
+    create_user_vector,
+    compute_recommendations,
+    recommendations_page,
+    feature_segments,
+    fitted_similarities,
+    segment_counts,
+    EncodedTutors,
+    FeatureVectorizer,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARDS = int(os.environ.get("RECOMMENDATION_SHARDS", 1))
+SHARD_MIN_TUTORS = int(os.environ.get("RECOMMENDATION_SHARD_MIN_TUTORS", 20000))
+
+FORK_AVAILABLE = "fork" in multiprocessing.get_all_start_methods()
+
+# Requests being sharded, by id; shard processes find theirs here, as it
+# was when they were forked
+_requests = {}
+_request_ids = itertools.count()
+
+
+def use_shards(tutors_data, shards=SHARDS):
+    """Whether a payload of this size is scored in shards"""
+    return (shards > 1 and FORK_AVAILABLE and
+            len(tutors_data) >= max(SHARD_MIN_TUTORS, shards))
+
+
+def recommend_sharded(user, tutors_data, k, shards=SHARDS):
+    """recommend_from_payload for a non-empty payload, in ``shards`` processes"""
+    request_id = next(_request_ids)
+    bounds = np.linspace(0, len(tutors_data), shards + 1).astype(int)
+    with timed("columns"):
+        columns = (None if isinstance(tutors_data, pd.DataFrame)
+                   else payload_columns(tutors_data))
+    _requests[request_id] = {
+        "user": user,
+        "tutors": tutors_data,
+        "columns": columns,
+        "bounds": bounds,
+    }
+    try:
+        # The pool forks its processes on the first submissions, with the
+        # request's state in place
+        with fork_pool(shards) as pool:
+            with timed("shard_features"):
+                parts = list(pool.map(shard_features, [request_id] * shards,
+                                      range(shards)))
+
+            with timed("merge"):
+                tutors = concatenate_frames(
+                    load_frames([frame for frame, _, _ in parts]), tutors_data)
+                encoded = EncodedTutors.concatenate(
+                    [encoded for _, encoded, _ in parts])
+                segments = merge_segments([segments for _, _, segments in parts])
+                vectorizer = FeatureVectorizer()
+                segment_counts(segments, vectorizer.vocabulary, len(encoded),
+                               count=False)
+
+            with timed("shard_counts"):
+                counts = sp.vstack(list(pool.map(
+                    shard_counts,
+                    [shard_segments(segments, start, end)
+                     for start, end in zip(bounds[:-1], bounds[1:])],
+                    [vectorizer.vocabulary] * shards)), format="csr")
+    finally:
+        del _requests[request_id]
+
+    user_vector = create_user_vector(user)
+    similarities = fitted_similarities(
+        user_vector, tutors, user, encoded, vectorizer, counts)
+
+    logger.debug("Computing similarity scores")
+    recommendations = compute_recommendations(
+        user_vector, tutors, user, similarities, encoded, k)
+    return recommendations, tutors, encoded.ids
+
+
+def fork_pool(shards):
+    return ProcessPoolExecutor(shards, mp_context=multiprocessing.get_context("fork"))
+
+
+def payload_columns(tutors_data):
+    """Every field of a payload, in order of first appearance
+
+    Shard frames take all of them, even those none of their tutors has, so
+    missing values are read as they are from the full frame.
+    """
+    return list(dict.fromkeys(field for tutor in tutors_data for field in tutor))
+
+
+def shard_rows(request_id, shard):
+    state = _requests[request_id]
+    return state, state["bounds"][shard], state["bounds"][shard + 1]
+
+
+def shard_features(request_id, shard):
+    """Pickled preprocessed frame, encoding and feature segments of one shard"""
+    state, start, end = shard_rows(request_id, shard)
+    tutors_data = state["tutors"]
+    if isinstance(tutors_data, pd.DataFrame):
+        tutors = tutors_data.iloc[start:end].copy()
+    else:
+        tutors = pd.DataFrame(tutors_data[start:end], columns=state["columns"])
+    tutors = preprocess_tutor_data(tutors)
+    encoded = EncodedTutors(tutors)
+    # Pickled here so the request process can load it faster (load_frames)
+    return (pickle.dumps(tutors, protocol=pickle.HIGHEST_PROTOCOL), encoded,
+            feature_segments(tutors, state["user"], encoded))
+
+
+def shard_counts(segments, vocabulary):
+    """Term counts of one shard's tutors with the catalogue's vocabulary"""
+    return segment_counts(segments, vocabulary, len(segments[0][0]))
+
+
+def shard_segments(segments, start, end):
+    """Rows start..end of merged segments, with only the texts they use"""
+    rows = []
+    for codes, texts, repeats in segments:
+        used, codes = np.unique(codes[start:end], return_inverse=True)
+        rows.append((codes.ravel(), [texts[code] for code in used],
+                     repeats[start:end]))
+    return rows
+
+
+def load_frames(pickled):
+    """Unpickle shard frames with the cyclic garbage collector paused
+
+    Their lists of subjects and grades are many small containers, whose
+    allocation would otherwise set off collections that more than double
+    the time taken.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [pickle.loads(frame) for frame in pickled]
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def concatenate_frames(frames, tutors_data):
+    """The preprocessed frame of the whole payload, from its shards' frames
+
+    A field whose type was inferred differently in two shards (one has
+    only missing values, say) is read again from the whole payload.
+    """
+    if isinstance(tutors_data, pd.DataFrame):
+        # Slices of one frame, with its types and index
+        return pd.concat(frames)
+    tutors = pd.concat(frames, ignore_index=True)
+    for column in tutors.columns:
+        if (tutors[column].dtype == object and
+                len({frame[column].dtype for frame in frames}) > 1):
+            tutors[column] = pd.DataFrame(tutors_data, columns=[column])[column]
+    return tutors
+
+
+def merge_segments(parts):
+    """Feature segments of all shards, as feature_segments gives them at once
+
+    Each segment's texts are listed in order of first appearance, so the
+    vocabulary meets them in the same order.
+    """
+    merged = []
+    for shard_segments in zip(*parts):
+        texts = {}
+        codes = []
+        for shard_codes, shard_texts, _ in shard_segments:
+            mapping = np.array([texts.setdefault(text, len(texts))
+                                for text in shard_texts], dtype=np.int64)
+            codes.append(mapping[shard_codes])
+        merged.append((np.concatenate(codes), list(texts),
+                       np.concatenate([repeats for _, _, repeats in shard_segments])))
+    return merged
+
+
+def differences(serial, sharded, user, k, pages):
+    """What differs between a serial and a sharded result, if anything
+
+    Compares the first page, every tutor's combined score and cosine
+    similarity, and the next pages up to page ``pages`` served from the
+    scored frames.
+    """
+    (serial_page, serial_frame, serial_ids) = serial
+    (sharded_page, sharded_frame, sharded_ids) = sharded
+    found = []
+    if dumps(serial_page) != dumps(sharded_page):
+        found.append("first page")
+    for column in ("combined_score", "cosine_similarity"):
+        if not np.array_equal(serial_frame[column].to_numpy(),
+                              sharded_frame[column].to_numpy(), equal_nan=True):
+            found.append(column)
+    for page in range(1, pages):
+        if dumps(recommendations_page(serial_frame, "combined_score", user, k,
+                                      page * k, serial_ids)) != \
+                dumps(recommendations_page(sharded_frame, "combined_score", user, k,
+                                           page * k, sharded_ids)):
+            found.append(f"page {page + 1}")
+    return found
@@ -0,0 +1,32 @@
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..")
+# Service modules, and the synthetic catalogues of the benchmarks
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(SERVICE_DIR, "benchmarks"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet():
+    """No service logging while scoring thousands of synthetic tutors"""
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture
+def wait_for():
+    """Poll ``condition`` until it holds; False if it does not in time"""
+    def wait(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+    return wait
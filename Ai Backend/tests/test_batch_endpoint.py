@@ -0,0 +1,30 @@
+import pytest
+
+from syntheticData import generate_tutors, generate_users
+
+
+@pytest.fixture(scope="module")
+def client():
+    from recommendationService import app
+    return app.test_client()
+
+
+def test_batch_scores_sent_tutors(client):
+    users = generate_users(3)
+    response = client.post("/recommend/batch",
+                           json={"users": users, "tutors": generate_tutors(50)})
+    assert response.status_code == 200
+    assert [result["userId"] for result in response.get_json()] == \
+        [user["id"] for user in users]
+
+
+@pytest.mark.parametrize("body", [
+    {"users": [{"id": "u1"}, "u2"]},
+    {"users": [None]},
+    {"users": [{"id": "u1"}], "tutors": {"id": "t1"}},
+    {"users": [{"id": "u1"}], "tutors": [{"username": "no id"}]},
+], ids=["string user", "null user", "tutors not a list", "tutor without id"])
+def test_batch_rejects_malformed_input(client, body):
+    response = client.post("/recommend/batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
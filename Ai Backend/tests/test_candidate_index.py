@@ -0,0 +1,64 @@
+import pytest
+
+import recommendationPipeline
+from syntheticData import generate_tutors, generate_users
+from recommendationEngine import recommendations_page
+from recommendationPipeline import recommend_from_index, CandidatePages
+from responseJson import dumps
+from tutorIndex import TutorIndex
+
+K = 10
+
+
+@pytest.fixture(scope="module")
+def tutor_index():
+    tutors = generate_tutors(1500)
+    # Tied scores across the candidate and fallback tutors
+    for tutor in tutors[::9]:
+        tutor["rating"] = "5.0"
+        tutor["bookingsCount"] = 60
+    index = TutorIndex()
+    index.load(tutors)
+    return index
+
+
+# Synthetic users, plus profiles whose candidates are a small part of the
+# catalogue (addresses outside the valley, a rarely taught subject) or none
+USERS = generate_users(8) + [
+    {"id": "pokhara", "address": "Lakeside, Pokhara",
+     "preferredSubjects": ["Accountancy"]},
+    {"id": "far", "address": "Far Away", "preferredSubjects": ["zzz"]},
+    {"id": "bhaktapur", "address": "Thimi, Bhaktapur"},
+    {"id": "repeated", "address": "Patan", "preferredSubjects": ["math", "math", "ics"]},
+]
+
+
+def ranked_pages(user, tutor_index, prefilter, monkeypatch):
+    """First and second page of an index request"""
+    monkeypatch.setattr(recommendationPipeline, "PREFILTER", prefilter)
+    monkeypatch.setattr(recommendationPipeline, "ANN_RETRIEVAL", False)
+    first, scored, ids = recommend_from_index(user, tutor_index, K)
+    if isinstance(scored, CandidatePages):
+        second = scored.page(K, K)
+    else:
+        second = recommendations_page(scored, "combined_score", user, K, K, ids)
+    return scored, first, second
+
+
+@pytest.mark.parametrize("user", USERS, ids=[user["id"] for user in USERS])
+def test_prefiltered_pages_match_exhaustive_scoring(user, tutor_index, monkeypatch):
+    _, *exhaustive = ranked_pages(user, tutor_index, False, monkeypatch)
+    pages, *prefiltered = ranked_pages(user, tutor_index, True, monkeypatch)
+    assert isinstance(pages, CandidatePages)
+    for expected, got in zip(exhaustive, prefiltered):
+        assert [r["id"] for r in got] == [r["id"] for r in expected]
+        assert [r["recommendationScore"] for r in got] == \
+            [r["recommendationScore"] for r in expected]
+        assert dumps(got) == dumps(expected)
+
+
+def test_prefilter_prunes_catalogue(tutor_index, monkeypatch):
+    for user_id in ("pokhara", "bhaktapur"):
+        user = next(user for user in USERS if user["id"] == user_id)
+        pages, _, _ = ranked_pages(user, tutor_index, True, monkeypatch)
+        assert 0 < pages.scored_count < len(tutor_index) // 4
@@ -0,0 +1,43 @@
+import os
+import signal
+
+import pytest
+
+from syntheticData import generate_tutors, generate_users
+from fallbackRanking import FallbackTier
+from tutorIndex import TutorIndex
+
+
+@pytest.fixture
+def tier():
+    index = TutorIndex()
+    index.load(generate_tutors(300))
+    return FallbackTier(index)
+
+
+def test_rebuild_wait_builds_before_returning(tier):
+    tier.rebuild(wait=True)
+    assert tier.ranking is not None
+    assert tier.ranking.version == tier.tutor_index.version
+    assert len(tier.current().page(generate_users(1)[0], 10)) == 10
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_rebuilds_after_interrupted_build(tier, wait_for):
+    # Fork while the parent's build thread is running, as a gunicorn master
+    # can when it forks its workers
+    with tier._lock:
+        tier._building = True
+        pid = os.fork()
+    if pid == 0:
+        status = 1
+        signal.alarm(15)
+        try:
+            assert tier.current() is None
+            built = wait_for(lambda: tier.ranking is not None)
+            status = 0 if built else 2
+        finally:
+            os._exit(status)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
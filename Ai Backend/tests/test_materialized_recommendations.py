@@ -0,0 +1,71 @@
+import os
+import signal
+import threading
+
+import pytest
+
+from syntheticData import generate_tutors, generate_users, ADDRESSES
+from materializedRecommendations import MaterializedRecommendations
+from tutorIndex import TutorIndex
+
+
+@pytest.fixture
+def store(tmp_path):
+    index = TutorIndex()
+    index.load(generate_tutors(300))
+    store = MaterializedRecommendations(str(tmp_path / "materialized.sqlite"), index)
+    return store
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_refreshes_profile_edits(store, wait_for):
+    users = generate_users(5)
+    store.put_profiles(users)
+    store.start()
+    assert wait_for(lambda: store.stats()["pending"] == 0)
+
+    # Fork while the parent's refresh thread holds the store lock, as a
+    # gunicorn master can when its workers are forked
+    with store._lock:
+        pid = os.fork()
+    if pid == 0:
+        status = 1
+        # A refresh that never happens must not hang the test run
+        signal.alarm(15)
+        try:
+            edited = dict(users[0], address=ADDRESSES[-1]
+                          if users[0]["address"] != ADDRESSES[-1] else ADDRESSES[0])
+            store.put_profiles([edited])
+            refreshed = wait_for(lambda: store.stats()["pending"] == 0)
+            thread_names = {thread.name for thread in threading.enumerate()}
+            status = 0 if refreshed and "materialize" in thread_names else 2
+        finally:
+            os._exit(status)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store.stats()["pending"] == 0
+
+
+
+def upsert_marks(tmp_path, store_path, wait_for):
+    """Students marked by upserting one tutor, and how many are registered"""
+    tmp_path.mkdir()
+    tutors = generate_tutors(300)
+    index = TutorIndex(store_path=store_path)
+    index.load(tutors)
+    store = MaterializedRecommendations(str(tmp_path / "marks.sqlite"), index)
+    users = generate_users(40)
+    store.put_profiles(users)
+    assert wait_for(lambda: store.stats()["pending"] == 0)
+
+    previous = index.snapshot()
+    index.upsert([dict(tutors[0], rating="5.0", bookingsCount=60)])
+    return store.tutors_upserted([tutors[0]["id"]], previous), len(users)
+
+
+def test_feature_store_upsert_marks_only_affected_students(tmp_path, wait_for):
+    marked, students = upsert_marks(tmp_path / "stored", str(tmp_path / "store"), wait_for)
+    assert 0 < marked < students
+    # The same students as without the store, where the fit is one object
+    assert marked == upsert_marks(tmp_path / "plain", None, wait_for)[0]
@@ -0,0 +1,47 @@
+import pytest
+
+from syntheticData import generate_tutors, generate_users
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("msgpack")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import recommendationCache
+    import recommendationEngine
+    from recommendationService import app
+
+    # RECOMMENDATION_RESPONSE_FIELDS=all, so subjectDetails come back as sent
+    monkeypatch.setattr(recommendationEngine, "RESPONSE_FIELDS", None)
+    monkeypatch.setattr(recommendationCache, "RESPONSE_FIELDS", None)
+    return app.test_client()
+
+
+def test_binary_formats_match_json(client):
+    from requestFormats import (ARROW_STREAM, encode_arrow_request,
+                                encode_msgpack_request)
+
+    tutors = generate_tutors(200, 5)
+    for tutor in tutors[::3]:
+        # Partial details: the Arrow struct still has a gradeLevel field
+        for detail in tutor["subjectDetails"][1:]:
+            detail.pop("gradeLevel")
+    tutors[7]["subjectDetails"] = []
+    user = generate_users(1, 5)[0]
+
+    expected = client.post("/recommend",
+                           json={"user": user, "tutors": tutors, "k": 30})
+    assert expected.status_code == 200
+    partial = [tutor for tutor in expected.get_json()
+               if any("gradeLevel" not in detail
+                      for detail in tutor.get("subjectDetails", []))]
+    assert partial
+
+    for body, content_type in (
+            (encode_arrow_request(user, tutors, k=30), ARROW_STREAM),
+            (encode_msgpack_request(user, tutors, k=30), "application/msgpack")):
+        response = client.post("/recommend", data=body,
+                               content_type=content_type)
+        assert response.status_code == 200
+        assert response.get_json() == expected.get_json(), content_type
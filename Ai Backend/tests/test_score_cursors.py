@@ -0,0 +1,76 @@
+import pytest
+
+from syntheticData import generate_tutors, generate_users
+from recommendationCache import ScoreCursors, TTLCache
+from recommendationEngine import recommendations_page
+from recommendationPipeline import recommend_from_payload, scored_column
+from responseJson import dumps
+
+
+@pytest.fixture(scope="module")
+def scored_requests():
+    tutors = generate_tutors(600)
+    # Tied and missing ratings, so ties are broken by id across pages
+    for tutor in tutors[::5]:
+        tutor["rating"] = None
+    return [(user,) + recommend_from_payload(user, [dict(t) for t in tutors], 10)[1:]
+            for user in generate_users(4)]
+
+
+def test_cursor_pages_match_the_scored_frame(scored_requests):
+    cursors = ScoreCursors()
+    for user, scored, ids in scored_requests:
+        score_column = scored_column(scored)
+        token = cursors.save(scored, score_column, user, ids)
+        for offset in (10, 20, 250, 590):
+            _, kept, column, kept_user, kept_ids, start = cursors.load(f"{token}.{offset}")
+            assert start == offset
+            assert dumps(recommendations_page(kept, column, kept_user, 10, offset, kept_ids)) == \
+                dumps(recommendations_page(scored, score_column, user, 10, offset, ids))
+
+
+def test_cursor_keeps_only_page_columns(scored_requests):
+    cursors = ScoreCursors()
+    user, scored, ids = scored_requests[0]
+    token = cursors.save(scored, "combined_score", user, ids)
+    _, kept, _, kept_user, _, _ = cursors.load(f"{token}.10")
+    assert len(kept) == len(scored)
+    assert "subjects_str" not in kept.columns
+    assert kept_user == {"preferredSubjects": user.get("preferredSubjects")}
+    assert 0 < cursors.nbytes < scored.memory_usage(deep=True).sum()
+
+
+def test_cursors_are_bounded_by_bytes(scored_requests):
+    _, scored, ids = scored_requests[0]
+    cursors = ScoreCursors(maxbytes=1)
+    assert cursors.save(scored, "combined_score", {}, ids) is None
+    assert len(cursors) == 0
+
+    sized = ScoreCursors()
+    sized.save(scored, "combined_score", {}, ids)
+    entry = sized.nbytes
+    cursors = ScoreCursors(maxbytes=entry * 2)
+    first = cursors.save(scored, "combined_score", {}, ids)
+    cursors.save(scored, "combined_score", {}, ids)
+    cursors.save(scored, "combined_score", {}, ids)
+    assert len(cursors) == 2
+    assert cursors.nbytes == entry * 2
+    assert cursors.load(f"{first}.10") is None
+
+
+def test_ttl_cache_evicts_least_recently_used_bytes():
+    cache = TTLCache(maxsize=10, maxbytes=100)
+    cache.set("a", 1, 40)
+    cache.set("b", 2, 40)
+    cache.get("a")
+    cache.set("c", 3, 40)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.nbytes == 80 and cache.evictions == 1
+
+    cache.set("a", 4, 10)
+    assert cache.nbytes == 50
+    assert cache.pop("c") == 3 and cache.nbytes == 10
+    assert cache.set("d", 5, 101) is False
+    cache.clear()
+    assert cache.nbytes == 0
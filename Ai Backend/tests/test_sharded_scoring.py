@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from syntheticData import generate_tutors, generate_users
+from recommendationPipeline import recommend_from_payload
+from shardedScoring import recommend_sharded, differences, FORK_AVAILABLE
+
+
+def irregular_payload(count=900):
+    """Tutors with fields missing from whole shards and mixed value types"""
+    tutors = []
+    for i, tutor in enumerate(generate_tutors(count)):
+        if i < count // 3:
+            tutor.pop("rating", None)
+        if i % 7 == 0:
+            tutor["subjects"] = "Maths"
+        if i % 11 == 0:
+            tutor.pop("subjectDetails", None)
+        if i % 13 == 0:
+            tutor["address"] = None
+        if i == count - 10:
+            tutor["bookingsCount"] = 3.5
+        if i > count // 2 and i % 5 == 0:
+            tutor["extraField"] = i
+        tutors.append(tutor)
+    return tutors
+
+
+@pytest.mark.skipif(not FORK_AVAILABLE, reason="needs the fork start method")
+@pytest.mark.parametrize("shards", [2, 3])
+@pytest.mark.parametrize("as_frame", [False, True], ids=["list", "frame"])
+def test_sharded_scores_match_serial(shards, as_frame):
+    tutors = irregular_payload()
+    users = generate_users(2) + [{"id": "bare"}]
+
+    def payload():
+        return pd.DataFrame(tutors) if as_frame else [dict(t) for t in tutors]
+
+    for user in users:
+        serial = recommend_from_payload(user, payload(), 10)
+        sharded = recommend_sharded(user, payload(), 10, shards)
+        assert differences(serial, sharded, user, 10, 4) == []
+        assert list(sharded[1].columns) == list(serial[1].columns)
+        assert (sharded[1].dtypes == serial[1].dtypes).all()
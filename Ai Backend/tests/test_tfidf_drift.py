@@ -0,0 +1,120 @@
+"""Drift of the index TF-IDF similarities (see benchmarks/tfidfDrift.py)
+
+Only the reported cosine_similarity may drift; combined scores and
+rankings must be identical.
+"""
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+import recommendationPipeline
+from syntheticData import generate_tutors, generate_users
+from recommendationEngine import create_user_vector, normalized_similarity
+from recommendationPipeline import recommend_from_index, recommend_from_payload
+from tutorIndex import TutorIndex
+
+SIZE = 3000
+K = 50
+# Largest cosine_similarity drift of the sparse product and, over the
+# whole catalogue, of incremental updates to 5% of the tutors below the
+# refit threshold (measured: 3e-16 and 5.1e-2)
+PRODUCT_DRIFT = 1e-12
+INCREMENTAL_DRIFT = 0.1
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    tutors_data = generate_tutors(SIZE)
+    index = TutorIndex()
+    index.load(tutors_data)
+    return tutors_data, index, generate_users(20)
+
+
+@pytest.fixture(autouse=True)
+def exhaustive(monkeypatch):
+    # Whole scored frames, so every tutor's combined score is compared
+    monkeypatch.setattr(recommendationPipeline, "PREFILTER", False)
+    monkeypatch.setattr(recommendationPipeline, "ANN_RETRIEVAL", False)
+
+
+def scores(result):
+    """Each tutor's combined score and cosine similarity, by id"""
+    _, scored, _ = result
+    frame = scored.set_index(scored["id"].astype(str))
+    return frame["combined_score"], frame["cosine_similarity"]
+
+
+def ranked(result):
+    return [(rec["id"], rec["recommendationScore"]) for rec in result[0]]
+
+
+def assert_same_ranking(expected, actual, max_drift):
+    expected_scores, expected_similarity = scores(expected)
+    actual_scores, actual_similarity = scores(actual)
+    assert ranked(actual) == ranked(expected)
+    actual_scores = actual_scores.reindex(expected_scores.index)
+    assert np.array_equal(actual_scores.to_numpy(), expected_scores.to_numpy(),
+                          equal_nan=True)
+    drift = np.abs(actual_similarity.reindex(expected_similarity.index).to_numpy() -
+                   expected_similarity.to_numpy())
+    assert drift.max() <= max_drift
+
+
+def test_sparse_product_matches_cosine_similarity(catalogue):
+    _, index, users = catalogue
+    snapshot = index.snapshot()
+    user_tfidf = snapshot.vectorizer.transform(
+        [create_user_vector(user) for user in users])
+    drift = np.abs(normalized_similarity(user_tfidf, snapshot.tfidf_matrix) -
+                   cosine_similarity(user_tfidf, snapshot.tfidf_matrix))
+    assert drift.max() <= PRODUCT_DRIFT
+
+
+def test_index_ranks_as_per_request_fit(catalogue):
+    # Similarities differ by design here; only the rankings must agree
+    tutors_data, index, users = catalogue
+    for user in users:
+        expected = recommend_from_payload(user, tutors_data, K)
+        actual = recommend_from_index(user, index, K)
+        assert ranked(actual) == ranked(expected)
+        assert np.array_equal(scores(actual)[0].to_numpy(),
+                              scores(expected)[0].to_numpy(), equal_nan=True)
+
+
+def test_incremental_updates_drift_within_tolerance(catalogue):
+    tutors_data, _, users = catalogue
+    changed = SIZE // 20
+    base = tutors_data[:SIZE - changed]
+    added = generate_tutors(changed, seed=2)
+    for i, tutor in enumerate(added):
+        tutor["id"] = f"added-{i:06d}"
+
+    incremental = TutorIndex()
+    incremental.load(base)
+    incremental.upsert([dict(tutor, rating="5.0") for tutor in base[:changed // 2]] +
+                       added)
+    incremental.delete([tutor["id"] for tutor in base[-(changed // 2):]])
+    refitted = TutorIndex()
+    refitted.load(incremental.snapshot().tutors.to_dict(orient="records"))
+    refitted.refit()
+
+    for user in users:
+        assert_same_ranking(recommend_from_index(user, refitted, K),
+                            recommend_from_index(user, incremental, K),
+                            INCREMENTAL_DRIFT)
+
+
+def test_saved_artifact_restores_fit(catalogue, tmp_path):
+    _, index, users = catalogue
+    path = str(tmp_path / "tfidf.npz")
+    catalogue_path = tmp_path / "tutors.json"
+    catalogue_path.write_text(index.snapshot().tutors.to_json(orient="records"))
+    saved = TutorIndex(path)
+    saved.load_file(str(catalogue_path))
+    restored = TutorIndex(path)
+    restored.load_file(str(catalogue_path))
+
+    assert (saved.snapshot().tfidf_matrix != restored.snapshot().tfidf_matrix).nnz == 0
+    for user in users:
+        assert_same_ranking(recommend_from_index(user, saved, K),
+                            recommend_from_index(user, restored, K), 0.0)
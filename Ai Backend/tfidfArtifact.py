@@ -0,0 +1,90 @@
+"""TF-IDF state of the tutor index persisted as a versioned artifact
+
+The artifact holds what is needed to score users against the catalogue
+without refitting: the unigram/bigram vocabulary, the IDF weights, the
+L2-normalized tutor matrix and the tutor ids its rows belong to. It is one
+``.npz`` file written atomically, with JSON metadata:
+
+``format``
+    ARTIFACT_FORMAT; bumped whenever feature extraction changes, so older
+    artifacts are refitted instead of reused.
+``source``
+    sha256 of the catalogue file the tutors were loaded from, or null.
+``indexVersion``, ``tutors``, ``terms``, ``created``
+    Index version, row and vocabulary sizes and time of the fit.
+``fit``
+    The fit's id (FeatureVectorizer.fit_id), restored with it.
+
+An artifact is reused only when the format, the source file hash and the
+tutor ids all match, so a stale artifact is never served.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy.sparse as sp
+
+ARTIFACT_FORMAT = 1
+
+
+def file_fingerprint(path):
+    """sha256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return "sha256:" + digest.hexdigest()
+
+
+def save_artifact(path, vectorizer, tfidf_matrix, ids, version, source=None):
+    """Write the fitted vectorizer and tutor matrix, replacing any older file"""
+    tfidf_matrix = tfidf_matrix.tocsr()
+    idf = vectorizer.transformer.idf_
+    metadata = {
+        "format": ARTIFACT_FORMAT,
+        "source": source,
+        "indexVersion": version,
+        "tutors": tfidf_matrix.shape[0],
+        "terms": len(idf),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "fit": vectorizer.fit_id,
+    }
+
+    # Written next to the target and renamed, so readers never see half a file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(
+            f,
+            metadata=np.array(json.dumps(metadata)),
+            terms=np.array(vectorizer.vocabulary.term_list[:len(idf)], dtype=str),
+            idf=idf,
+            data=tfidf_matrix.data,
+            indices=tfidf_matrix.indices,
+            indptr=tfidf_matrix.indptr,
+            shape=np.array(tfidf_matrix.shape),
+            ids=np.asarray(ids, dtype=str))
+    os.replace(temporary, path)
+    return metadata
+
+
+def load_artifact(path, ids, source=None):
+    """Return (metadata, terms, idf, tfidf_matrix) if the artifact fits
+
+    Returns None when there is no artifact at ``path`` or it was built from a
+    different source, format or set of tutors.
+    """
+    try:
+        with np.load(path) as artifact:
+            metadata = json.loads(str(artifact["metadata"]))
+            if (metadata.get("format") != ARTIFACT_FORMAT or
+                    source is None or metadata.get("source") != source or
+                    not np.array_equal(artifact["ids"], np.asarray(ids, dtype=str))):
+                return None
+            tfidf_matrix = sp.csr_matrix(
+                (artifact["data"], artifact["indices"], artifact["indptr"]),
+                shape=tuple(artifact["shape"]))
+            return metadata, artifact["terms"].tolist(), artifact["idf"], tfidf_matrix
+    except (OSError, KeyError, ValueError):
+        return None
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import scipy.sparse as sp
+
+from pipelineMetrics import timed
+from candidateIndex import CandidateIndex
+from approximateIndex import ApproximateIndex, ANN_RETRIEVAL
+from tfidfArtifact import file_fingerprint, save_artifact, load_artifact
+from featureStore import (
+    store_lock,
+    save_store,
+    open_store,
+    read_version,
+    restore_features,
+)
+from recommendationEngine import (
+    preprocess_tutor_data,
+    normalized_similarity,
+    EncodedTutors,
+    FeatureVectorizer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Tutors parsed and preprocessed at a time when streaming a catalogue
+DEFAULT_CHUNK_SIZE = 5000
+
+# Upserts and deletes reuse the fitted vocabulary and IDF weights until this
+# share of the catalogue has changed since the last fit, then refit
+REFIT_FRACTION = float(os.environ.get("RECOMMENDATION_TFIDF_REFIT_FRACTION", 0.1))
+
+
+class IndexSnapshot:
+    """Immutable view of the tutor index used to serve a single request"""
+
+    def __init__(self, tutors, vectorizer, tfidf_matrix, version, encoded=None,
+                 candidates=None, approximate=None):
+        self.tutors = tutors
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.version = version
+        self.encoded = encoded
+        self.candidates = candidates
+        self.approximate = approximate
+
+    def similarity(self, user_vector, rows=None):
+        """Cosine similarity of a user vector against the indexed tutors
+
+        Against every tutor, or only those at ``rows`` when given.
+        """
+        if self.vectorizer is None:
+            return []
+        user_tfidf = self.vectorizer.transform([user_vector])
+        tfidf_matrix = self.tfidf_matrix if rows is None else self.tfidf_matrix[rows]
+        with timed("similarity"):
+            return normalized_similarity(user_tfidf, tfidf_matrix)[0]
+
+
+class TutorIndex:
+    """Preprocessed tutor catalogue with a TF-IDF vocabulary fitted on change
+
+    Tutors are keyed by their ``id``. Only the preprocessed DataFrame is kept:
+    new or replaced tutors are preprocessed on their own and merged into it,
+    so the catalogue is parsed and vectorized when it changes rather than on
+    every /recommend call. Loading a catalogue fits the vocabulary; upserts
+    and deletes only transform the changed tutors with it until
+    REFIT_FRACTION of the catalogue has changed. Terms first seen in
+    between, and document frequencies of the changed tutors, only count
+    from the next fit; this shifts the ``cosine_similarity`` column
+    slightly but not the combined score, which does not use it.
+
+    With ``artifact_path`` every fit is saved there (see tfidfArtifact), and
+    loading the same catalogue file again reuses it instead of refitting.
+    With ``store_path`` every rebuild is written to a feature store there
+    and served from memory maps of it (see featureStore), and loading the
+    same catalogue file again opens the stored features instead. With
+    RECOMMENDATION_ANN=1 each snapshot also carries reduced vectors for
+    approximate retrieval (see approximateIndex).
+    """
+
+    def __init__(self, artifact_path=None, store_path=None):
+        self._lock = threading.Lock()
+        self._snapshot = IndexSnapshot(pd.DataFrame(), None, None, 0)
+        self.artifact_path = artifact_path
+        self.store_path = store_path
+        # Feature store version the current snapshot is mapped from
+        self.store_version = None
+        # Tutors upserted or deleted since the vocabulary was last fitted
+        self._changed = 0
+
+    def __len__(self):
+        return len(self._snapshot.tutors)
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def snapshot(self):
+        """Return the current index state; safe to use while the index changes"""
+        return self._snapshot
+
+    def load(self, tutors_data, source=None):
+        """Replace the whole catalogue with the given tutors"""
+        tutors = prepare_tutors(tutors_data)
+        with self._lock:
+            self._rebuild(tutors, source=source)
+        return len(tutors)
+
+    def load_stream(self, lines, chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                    source=None):
+        """Replace the catalogue with newline-delimited JSON tutor records
+
+        Records are parsed and preprocessed ``chunk_size`` at a time, so only
+        one chunk of raw tutor dictionaries is alive at once. ``progress`` is
+        called with the rows read so far and the seconds elapsed after each
+        chunk. Returns the number of tutors loaded. ``source`` identifies
+        the catalogue for reusing a saved TF-IDF artifact.
+        """
+        start = time.perf_counter()
+        frames = []
+        rows = 0
+        for chunk in ndjson_chunks(lines, chunk_size):
+            frames.append(prepare_tutors(chunk))
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows, time.perf_counter() - start)
+
+        tutors = combine_tutors(frames, release=True)
+        with self._lock:
+            self._rebuild(tutors, source=source)
+        return len(tutors)
+
+    def load_file(self, path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Replace the catalogue with the tutors stored in a JSON or NDJSON file"""
+        source = (file_fingerprint(path)
+                  if self.artifact_path or self.store_path else None)
+        if path.endswith((".ndjson", ".jsonl")):
+            with open(path, "rb") as f:
+                count = self.load_stream(f, chunk_size, log_progress, source)
+        else:
+            with open(path) as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = data.get("tutors", [])
+            count = self.load(data, source)
+        logger.info("Loaded %d tutors from %s", count, path)
+        return count
+
+    def upsert(self, tutors_data):
+        """Insert new tutors or replace existing ones with the same id"""
+        new_tutors = prepare_tutors(tutors_data)
+        with self._lock:
+            current = self._snapshot
+            tutors = combine_tutors([current.tutors, new_tutors])
+            if new_tutors.empty or not self._incremental(len(new_tutors)):
+                self._rebuild(tutors)
+            else:
+                # Rows of the combined frame: kept old tutors, then new ones
+                rows = sp.vstack([
+                    current.tfidf_matrix,
+                    current.vectorizer.transform_tutors(new_tutors),
+                ]).tocsr()
+                kept = ~pd.concat([id_keys(current.tutors), id_keys(new_tutors)]
+                                  ).duplicated(keep="last").to_numpy()
+                self._rebuild(tutors, current.vectorizer, rows[kept])
+        return len(new_tutors)
+
+    def delete(self, tutor_ids):
+        """Remove tutors by id and return how many were actually removed"""
+        with self._lock:
+            tutors = self._snapshot.tutors
+            if tutors.empty:
+                return 0
+            removed = id_keys(tutors).isin(
+                {str(tutor_id) for tutor_id in tutor_ids}).to_numpy()
+            if removed.any():
+                remaining = tutors[~removed].reset_index(drop=True)
+                if self._incremental(int(removed.sum())):
+                    current = self._snapshot
+                    self._rebuild(remaining, current.vectorizer,
+                                  current.tfidf_matrix[~removed])
+                else:
+                    self._rebuild(remaining)
+        return int(removed.sum())
+
+    def refit(self):
+        """Fit the vocabulary and IDF weights on the current catalogue again"""
+        with self._lock:
+            self._rebuild(self._snapshot.tutors)
+        return len(self._snapshot.tutors)
+
+    def _incremental(self, changed):
+        """Whether a change of ``changed`` tutors can reuse the fitted TF-IDF"""
+        if self._snapshot.vectorizer is None:
+            return False
+        self._changed += changed
+        return self._changed <= REFIT_FRACTION * len(self._snapshot.tutors)
+
+    def _rebuild(self, tutors, vectorizer=None, tfidf_matrix=None, source=None):
+        """Swap in preprocessed tutors (caller holds the lock)
+
+        Fits the vocabulary on them unless an already fitted ``vectorizer``
+        and its ``tfidf_matrix`` rows for these tutors are given.
+        """
+        version = self._snapshot.version + 1
+
+        if tutors.empty:
+            self._snapshot = IndexSnapshot(tutors, None, None, version)
+            self._changed = 0
+            return
+
+        build = self._build_stored if self.store_path else self._build
+        encoded, vectorizer, tfidf_matrix, candidates = build(
+            tutors, vectorizer, tfidf_matrix, version, source)
+        approximate = None
+        if ANN_RETRIEVAL and len(tutors) > 1:
+            approximate = ApproximateIndex(encoded, self._snapshot.approximate)
+
+        # Swap in the new state in one assignment so readers never see a mix
+        self._snapshot = IndexSnapshot(
+            tutors, vectorizer, tfidf_matrix, version, encoded, candidates,
+            approximate)
+        logger.info("Tutor index rebuilt: %d tutors, version %s",
+                    len(tutors), version)
+
+    def _build(self, tutors, vectorizer, tfidf_matrix, version, source=None):
+        """Encoded tutors, TF-IDF rows and candidate index for the tutors"""
+        # Token matrices and numeric arrays for matrix-based scoring
+        encoded = EncodedTutors(tutors)
+
+        if vectorizer is None:
+            vectorizer, tfidf_matrix = self._fit(tutors, encoded, version, source)
+
+        # Postings that narrow each request to its candidate tutors
+        candidates = CandidateIndex(encoded)
+        return encoded, vectorizer, tfidf_matrix, candidates
+
+    def _build_stored(self, tutors, vectorizer, tfidf_matrix, version,
+                      source=None):
+        """Same as _build, but memory-mapped from the feature store
+
+        Loading a catalogue file the store holds opens the stored version;
+        anything else is built and written as a new version first. The
+        store lock makes workers loading together build only once.
+        """
+        with store_lock(self.store_path):
+            stored = None
+            if vectorizer is None:
+                stored = open_store(self.store_path, id_keys(tutors), source)
+            if stored is None:
+                built = self._build(tutors, vectorizer, tfidf_matrix, version, source)
+                stored = read_version(self.store_path, save_store(
+                    self.store_path, *built, version, source))
+            else:
+                self._changed = 0
+                logger.info("Reusing feature store version %s", stored[2]['version'])
+        self.store_version = stored[2]["version"]
+        return restore_features(*stored)
+
+    def _fit(self, tutors, encoded, version, source=None):
+        """Fitted vectorizer and tutor TF-IDF rows, from the artifact if it fits"""
+        self._changed = 0
+        if self.artifact_path and source:
+            saved = load_artifact(self.artifact_path, id_keys(tutors), source)
+            if saved is not None:
+                metadata, terms, idf, tfidf_matrix = saved
+                logger.info("Reusing TF-IDF artifact from %s", metadata['created'])
+                return (FeatureVectorizer.restore(terms, idf, metadata.get("fit")),
+                        tfidf_matrix)
+
+        # Features without any user-specific emphasis, so they can be shared
+        vectorizer = FeatureVectorizer()
+        tfidf_matrix = vectorizer.fit_transform(tutors, {}, encoded)
+        if self.artifact_path:
+            save_artifact(self.artifact_path, vectorizer, tfidf_matrix,
+                          id_keys(tutors), version, source)
+        return vectorizer, tfidf_matrix
+
+
+def records_by_id(tutors_data):
+    """Key raw tutor dictionaries by their id, rejecting tutors without one"""
+    records = {}
+    for tutor in tutors_data:
+        if not isinstance(tutor, dict) or tutor.get("id") in (None, ""):
+            raise ValueError("Every tutor needs an 'id'")
+        records[str(tutor["id"])] = tutor
+    return records
+
+
+def prepare_tutors(tutors_data):
+    """Validate raw tutors and preprocess them into an index frame"""
+    records = records_by_id(tutors_data)
+    if not records:
+        return pd.DataFrame()
+    return preprocess_tutor_data(pd.DataFrame(list(records.values())))
+
+
+def combine_tutors(frames, release=False):
+    """Concatenate preprocessed frames; later rows replace earlier ones by id
+
+    The result is built a column at a time. With ``release`` each column is
+    dropped from the frames once copied, so a streamed load peaks at about
+    one catalogue plus a column rather than the chunks and their copy.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    keep = ~pd.concat([id_keys(frame) for frame in frames],
+                      ignore_index=True).duplicated(keep="last").to_numpy()
+
+    columns = list(dict.fromkeys(
+        column for frame in frames for column in frame.columns))
+    tutors = {}
+    for column in columns:
+        # Concatenated as frames, so a chunk without the column is filled
+        # with the same dtype as concatenating the whole frames would give
+        values = pd.concat([frame[[column]] if column in frame.columns
+                            else pd.DataFrame(index=frame.index)
+                            for frame in frames], ignore_index=True)[column]
+        if not keep.all():
+            values = values[keep]
+        tutors[column] = values.reset_index(drop=True)
+        if release:
+            for frame in frames:
+                if column in frame.columns:
+                    del frame[column]
+    tutors = pd.DataFrame(tutors, copy=False)
+
+    # A chunk without any bookingsCount leaves gaps that preprocessing
+    # would have filled with 0 had it seen the whole catalogue
+    if "bookingsCount" in tutors.columns:
+        tutors["bookingsCount"] = tutors["bookingsCount"].fillna(0)
+    return tutors
+
+
+def id_keys(tutors):
+    """Tutor ids as strings, the form the index is keyed by"""
+    return tutors["id"].astype(str)
+
+
+def ndjson_chunks(lines, chunk_size):
+    """Yield lists of up to ``chunk_size`` records from NDJSON lines"""
+    chunk = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}")
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def log_progress(rows, seconds):
+    logger.info("Read %d tutors (%.0f rows/s)", rows, rows / seconds if seconds else 0)